@@ -0,0 +1,50 @@
+"""clean_pdf_text 결과가 골든 코퍼스와 글자 단위로 같은지 확인
+
+benchmarks/golden/clean_pdf_text.jsonl 의 expected 값은 정규식을 매번 따로
+적용하던 예전 구현으로 만든 것이다. 정리 규칙을 최적화한 뒤에도 결과가
+바뀌지 않았는지 확인할 때 실행한다.
+
+    python benchmarks/check_clean_text.py
+"""
+
+import json
+import os
+import sys
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+GOLDEN_PATH = os.path.join(BENCH_DIR, "golden", "clean_pdf_text.jsonl")
+sys.path.insert(0, os.path.join(ROOT_DIR, "converter"))
+
+from pdf_ingest import clean_pdf_text  # noqa: E402
+
+
+def load_golden(path: str = GOLDEN_PATH) -> List[Dict[str, str]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_golden(path: str = GOLDEN_PATH) -> List[str]:
+    """결과가 다른 사례 이름 목록 (모두 같으면 빈 목록)"""
+    return [
+        case["name"]
+        for case in load_golden(path)
+        if clean_pdf_text(case["input"]) != case["expected"]
+    ]
+
+
+def main() -> int:
+    cases = load_golden()
+    mismatches = check_golden()
+    for name in mismatches:
+        case = next(case for case in cases if case["name"] == name)
+        print(f"불일치: {name}")
+        print(f"  기대: {case['expected']!r}")
+        print(f"  결과: {clean_pdf_text(case['input'])!r}")
+    print(f"{len(cases) - len(mismatches)}/{len(cases)} 사례 일치")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
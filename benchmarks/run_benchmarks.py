@@ -0,0 +1,373 @@
+"""오프라인 벤치마크: 변환기와 채팅 검색 경로의 단계별 지연시간/처리량/메모리 측정
+
+API 키 없이 결정적인 가짜 임베딩(rag.fakes.HashingEmbeddings)과 LLM 대역
+(rag.fakes.StubChatModel), 합성 한국어 PDF 를 사용한다. 결과는
+benchmarks/results/ 아래 JSON 으로 저장되어 버전 간 비교에 쓸 수 있다.
+
+    python benchmarks/run_benchmarks.py --pdfs 8 --pages 30 --repeat 3
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/bench-20250101-000000.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import fitz
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "converter"))
+
+from langchain.chains.combine_documents import create_stuff_documents_chain  # noqa: E402
+
+from rag.context_packing import estimate_tokens  # noqa: E402
+from rag.docstore import load_faiss_index  # noqa: E402
+from rag.embedding_cache import CachedEmbeddings  # noqa: E402
+from rag.fakes import HashingEmbeddings, StubChatModel  # noqa: E402
+from rag.metrics import RequestTrace  # noqa: E402
+from rag.retrieval import hybrid_search_many  # noqa: E402
+from rag.sparse_index import SparseIndex  # noqa: E402
+
+from check_clean_text import check_golden  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+QUESTIONS_PATH = os.path.join(BENCH_DIR, "questions_ko.txt")
+clean_rounds = 5
+
+_WORDS = (
+    "늘봄학교 자유수강권 지원 금액 늘봄행정실무사 채용 조건 방과후학교 프로그램 운영 계획 "
+    "교육비 안내 지침 학생 귀가 안전관리 강화 방안 늘봄지원실장 급여 처리 교육공무직원 "
+    "맞춤형복지제도 목적사업비 집행 잔액 외부강사 모집 공고 출결 관리 방학 가족돌봄휴직"
+).split()
+
+
+class StageTimer:
+    """단계별 소요 시간을 모아 백분위수를 계산"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    @contextlib.contextmanager
+    def measure(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[stage].append(time.perf_counter() - started)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for stage, samples in self.samples.items():
+            values = np.asarray(samples) * 1000
+            result[stage] = {
+                "count": len(samples),
+                "mean_ms": round(float(values.mean()), 3),
+                "p50_ms": round(float(np.percentile(values, 50)), 3),
+                "p95_ms": round(float(np.percentile(values, 95)), 3),
+                "p99_ms": round(float(np.percentile(values, 99)), 3),
+                "total_s": round(float(values.sum()) / 1000, 3),
+            }
+        return result
+
+
+class MemoryTracker:
+    """구간별 파이썬 힙 최대 사용량(tracemalloc)을 기록"""
+
+    def __init__(self):
+        self.peaks: Dict[str, float] = {}
+        tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            self.peaks[name] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+
+
+def make_synthetic_pdfs(out_dir: str, count: int, pages: int, seed: int = 0) -> List[str]:
+    """제목, 본문, 쪽 번호가 있는 합성 한국어 PDF 를 만드는 함수"""
+    rng = random.Random(seed)
+    paths = []
+    for file_number in range(count):
+        doc = fitz.open()
+        for page_number in range(pages):
+            page = doc.new_page()
+            page.insert_text(
+                (50, 60), f"{page_number + 1}. 늘봄 운영 안내", fontname="korea", fontsize=15
+            )
+            y = 90
+            for line in range(34):
+                words = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(5, 9)))
+                ending = "합니다." if line % 4 == 0 else ""
+                page.insert_text((50, y), words + ending, fontname="korea", fontsize=10)
+                y += 20
+            page.insert_text(
+                (290, 815), f"- {page_number + 1} -", fontname="korea", fontsize=9
+            )
+        path = os.path.join(out_dir, f"합성문서_{file_number:02d}.pdf")
+        doc.save(path)
+        doc.close()
+        paths.append(path)
+    return paths
+
+
+def load_questions(path: str = QUESTIONS_PATH) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def bench_converter(
+    timer: StageTimer,
+    memory: MemoryTracker,
+    pdf_paths: List[str],
+    index_dir: str,
+    dimensions: int,
+) -> Dict[str, Any]:
+    import pdf_converter_app as converter
+    from pdf_ingest import clean_pdf_text
+
+    # clean_pdf_text: 원본 페이지 텍스트 기준 처리량 (MB/s), 페이지 수가 적어도
+    # 의미 있는 값이 나오도록 clean_rounds 번 반복해 잰다
+    raw_pages = []
+    for path in pdf_paths:
+        with fitz.open(path) as doc:
+            raw_pages.extend(page.get_text() for page in doc)
+    with memory.phase("clean_pdf_text"):
+        for _ in range(clean_rounds):
+            for text in raw_pages:
+                with timer.measure("converter.clean_pdf_text"):
+                    clean_pdf_text(text)
+    raw_bytes = sum(len(text.encode("utf-8")) for text in raw_pages) * clean_rounds
+    clean_seconds = sum(timer.samples["converter.clean_pdf_text"])
+
+    with memory.phase("get_pdf_text"):
+        with timer.measure("converter.get_pdf_text"):
+            blocks = list(converter.get_pdf_text(pdf_paths))
+
+    with memory.phase("get_text_chunks"), contextlib.redirect_stdout(io.StringIO()):
+        with timer.measure("converter.get_text_chunks"):
+            chunks = converter.get_text_chunks(blocks)
+
+    converter.index_path = index_dir
+    converter.get_embeddings = lambda: CachedEmbeddings(
+        HashingEmbeddings(dimensions), model_name="bench", cache_path=None
+    )
+    with memory.phase("get_vector_store"), contextlib.redirect_stdout(io.StringIO()):
+        with timer.measure("converter.get_vector_store"):
+            converter.get_vector_store(chunks)
+
+    pdf_seconds = timer.samples["converter.get_pdf_text"][-1]
+    page_count = len({(block.metadata["source"], block.metadata["page"]) for block in blocks})
+    return {
+        "pages": page_count,
+        "chunks": len(chunks),
+        "pages_per_second": round(page_count / pdf_seconds, 1),
+        "clean_pdf_text_mb_per_second": round(raw_bytes / 1e6 / clean_seconds, 2),
+        "clean_pdf_text_golden_mismatches": len(check_golden()),
+    }
+
+
+def bench_chat(
+    timer: StageTimer,
+    memory: MemoryTracker,
+    index_dir: str,
+    questions: List[str],
+    repeat: int,
+    dimensions: int,
+    llm_latency: float,
+) -> Dict[str, Any]:
+    import streamlit_app as app
+
+    embeddings = HashingEmbeddings(dimensions)
+    llm = StubChatModel(first_token_latency=llm_latency)
+    chain = create_stuff_documents_chain(llm, app.get_rag_prompt())
+
+    app.index_path = index_dir
+    app.answer_cache_enabled = False
+    app.chat_service_enabled = False  # 요청 하나의 단계별 시간을 재므로 제공자 한도는 적용하지 않음
+    app.get_embeddings = lambda: embeddings
+    app.get_conversational_chain = lambda *args, **kwargs: chain
+
+    with memory.phase("index_load"):
+        for _ in range(repeat):
+            with timer.measure("chat.index_load"):
+                db = load_faiss_index(index_dir, embeddings)
+                sparse_index = SparseIndex.load(index_dir)
+        # 재정렬 모델 로드는 프로세스당 한 번이므로 질문별 chat.rerank 에 섞지 않고 따로 잼
+        with timer.measure("chat.rerank_load"), contextlib.redirect_stdout(io.StringIO()):
+            app.get_rerank_stage()
+
+    prompt_chars, candidate_tokens, unpacked_tokens, context_tokens = [], [], [], []
+    with memory.phase("chat_stages"), contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            for question in questions:
+                with timer.measure("chat.embed"):
+                    variants, query_vectors = app.embed_query_variants(
+                        question, RequestTrace(question)
+                    )
+                with timer.measure("chat.search"):
+                    results = [
+                        result
+                        for variant_results in hybrid_search_many(
+                            db, sparse_index, variants, query_vectors, k=app.candidate_k()
+                        )
+                        for result in variant_results
+                    ]
+                with timer.measure("chat.rerank"):
+                    similar_docs = app.rank_search_results(question, results)
+                with timer.measure("chat.filter"):
+                    relevant_docs = app.analyze_search_results(
+                        question, similar_docs, app.relevance_threshold
+                    )
+                with timer.measure("chat.pack"):
+                    context_docs = app.select_context_docs(relevant_docs)
+                with timer.measure("chat.llm"):
+                    chain.invoke({"input": question, "context": context_docs})
+                prompt_chars.append(llm.last_prompt_chars)
+                candidate_tokens.append(
+                    sum(estimate_tokens(doc.page_content) for doc, _ in similar_docs)
+                )
+                unpacked_tokens.append(
+                    sum(estimate_tokens(doc.page_content) for doc, _ in relevant_docs)
+                )
+                context_tokens.append(
+                    sum(estimate_tokens(doc.page_content) for doc in context_docs)
+                )
+
+    started = time.perf_counter()
+    with memory.phase("end_to_end"), contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            for question in questions:
+                with timer.measure("chat.end_to_end"):
+                    app.user_input(question)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "questions": len(questions) * repeat,
+        "questions_per_second": round(len(questions) * repeat / elapsed, 2),
+        "mean_prompt_chars": round(float(np.mean(prompt_chars)), 1),
+        # 관련도 기준값으로 거르기 전(재정렬 상위 후보)의 추정 토큰 수
+        "mean_context_tokens_candidates": round(float(np.mean(candidate_tokens)), 1),
+        "context_filter_savings": round(
+            1 - float(np.sum(unpacked_tokens)) / max(float(np.sum(candidate_tokens)), 1), 3
+        ),
+        # 컨텍스트 정리(CONTEXT_PACKING) 전후의 추정 토큰 수 (둘 다 걸러진 문서 기준)
+        "mean_context_tokens_unpacked": round(float(np.mean(unpacked_tokens)), 1),
+        "mean_context_tokens": round(float(np.mean(context_tokens)), 1),
+        "context_token_savings": round(
+            1 - float(np.sum(context_tokens)) / max(float(np.sum(unpacked_tokens)), 1), 3
+        ),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    print(f"\n{'단계':<30} {'p50(ms)':>10} {'p95(ms)':>10} {'p99(ms)':>10} {'횟수':>6}")
+    for stage, stats in result["stages"].items():
+        line = (
+            f"{stage:<30} {stats['p50_ms']:>10.3f} {stats['p95_ms']:>10.3f} "
+            f"{stats['p99_ms']:>10.3f} {stats['count']:>6}"
+        )
+        previous = (baseline or {}).get("stages", {}).get(stage)
+        if previous and previous["p50_ms"] > 0:
+            change = (stats["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"] * 100
+            line += f"  (p50 {change:+.1f}%)"
+        print(line)
+    print("\n처리량:", json.dumps(result["throughput"], ensure_ascii=False))
+    print("메모리(MB):", json.dumps(result["memory"], ensure_ascii=False))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="오프라인 단계별 벤치마크")
+    parser.add_argument("--pdfs", type=int, default=6, help="합성 PDF 수")
+    parser.add_argument("--pages", type=int, default=20, help="PDF 당 페이지 수")
+    parser.add_argument("--repeat", type=int, default=3, help="질문 세트 반복 횟수")
+    parser.add_argument("--dimensions", type=int, default=3072, help="가짜 임베딩 차원")
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.0, help="LLM 대역의 응답 지연(초)"
+    )
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--output", help="결과 JSON 경로 (기본: benchmarks/results/)")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON")
+    args = parser.parse_args(argv)
+
+    timer = StageTimer()
+    memory = MemoryTracker()
+    questions = load_questions(args.questions)
+
+    with tempfile.TemporaryDirectory(prefix="bench_") as work_dir:
+        pdf_dir = os.path.join(work_dir, "pdfs")
+        os.makedirs(pdf_dir)
+        pdf_paths = make_synthetic_pdfs(pdf_dir, args.pdfs, args.pages)
+        index_dir = os.path.join(work_dir, "faiss_index")
+
+        converter_stats = bench_converter(
+            timer, memory, pdf_paths, index_dir, args.dimensions
+        )
+        chat_stats = bench_chat(
+            timer,
+            memory,
+            index_dir,
+            questions,
+            args.repeat,
+            args.dimensions,
+            args.llm_latency,
+        )
+
+    memory.peaks["process_max_rss"] = round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2
+    )
+    result = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "params": vars(args),
+        "stages": timer.summary(),
+        "throughput": {**converter_stats, **chat_stats},
+        "memory": memory.peaks,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, time.strftime("bench-%Y%m%d-%H%M%S.json")
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=1)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    print(f"\n결과 저장: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""브라우저 없이 PDF 폴더/글롭으로 벡터DB를 만드는 명령줄 도구 (cron 등 예약 실행용)
+
+PDF는 업로드 위젯을 거치지 않고 디스크 경로 그대로 읽는다. 새 벡터DB는 같은
+폴더 옆 임시 폴더에 만든 뒤 인덱스 경로의 심볼릭 링크를 바꿔 교체하므로, 실행
+중인 챗봇은 완성된 인덱스만 보게 된다.
+
+    python converter/build_index.py 문서폴더/ "추가/**/*.pdf" --index-path faiss_index
+
+종료 코드: 0 성공, 1 빌드 실패, 2 잘못된 입력, 3 다른 빌드가 실행 중
+"""
+
+import argparse
+import glob
+import os
+import sys
+from typing import Dict, List, Optional
+
+import pdf_converter_app as converter
+from index_builder import IndexConfig, default_index_config, index_kinds
+from index_manifest import file_sha256
+from index_staging import IndexLocked, index_lock, staged_index_dir, swap_index_dir
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag.index_catalog import catalog_from_index_dir, load_catalog, save_catalog
+
+EXIT_OK = 0
+EXIT_BUILD_FAILED = 1
+EXIT_BAD_INPUT = 2
+EXIT_LOCKED = 3
+
+
+def collect_pdfs(inputs: List[str]) -> List[str]:
+    """폴더(하위 폴더 포함), 글롭 패턴, 파일 경로에서 PDF 경로 목록을 만드는 함수"""
+    paths: List[str] = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, "**", "*"), recursive=True)
+        elif glob.has_magic(item):
+            matches = glob.glob(item, recursive=True)
+        else:
+            matches = [item]
+        for path in sorted(matches):
+            if path.lower().endswith(".pdf") and os.path.isfile(path):
+                paths.append(os.path.abspath(path))
+    return list(dict.fromkeys(paths))
+
+
+def find_duplicate_names(paths: List[str]) -> Dict[str, List[str]]:
+    """벡터DB 는 파일 이름으로 문서를 구분하므로 이름이 겹치는 경로를 찾음"""
+    by_name: Dict[str, List[str]] = {}
+    for path in paths:
+        by_name.setdefault(os.path.basename(path), []).append(path)
+    return {name: group for name, group in by_name.items() if len(group) > 1}
+
+
+def print_progress(source, done_pages, total_pages, file_index, file_count):
+    if done_pages == total_pages:
+        print(f"[{file_index + 1}/{file_count}] {source} ({total_pages}쪽) 읽기 완료")
+
+
+def build(
+    pdf_paths: List[str],
+    index_dir: str,
+    keep_missing: bool = False,
+    index_config: Optional[IndexConfig] = None,
+) -> int:
+    """임시 폴더에서 증분 빌드를 하고 성공하면 인덱스 폴더를 교체, 종료 코드를 반환"""
+    index_dir = os.path.abspath(index_dir)
+    # 기존 인덱스를 복사해 두고 그 위에서 증분 빌드 (원본은 교체 전까지 그대로)
+    with staged_index_dir(index_dir) as staging_dir:
+        plan = converter.plan_incremental_build(pdf_paths, keep_missing, staging_dir)
+        if not plan["changed"] and not plan["removed"]:
+            print("변경된 문서가 없어 벡터DB를 그대로 둡니다.")
+            if os.path.isdir(index_dir) and load_catalog(staging_dir) is None:
+                # 카탈로그가 생기기 전에 만든 벡터DB면 복사본에 문서 목록만 추가해 교체
+                save_catalog(staging_dir, catalog_from_index_dir(staging_dir))
+                swap_index_dir(staging_dir, index_dir)
+                print(f"문서 목록(catalog.json)을 추가했습니다: {index_dir}")
+            return EXIT_OK
+
+        file_hashes = {os.path.basename(path): file_sha256(path) for path in pdf_paths}
+        chunks = converter.get_text_chunks(
+            converter.get_pdf_text(plan["changed"], print_progress)
+        )
+        done = converter.get_vector_store(
+            chunks,
+            lambda finished, total: print(f"임베딩 {finished}/{total}", end="\r"),
+            file_hashes=file_hashes,
+            removed_sources=plan["removed"],
+            index_config=index_config,
+            index_dir=staging_dir,
+        )
+        print()
+        if not done:
+            return EXIT_BUILD_FAILED
+
+        swap_index_dir(staging_dir, index_dir)
+        print(f"벡터DB 교체 완료: {index_dir}")
+        return EXIT_OK
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="PDF 폴더/글롭으로 FAISS 벡터DB 생성")
+    parser.add_argument("inputs", nargs="+", help="PDF 파일, 폴더 또는 글롭 패턴")
+    parser.add_argument("--index-path", default=converter.index_path)
+    parser.add_argument(
+        "--keep-missing",
+        action="store_true",
+        help="이번에 주지 않은 기존 문서를 벡터DB에 그대로 유지",
+    )
+    parser.add_argument("--index-kind", choices=index_kinds, default="flat")
+    parser.add_argument("--nprobe", type=int, default=default_index_config["nprobe"])
+    parser.add_argument("--ef-search", type=int, default=default_index_config["ef_search"])
+    parser.add_argument("--pca-dim", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    pdf_paths = collect_pdfs(args.inputs)
+    if not pdf_paths:
+        print("PDF 파일을 찾을 수 없습니다.", file=sys.stderr)
+        return EXIT_BAD_INPUT
+    duplicates = find_duplicate_names(pdf_paths)
+    if duplicates:
+        for name, group in duplicates.items():
+            print(f"파일 이름이 겹칩니다: {name} ({', '.join(group)})", file=sys.stderr)
+        return EXIT_BAD_INPUT
+
+    index_config: IndexConfig = {
+        "kind": args.index_kind,
+        "nprobe": args.nprobe,
+        "ef_search": args.ef_search,
+        "pca_dim": args.pca_dim,
+    }
+
+    # 같은 인덱스를 동시에 빌드하지 않도록 잠금 (cron 이나 변환기 화면과 겹칠 때)
+    try:
+        with index_lock(args.index_path):
+            print(f"PDF {len(pdf_paths)}개로 벡터DB 빌드: {args.index_path}")
+            try:
+                return build(pdf_paths, args.index_path, args.keep_missing, index_config)
+            except Exception as e:
+                print(f"벡터DB 빌드 실패: {e}", file=sys.stderr)
+                return EXIT_BUILD_FAILED
+    except IndexLocked as e:
+        print(f"다른 빌드가 실행 중입니다: {e}", file=sys.stderr)
+        return EXIT_LOCKED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
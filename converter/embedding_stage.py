@@ -0,0 +1,137 @@
+"""청크 임베딩을 여러 배치 동시에 요청하는 모듈 (429 재시도, 토큰 한도 기반 배치)"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+embedding_concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+max_batch_items = 100  # 요청 하나에 넣을 최대 청크 수
+max_batch_tokens = 200_000  # 요청 하나의 추정 토큰 상한 (OpenAI 한도 300k 보다 여유 있게)
+max_retries = 6
+base_backoff_seconds = 1.0
+max_backoff_seconds = 60.0
+
+# (완료한 청크 수, 전체 청크 수)
+EmbeddingProgressCallback = Callable[[int, int], None]
+
+
+def estimate_tokens(text: str) -> int:
+    """토큰 수를 넉넉하게 추정 (한글은 대략 글자당 1토큰 이하)"""
+    return len(text) + 1
+
+
+def make_batches(
+    texts: Sequence[str],
+    max_items: int = max_batch_items,
+    max_tokens: int = max_batch_tokens,
+) -> List[List[int]]:
+    """개수와 추정 토큰 수 한도를 넘지 않도록 텍스트 인덱스를 배치로 나누는 함수"""
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    batch_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_too_large(error: Exception) -> bool:
+    message = str(error).lower()
+    return _status_code(error) == 400 and (
+        "token" in message or "too large" in message or "maximum" in message
+    )
+
+
+def embed_batch_with_retry(
+    embeddings: Embeddings, texts: List[str]
+) -> List[List[float]]:
+    """배치 하나를 임베딩하는 함수
+
+    429/5xx 는 지수 백오프(+지터)로 재시도하고, 토큰 한도 초과(400)면 배치를 반으로
+    나눠 다시 요청한다.
+    """
+    attempt = 0
+    while True:
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            status = _status_code(e)
+            if _is_too_large(e) and len(texts) > 1:
+                middle = len(texts) // 2
+                print(f"배치가 토큰 한도를 넘어 {len(texts)}개를 둘로 나눠 재시도합니다.")
+                return embed_batch_with_retry(
+                    embeddings, texts[:middle]
+                ) + embed_batch_with_retry(embeddings, texts[middle:])
+
+            retryable = status == 429 or (status is not None and status >= 500)
+            if not retryable or attempt >= max_retries:
+                raise
+
+            delay = _retry_after(e) or min(
+                max_backoff_seconds, base_backoff_seconds * 2**attempt
+            )
+            delay += random.uniform(0, delay * 0.25)
+            print(f"임베딩 요청 제한/오류({status}), {delay:.1f}초 후 재시도...")
+            time.sleep(delay)
+            attempt += 1
+
+
+def embed_texts_concurrently(
+    embeddings: Embeddings,
+    texts: Sequence[str],
+    concurrency: int = embedding_concurrency,
+    progress: Optional[EmbeddingProgressCallback] = None,
+) -> List[List[float]]:
+    """여러 배치를 동시에 임베딩하고 입력 순서대로 벡터를 반환하는 함수"""
+    batches = make_batches(texts)
+    vectors: List[Optional[List[float]]] = [None] * len(texts)
+    done = 0
+    lock = threading.Lock()
+
+    def run(batch_number: int, batch: List[int]):
+        nonlocal done
+        result = embed_batch_with_retry(embeddings, [texts[i] for i in batch])
+        for i, vector in zip(batch, result):
+            vectors[i] = vector
+        with lock:
+            done += len(batch)
+            print(
+                f"Embedded batch {batch_number + 1}/{len(batches)} "
+                f"with {len(batch)} chunks ({done}/{len(texts)})"
+            )
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(run, n, batch) for n, batch in enumerate(batches)]
+        for future in futures:
+            future.result()
+            if progress is not None:
+                progress(done, len(texts))
+
+    return vectors  # type: ignore[return-value]
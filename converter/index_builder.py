@@ -0,0 +1,314 @@
+"""대규모 문서용 근사(ANN)/양자화 FAISS 인덱스 생성과 recall@k·지연시간 비교
+
+기본값(flat)은 기존과 같은 정확한 검색이다. 다른 종류를 고르면 변환기는 증분 빌드용
+정확한 인덱스를 index_flat.faiss 로 함께 저장하고, 채팅 앱이 읽는 index.faiss 는
+선택한 근사 인덱스로 쓴다.
+
+비교 리포트:
+
+    python converter/index_builder.py faiss_index --kinds flat ivf_flat ivf_pq hnsw \\
+        --nprobe 4 8 16 --ef-search 32 64 128 --json report.json
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+import faiss
+import numpy as np
+
+index_kinds = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+flat_file_name = "index_flat.faiss"
+params_file_name = "index_params.json"
+
+
+class IndexConfig(TypedDict, total=False):
+    kind: str  # flat | ivf_flat | ivf_pq | hnsw
+    nlist: int  # IVF 클러스터 수 (0이면 문서 수로 자동 결정)
+    nprobe: int  # IVF 검색 시 볼 클러스터 수
+    pq_m: int  # PQ 서브벡터 수 (차원의 약수)
+    pq_bits: int  # 서브벡터당 비트 수
+    hnsw_m: int  # HNSW 이웃 수
+    ef_construction: int
+    ef_search: int
+    pca_dim: int  # 0이 아니면 PCA로 이 차원까지 줄임
+    train_sample: int  # 학습에 쓸 최대 벡터 수
+
+
+default_index_config: IndexConfig = {
+    "kind": "flat",
+    "nlist": 0,
+    "nprobe": 8,
+    "pq_m": 64,
+    "pq_bits": 8,
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    "pca_dim": 0,
+    "train_sample": 50_000,
+}
+
+
+def resolve_config(config: Optional[IndexConfig]) -> IndexConfig:
+    resolved: IndexConfig = {**default_index_config, **(config or {})}
+    if resolved["kind"] not in index_kinds:
+        raise ValueError(f"지원하지 않는 인덱스 종류입니다: {resolved['kind']}")
+    return resolved
+
+
+def auto_nlist(count: int) -> int:
+    """문서 수에 맞는 IVF 클러스터 수 (클러스터당 학습 벡터가 39개 이상 되도록)"""
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+def select_training_sample(
+    vectors: np.ndarray, max_count: int, seed: int = 0
+) -> np.ndarray:
+    """학습용 벡터를 고르게 무작위 추출하는 함수 (전체가 적으면 전부 사용)"""
+    if len(vectors) <= max_count:
+        return vectors
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(vectors), size=max_count, replace=False))
+    return vectors[rows]
+
+
+def apply_search_params(index: faiss.Index, config: IndexConfig):
+    """nprobe/efSearch 같은 검색 파라미터를 인덱스에 적용"""
+    params = []
+    if config["kind"] in ("ivf_flat", "ivf_pq"):
+        params.append(f"nprobe={config['nprobe']}")
+    if config["kind"] == "hnsw":
+        params.append(f"efSearch={config['ef_search']}")
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, ",".join(params))
+
+
+def build_index(vectors: np.ndarray, config: Optional[IndexConfig] = None) -> faiss.Index:
+    """설정에 맞는 FAISS 인덱스를 만들고 학습/추가까지 마치는 함수"""
+    config = resolve_config(config)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dimension = vectors.shape
+
+    pca = None
+    inner_dimension = dimension
+    if config["pca_dim"] and config["pca_dim"] < dimension:
+        inner_dimension = config["pca_dim"]
+        pca = faiss.PCAMatrix(dimension, inner_dimension)
+
+    kind = config["kind"]
+    if kind == "flat":
+        inner = faiss.IndexFlatL2(inner_dimension)
+    elif kind in ("ivf_flat", "ivf_pq"):
+        nlist = config["nlist"] or auto_nlist(count)
+        quantizer = faiss.IndexFlatL2(inner_dimension)
+        if kind == "ivf_flat":
+            inner = faiss.IndexIVFFlat(quantizer, inner_dimension, nlist)
+        else:
+            pq_m = config["pq_m"]
+            while inner_dimension % pq_m:
+                pq_m -= 1
+            # 코드북(2^bits 개) 학습에 필요한 벡터 수가 모자라면 비트 수를 줄임
+            pq_bits = max(1, min(config["pq_bits"], int(math.log2(max(count // 39, 2)))))
+            inner = faiss.IndexIVFPQ(quantizer, inner_dimension, nlist, pq_m, pq_bits)
+    else:
+        inner = faiss.IndexHNSWFlat(inner_dimension, config["hnsw_m"])
+        inner.hnsw.efConstruction = config["ef_construction"]
+
+    index = inner
+    if pca is not None:
+        # PCA 로 줄인 벡터는 길이가 1이 아니므로 다시 정규화해야 거리 d 에서 구한
+        # 1 - d/2 가 코사인 유사도로 유지된다 (PCA -> L2 정규화 순서로 적용)
+        index = faiss.IndexPreTransform(faiss.NormalizationTransform(inner_dimension), inner)
+        index.prepend_transform(pca)
+
+    if not index.is_trained:
+        sample = select_training_sample(vectors, config["train_sample"])
+        print(f"{kind} 인덱스 학습 (학습 벡터 {len(sample)}개, PCA: {config['pca_dim'] or '없음'})")
+        index.train(sample)
+    index.add(vectors)
+    apply_search_params(index, config)
+    return index
+
+
+def flat_vectors(index: faiss.Index) -> np.ndarray:
+    """정확한(flat) 인덱스에 저장된 벡터 전체"""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def save_search_index(flat_index: faiss.Index, index_dir: str, config: Optional[IndexConfig]):
+    """채팅 앱이 읽을 index.faiss 를 설정한 종류로 저장하는 함수
+
+    flat 이 아니면 정확한 인덱스를 index_flat.faiss 로 따로 남겨 증분 빌드와
+    리포트의 기준값으로 쓴다.
+    """
+    config = resolve_config(config)
+    flat_path = os.path.join(index_dir, flat_file_name)
+    params_path = os.path.join(index_dir, params_file_name)
+
+    if config["kind"] == "flat" and not config["pca_dim"]:
+        for path in (flat_path, params_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return
+
+    faiss.write_index(flat_index, flat_path)
+    index = build_index(flat_vectors(flat_index), config)
+    faiss.write_index(index, os.path.join(index_dir, "index.faiss"))
+    with open(params_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=1)
+
+
+def _percentile_ms(samples: List[float], q: float) -> float:
+    return float(np.percentile(samples, q) * 1000) if samples else 0.0
+
+
+def evaluate_configs(
+    vectors: np.ndarray,
+    configs: List[IndexConfig],
+    k: int = 8,
+    query_count: int = 200,
+    seed: int = 0,
+    max_score_error: float = 0.05,
+) -> List[Dict[str, Any]]:
+    """flat 기준 대비 각 설정의 recall@k, 검색 지연시간, 인덱스 크기를 측정하는 함수
+
+    저장된 벡터 일부를 질문으로 사용하고, 자기 자신은 정답/결과에서 제외한다.
+    score_error 는 인덱스가 돌려준 유사도(1 - d/2)와 원래 벡터로 계산한 유사도의 평균
+    차이이며, PCA 나 PQ 양자화로 이 값이 max_score_error 를 넘으면 채팅 앱의 관련도
+    기준값이 맞지 않으므로 rejected 에 이유를 남긴다.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(vectors), size=min(query_count, len(vectors)), replace=False)
+    queries = vectors[query_rows]
+
+    def neighbours(index: faiss.Index) -> Tuple[List[set], float]:
+        distances, rows = index.search(queries, k + 1)
+        neighbour_sets = []
+        errors = []
+        for query, found, found_distances, own in zip(queries, rows, distances, query_rows):
+            kept = [
+                (int(r), float(d)) for r, d in zip(found, found_distances) if r != -1 and r != own
+            ][:k]
+            neighbour_sets.append({r for r, _ in kept})
+            for r, d in kept:
+                exact = float(np.sum((vectors[r] - query) ** 2))
+                errors.append(abs(d - exact) / 2)
+        return neighbour_sets, float(np.mean(errors)) if errors else 0.0
+
+    baseline = build_index(vectors, {"kind": "flat"})
+    truth, _ = neighbours(baseline)
+
+    report = []
+    for config in configs:
+        config = resolve_config(config)
+        started = time.perf_counter()
+        index = build_index(vectors, config)
+        build_seconds = time.perf_counter() - started
+
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query[None, :], k + 1)
+            latencies.append(time.perf_counter() - started)
+
+        results, score_error = neighbours(index)
+        recall = float(
+            np.mean([len(t & r) / max(len(t), 1) for t, r in zip(truth, results)])
+        )
+        rejected = ""
+        if score_error > max_score_error:
+            rejected = f"유사도 오차 {score_error:.3f} > {max_score_error}"
+        report.append(
+            {
+                "config": config,
+                f"recall@{k}": round(recall, 4),
+                "score_error": round(score_error, 4),
+                "rejected": rejected,
+                "latency_p50_ms": round(_percentile_ms(latencies, 50), 3),
+                "latency_p95_ms": round(_percentile_ms(latencies, 95), 3),
+                "index_bytes": int(faiss.serialize_index(index).nbytes),
+                "build_seconds": round(build_seconds, 3),
+            }
+        )
+    return report
+
+
+def load_flat_index(index_dir: str) -> faiss.Index:
+    flat_path = os.path.join(index_dir, flat_file_name)
+    if os.path.exists(flat_path):
+        return faiss.read_index(flat_path)
+    return faiss.read_index(os.path.join(index_dir, "index.faiss"))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="FAISS 인덱스 종류별 recall@k/지연시간 비교")
+    parser.add_argument("index_dir", nargs="?", default="faiss_index")
+    parser.add_argument("--kinds", nargs="+", default=list(index_kinds), choices=index_kinds)
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[8])
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[64])
+    parser.add_argument("--pca-dim", nargs="+", type=int, default=[0])
+    parser.add_argument("--pq-m", type=int, default=default_index_config["pq_m"])
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--json", help="결과를 저장할 JSON 파일 경로")
+    args = parser.parse_args(argv)
+
+    flat_index = load_flat_index(args.index_dir)
+    if flat_index.ntotal == 0:
+        print("인덱스가 비어 있습니다.")
+        return 1
+    vectors = flat_vectors(flat_index)
+
+    configs: List[IndexConfig] = []
+    for pca_dim in args.pca_dim:
+        for kind in args.kinds:
+            if kind in ("ivf_flat", "ivf_pq"):
+                configs.extend(
+                    {"kind": kind, "nprobe": n, "pca_dim": pca_dim, "pq_m": args.pq_m}
+                    for n in args.nprobe
+                )
+            elif kind == "hnsw":
+                configs.extend(
+                    {"kind": kind, "ef_search": ef, "pca_dim": pca_dim}
+                    for ef in args.ef_search
+                )
+            else:
+                configs.append({"kind": kind, "pca_dim": pca_dim})
+
+    report = evaluate_configs(vectors, configs, k=args.k, query_count=args.queries)
+
+    print(f"벡터 {len(vectors)}개, 차원 {vectors.shape[1]}")
+    print(
+        f"{'설정':<40} {'recall@' + str(args.k):>9} {'점수오차':>9} "
+        f"{'p50(ms)':>9} {'p95(ms)':>9} {'크기(MB)':>9}"
+    )
+    for row in report:
+        config = row["config"]
+        label = config["kind"]
+        if config["kind"] in ("ivf_flat", "ivf_pq"):
+            label += f" nprobe={config['nprobe']}"
+        if config["kind"] == "hnsw":
+            label += f" efSearch={config['ef_search']}"
+        if config["pca_dim"]:
+            label += f" pca={config['pca_dim']}"
+        print(
+            f"{label:<40} {row[f'recall@{args.k}']:>9.3f} {row['score_error']:>9.3f} "
+            f"{row['latency_p50_ms']:>9.3f} {row['latency_p95_ms']:>9.3f} "
+            f"{row['index_bytes'] / 1e6:>9.2f}"
+        )
+        if row["rejected"]:
+            print(f"  사용 불가: {row['rejected']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""증분 빌드를 위해 벡터DB 옆에 파일/청크 해시 목록(manifest)을 관리하는 모듈"""
+
+import hashlib
+import json
+import mmap
+import os
+from typing import Dict, Iterable, List, Optional, TypedDict
+
+from langchain.schema import Document
+
+manifest_file_name = "manifest.json"
+manifest_version = 1
+
+
+class FileEntry(TypedDict):
+    sha256: str
+    chunk_ids: List[str]
+
+
+class Manifest(TypedDict):
+    version: int
+    embedding_model: str
+    chunking: str
+    files: Dict[str, FileEntry]
+
+
+def file_sha256(pdf) -> str:
+    """업로드 파일 또는 디스크 경로의 SHA-256"""
+    digest = hashlib.sha256()
+    if isinstance(pdf, (str, os.PathLike)):
+        # 디스크 파일은 메모리 맵으로 읽어 파일 크기만큼 버퍼를 만들지 않음
+        with open(pdf, "rb") as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    digest.update(mapped)
+    else:
+        pdf.seek(0)
+        digest.update(pdf.getbuffer() if hasattr(pdf, "getbuffer") else pdf.read())
+    return digest.hexdigest()
+
+
+def assign_chunk_ids(chunks: Iterable[Document]) -> List[str]:
+    """출처, 페이지/섹션과 내용으로 청크 ID를 만드는 함수 (같은 파일 안의 동일 내용은 순번으로 구분)
+
+    페이지나 섹션만 바뀐 청크도 새 ID를 받아 벡터DB의 메타데이터가 갱신된다
+    (본문이 같으므로 임베딩은 캐시에서 가져온다).
+    """
+    ids: List[str] = []
+    seen: Dict[str, int] = {}
+    for chunk in chunks:
+        metadata = chunk.metadata
+        location = f"{metadata.get('page', '')}\0{metadata.get('section', '')}"
+        content_hash = hashlib.sha256(
+            f"{metadata.get('source', '')}\0{location}\0{chunk.page_content}".encode("utf-8")
+        ).hexdigest()[:32]
+        count = seen.get(content_hash, 0)
+        seen[content_hash] = count + 1
+        ids.append(f"{content_hash}-{count}")
+    return ids
+
+
+def load_manifest(index_dir: str) -> Optional[Manifest]:
+    path = os.path.join(index_dir, manifest_file_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != manifest_version:
+        return None
+    return manifest
+
+
+def save_manifest(index_dir: str, manifest: Manifest):
+    with open(os.path.join(index_dir, manifest_file_name), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+
+def is_compatible(
+    manifest: Optional[Manifest], embedding_model: str, chunking: str
+) -> bool:
+    """기존 인덱스의 임베딩 모델/청크 설정이 같아서 증분 빌드가 가능한지 여부"""
+    return (
+        manifest is not None
+        and manifest["embedding_model"] == embedding_model
+        and manifest["chunking"] == chunking
+    )
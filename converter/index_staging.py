@@ -0,0 +1,90 @@
+"""실행 중인 챗봇이 읽는 벡터DB를 임시 폴더에서 만든 뒤 한 번에 교체하는 도구
+
+명령줄 빌드(build_index.py)와 변환기 화면이 함께 쓴다.
+
+- index_lock: 같은 인덱스를 동시에 빌드하지 않도록 `<인덱스>.lock` 을 잠금
+- staged_index_dir: 기존 인덱스를 복사한 임시 폴더 (원본은 교체 전까지 그대로)
+- swap_index_dir: 완성된 임시 폴더를 새 버전으로 만들고 인덱스 경로의 링크를 바꿈
+"""
+
+import fcntl
+import glob
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class IndexLocked(Exception):
+    """다른 빌드가 같은 인덱스를 잠그고 있을 때"""
+
+
+@contextmanager
+def index_lock(index_dir: str) -> Iterator[None]:
+    """같은 인덱스를 동시에 빌드하지 않도록 잠금 (cron 이 겹치거나 변환기 화면과 겹칠 때)"""
+    lock_path = f"{os.path.abspath(index_dir)}.lock"
+    with open(lock_path, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise IndexLocked(lock_path) from None
+        yield
+
+
+@contextmanager
+def staged_index_dir(index_dir: str) -> Iterator[str]:
+    """기존 인덱스를 복사한 임시 폴더를 주고, 교체하지 않고 끝나면 지우는 함수
+
+    mkdtemp 는 폴더를 0700 으로 만들므로, 교체된 뒤 다른 사용자로 실행 중인 챗봇도
+    읽을 수 있게 umask 에 따른 권한으로 바꾼다.
+    """
+    index_dir = os.path.abspath(index_dir)
+    parent_dir = os.path.dirname(index_dir)
+    os.makedirs(parent_dir, exist_ok=True)
+
+    staging_dir = tempfile.mkdtemp(
+        prefix=f".{os.path.basename(index_dir)}.tmp-", dir=parent_dir
+    )
+    try:
+        if os.path.isdir(index_dir):
+            shutil.copytree(index_dir, staging_dir, dirs_exist_ok=True)
+        # copytree 가 원본 폴더의 권한도 복사하므로 복사한 뒤에 바꿈
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(staging_dir, 0o777 & ~umask)
+        yield staging_dir
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def swap_index_dir(staging_dir: str, index_dir: str):
+    """완성된 임시 폴더를 새 버전 폴더로 만들고 인덱스 경로가 그 폴더를 가리키게 하는 함수
+
+    index_dir 은 `.<이름>.v-<시각>` 버전 폴더를 가리키는 심볼릭 링크다. 새 링크를
+    옆에 만든 뒤 os.replace 로 덮어쓰므로 챗봇은 언제나 이전 또는 새 인덱스 중
+    하나를 본다. 교체 직전에 이전 경로로 파일을 열던 요청을 위해 직전 버전 폴더는
+    남기고 그보다 오래된 버전만 지운다. index_dir 이 예전 방식의 실제 폴더면 처음
+    한 번만 버전 폴더로 옮기며, 이때는 두 rename 사이에 아주 짧게 경로가 비어 있다.
+    """
+    index_dir = os.path.abspath(index_dir)
+    parent_dir, name = os.path.split(index_dir)
+    version_dir = os.path.join(parent_dir, f".{name}.v-{time.time_ns()}")
+    os.rename(staging_dir, version_dir)
+
+    previous_dir = None
+    if os.path.islink(index_dir):
+        previous_dir = os.path.realpath(index_dir)
+    elif os.path.isdir(index_dir):
+        previous_dir = os.path.join(parent_dir, f".{name}.v-{time.time_ns()}")
+        os.rename(index_dir, previous_dir)
+
+    link_path = os.path.join(parent_dir, f".{name}.link-{os.getpid()}")
+    os.symlink(os.path.basename(version_dir), link_path)
+    os.replace(link_path, index_dir)
+
+    keep = {os.path.realpath(version_dir), previous_dir and os.path.realpath(previous_dir)}
+    for old_dir in glob.glob(os.path.join(parent_dir, f".{name}.v-*")):
+        if os.path.realpath(old_dir) not in keep:
+            shutil.rmtree(old_dir, ignore_errors=True)
@@ -1,4 +1,5 @@
-import fitz
+import os
+import sys
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 # from langchain_google_genai import GoogleGenerativeAIEmbeddings
@@ -7,62 +8,72 @@ import streamlit as st
 from langchain_community.vectorstores import FAISS
 from dotenv import load_dotenv
 from langchain.schema import Document
-from typing import List
-import re
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from embedding_stage import EmbeddingProgressCallback, embed_texts_concurrently
+from index_builder import (
+    IndexConfig,
+    default_index_config,
+    index_kinds,
+    save_search_index,
+)
+from index_manifest import (
+    assign_chunk_ids,
+    file_sha256,
+    is_compatible,
+    load_manifest,
+    manifest_version,
+    save_manifest,
+)
+from index_staging import IndexLocked, index_lock, staged_index_dir, swap_index_dir
+from pdf_ingest import ProgressCallback, clean_pdf_text, iter_pdf_pages  # noqa: F401
+from section_chunker import chunk_sections, embedding_text
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag.context_packing import estimate_tokens
+from rag.docstore import load_faiss_index, save_faiss_index
+from rag.embedding_cache import CachedEmbeddings
+from rag.index_catalog import build_catalog, save_catalog
+from rag.retrieval import build_sparse_index_from_store, row_document
 
 load_dotenv()
 
 embedding_model = "text-embedding-3-large"
+stream_window_chars = 20000  # 청크 분할 전에 모아둘 최대 글자 수
+chunk_tokens = 400  # 청크 최대 추정 토큰 수 (한글 약 600자)
+chunk_overlap_tokens = 60  # 한 섹션을 여러 청크로 나눌 때 겹치는 토큰 수
+min_section_tokens = 40  # 본문이 이보다 짧은 섹션은 다음 섹션과 합침
+min_chunk_chars = 50  # 이보다 짧은 청크는 버림
+index_path = "faiss_index"
+# 청크 분할 방식이 바뀌면 올려서 기존 청크 ID를 모두 새로 만들게 함
+chunking_version = "section-400-60-v1"
+
+
+def get_pdf_text(
+    pdf_docs, progress: Optional[ProgressCallback] = None
+) -> Iterator[Document]:
+    """PDF 페이지를 병렬로 추출/정리하여 블록 단위 Document 스트림으로 반환
+
+    metadata 의 heading_rank 가 0 이 아니면 제목 블록이다 (클수록 상위 제목).
+    """
+    for source, page_number, blocks in iter_pdf_pages(pdf_docs, progress):
+        for heading_rank, text in blocks:
+            yield Document(
+                page_content=text,
+                metadata={
+                    "source": source,
+                    "page": page_number,
+                    "heading_rank": heading_rank,
+                },
+            )
 
 
-def clean_pdf_text(text):
-    """PDF 텍스트를 더 정교하게 정리하는 함수"""
-
-    # 1. 페이지 번호, 헤더/푸터 패턴 제거
-    text = re.sub(r"\n\s*\d+\s*\n", "\n", text)  # 페이지 번호
-    text = re.sub(r"\n\s*-\s*\d+\s*-\s*\n", "\n", text)  # -1- 형태 페이지 번호
-
-    # 2. 불필요한 공백 문자 정리
-    text = re.sub(r"\xa0", " ", text)  # non-breaking space
-    text = re.sub(r"\u2000-\u200f", " ", text)  # 각종 공백 문자
-
-    # 3. 하이픈으로 연결된 단어 처리 (한글의 경우)
-    text = re.sub(r"(\S)-\n(\S)", r"\1\2", text)
-
-    # 4. 문장 끝이 아닌 줄바꿈을 공백으로 치환
-    # 한글 문장부호도 고려: ., !, ?, …, 다, 음, 임 등
-    text = re.sub(r"(?<![.!?…다음임])\n(?=[가-힣A-Za-z])", " ", text)
-
-    # 5. 여러 줄바꿈을 하나로 통합
-    text = re.sub(r"\n{2,}", "\n\n", text)
-
-    # 6. 여러 공백을 하나로 통합
-    text = re.sub(r" {2,}", " ", text)
-
-    return text.strip()
-
-
-def get_pdf_text(pdf_docs) -> List[Document]:
-    documents: List[Document] = []
-    for pdf in pdf_docs:
-        full_text = ""
-        pdf.seek(0)  # 파일 포인터를 처음으로 이동
-        with fitz.open(stream=pdf.read(), filetype="pdf") as doc:
-            for page_num in range(doc.page_count):
-                page = doc[page_num]
-                full_text += page.get_text()  # type: ignore
-
-        cleaned_text = clean_pdf_text(full_text)
-        document = Document(page_content=cleaned_text, metadata={"source": pdf.name})
-        documents.append(document)
-    return documents
-
-
-def get_text_chunks(documents: List[Document]) -> List[Document]:
+def get_text_chunks(documents: Iterable[Document]) -> List[Document]:
+    """제목 계층을 경계로, 섹션 안에서는 추정 토큰 수 기준으로 청크를 나누는 함수"""
     splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len,
+        chunk_size=chunk_tokens,
+        chunk_overlap=chunk_overlap_tokens,
+        length_function=estimate_tokens,
         separators=[
             "\n\n",  # 문단 구분
             "\n",  # 줄바꿈
@@ -78,57 +89,237 @@ def get_text_chunks(documents: List[Document]) -> List[Document]:
         is_separator_regex=False,
     )
 
-    chunks = splitter.split_documents(documents)
+    chunk_count = 0
+    filtered_chunks: List[Document] = []
+    for chunk in chunk_sections(
+        documents, splitter, estimate_tokens, min_section_tokens, stream_window_chars
+    ):
+        chunk_count += 1
+        # 너무 짧은 청크는 제거
+        if len(chunk.page_content.strip()) >= min_chunk_chars:
+            filtered_chunks.append(chunk)
+
+    print(f"전체 청크 수: {chunk_count}")
+    print(f"필터링 후 청크 수: {len(filtered_chunks)}")
+    return filtered_chunks
 
-    # 너무 짧은 청크는 제거 (50자 미만)
-    filtered_chunks = [
-        chunk for chunk in chunks if len(chunk.page_content.strip()) >= 50
-    ]
 
-    print(f"전체 청크 수: {len(chunks)}")
-    print(f"필터링 후 청크 수: {len(filtered_chunks)}")
-    print(
-        f"청크 크기 - 최대: {max(len(chunk.page_content) for chunk in filtered_chunks)}"
+def get_embeddings() -> CachedEmbeddings:
+    """변환기에서 사용할 (캐시된) 임베딩 객체"""
+    # 청크는 400 토큰 안팎이라 모델의 입력 길이 한도(8191 토큰)를 넘지 않으므로
+    # 클라이언트 쪽 tiktoken 토큰화/분할 검사는 생략하고 원문 그대로 보낸다.
+    embeddings = OpenAIEmbeddings(
+        model=embedding_model, check_embedding_ctx_length=False
     )
+    return CachedEmbeddings(embeddings, model_name=embedding_model)
+
+
+def plan_incremental_build(
+    pdf_docs, keep_missing: bool = False, index_dir: Optional[str] = None
+) -> Dict[str, list]:
+    """업로드된 파일을 기존 manifest와 비교해 다시 읽어야 할 파일을 고르는 함수
+
+    index_dir 을 주지 않으면 index_path 의 벡터DB와 비교한다.
+    반환값: {"changed": 새로 읽을 파일, "unchanged": 그대로 둘 파일 이름,
+    "removed": 인덱스에서 지울 파일 이름}
+    """
+    manifest = load_manifest(index_dir or index_path)
+    if not is_compatible(manifest, embedding_model, chunking_version):
+        manifest = None
+    known_files = manifest["files"] if manifest else {}
+
+    plan: Dict[str, list] = {"changed": [], "unchanged": [], "removed": []}
+    uploaded_names = set()
+    for pdf in pdf_docs:
+        name = _source_name(pdf)
+        uploaded_names.add(name)
+        entry = known_files.get(name)
+        if entry is not None and entry["sha256"] == file_sha256(pdf):
+            plan["unchanged"].append(name)
+        else:
+            plan["changed"].append(pdf)
+
+    if not keep_missing:
+        plan["removed"] = [name for name in known_files if name not in uploaded_names]
+
     print(
-        f"청크 크기 - 최소: {min(len(chunk.page_content) for chunk in filtered_chunks)}"
+        f"증분 빌드 계획 - 변경/추가: {len(plan['changed'])}, "
+        f"유지: {len(plan['unchanged'])}, 삭제: {len(plan['removed'])}"
+    )
+    return plan
+
+
+def _source_name(pdf) -> str:
+    if isinstance(pdf, (str, os.PathLike)):
+        return os.path.basename(os.fspath(pdf))
+    return pdf.name
+
+
+# get embeddings for each chunk and save to FAISS
+def get_vector_store(
+    chunks,
+    progress: Optional[EmbeddingProgressCallback] = None,
+    file_hashes: Optional[Dict[str, str]] = None,
+    removed_sources: Iterable[str] = (),
+    index_config: Optional[IndexConfig] = None,
+    index_dir: Optional[str] = None,
+) -> bool:
+    """청크를 임베딩해 벡터DB를 만들거나 기존 벡터DB를 증분 갱신하는 함수
+
+    chunks 에 포함된 파일은 새 청크 목록으로 교체하고(내용이 같은 청크는 기존 벡터를
+    그대로 사용), removed_sources 의 청크는 삭제하며, 나머지 파일은 그대로 둔다.
+    index_dir 을 주지 않으면 index_path 에 저장한다. 벡터DB를 저장했으면 True,
+    저장할 청크가 없으면 False 를 반환하고, 저장 중 오류는 호출한 쪽으로 전달한다.
+    """
+    index_dir = index_dir or index_path
+    embeddings = get_embeddings()
+
+    manifest = load_manifest(index_dir)
+    vector_store = None
+    if is_compatible(manifest, embedding_model, chunking_version) and (
+        os.path.exists(os.path.join(index_dir, "index.faiss"))
+    ):
+        vector_store = load_faiss_index(index_dir, embeddings, in_memory=True)
+    else:
+        manifest = {
+            "version": manifest_version,
+            "embedding_model": embedding_model,
+            "chunking": chunking_version,
+            "files": {},
+        }
+    files = manifest["files"]
+
+    # 파일별 새 청크 ID
+    chunk_ids = assign_chunk_ids(chunks)
+    new_ids_by_source: Dict[str, List[str]] = {}
+    for chunk, chunk_id in zip(chunks, chunk_ids):
+        new_ids_by_source.setdefault(chunk.metadata["source"], []).append(chunk_id)
+    for source, sha256 in (file_hashes or {}).items():
+        entry = files.get(source)
+        unchanged = entry is not None and entry["sha256"] == sha256
+        new_ids_by_source.setdefault(
+            source, entry["chunk_ids"] if unchanged else []
+        )
+
+    # 삭제할 청크: 제거된 파일의 청크 + 변경된 파일에서 사라진 청크
+    stale_ids = set()
+    for source in removed_sources:
+        stale_ids.update(files.pop(source, {}).get("chunk_ids", []))
+    for source, ids in new_ids_by_source.items():
+        stale_ids.update(set(files.get(source, {}).get("chunk_ids", [])) - set(ids))
+
+    existing_ids = (
+        set(vector_store.index_to_docstore_id.values()) if vector_store else set()
     )
+    stale_ids &= existing_ids
+    if stale_ids:
+        vector_store.delete(list(stale_ids))
+
+    # 새로 임베딩할 청크: 인덱스에 아직 없는 ID만
+    new_chunks = []
+    new_chunk_ids = []
+    for chunk, chunk_id in zip(chunks, chunk_ids):
+        if chunk_id not in existing_ids and chunk_id not in new_chunk_ids:
+            new_chunks.append(chunk)
+            new_chunk_ids.append(chunk_id)
     print(
-        f"청크 크기 - 평균: {sum(len(chunk.page_content) for chunk in filtered_chunks) // len(filtered_chunks)}"
+        f"청크 {len(chunks)}개 중 새로 임베딩할 청크: {len(new_chunks)}개, "
+        f"삭제할 청크: {len(stale_ids)}개"
     )
 
-    return filtered_chunks
+    texts = [chunk.page_content for chunk in new_chunks]
 
+    # 여러 배치를 동시에 임베딩한 뒤 하나의 FAISS 인덱스로 합침
+    # (섹션 경로를 붙여 임베딩하고, 저장하는 본문에는 붙이지 않음)
+    vectors = embed_texts_concurrently(
+        embeddings, [embedding_text(chunk) for chunk in new_chunks], progress=progress
+    )
 
-# get embeddings for each chunk and save to FAISS
-def get_vector_store(chunks):
-    try:
-        embeddings = OpenAIEmbeddings(model=embedding_model)
-        vector_store = None
-        batch_size = 100  # 한 번에 처리할 청크 수 (조정 가능)
-
-        for i in range(0, len(chunks), batch_size):
-            batch_chunks = chunks[i : i + batch_size]
-            print(
-                f"Processing batch {i // batch_size + 1}/{(len(chunks) + batch_size - 1) // batch_size} with {len(batch_chunks)} chunks..."
+    if vectors:
+        text_embeddings = list(zip(texts, vectors))
+        metadatas = [chunk.metadata for chunk in new_chunks]
+        if vector_store is None:
+            vector_store = FAISS.from_embeddings(
+                text_embeddings,
+                embedding=embeddings,
+                metadatas=metadatas,
+                ids=new_chunk_ids,
             )
-            if vector_store is None:
-                vector_store = FAISS.from_documents(batch_chunks, embedding=embeddings)
-            else:
-                vector_store.add_documents(batch_chunks)
-
-        if vector_store:
-            vector_store.save_local("faiss_index")
-            st.session_state.faiss_index_created = True
-            print("FAISS 벡터DB가 성공적으로 생성 및 저장되었습니다.")
         else:
-            st.error("처리할 청크가 없어 FAISS 벡터DB를 생성할 수 없습니다.")
-            st.session_state.faiss_index_created = False
+            vector_store.add_embeddings(
+                text_embeddings, metadatas=metadatas, ids=new_chunk_ids
+            )
 
-    except Exception as e:
-        st.error(f"FAISS 벡터DB 생성 및 저장 중 오류 발생: {e}")
-        print(f"FAISS 벡터DB 생성 및 저장 중 오류 발생: {e}")
-        st.session_state.faiss_index_created = False
+    if vector_store and vector_store.index.ntotal > 0:
+        save_faiss_index(vector_store, index_dir)
+        # 설정한 종류(IVF/PQ/HNSW)의 검색용 인덱스로 index.faiss 교체
+        save_search_index(vector_store.index, index_dir, index_config)
+        # 하이브리드 검색용 키워드 역색인 (FAISS 행 순서와 동일)
+        build_sparse_index_from_store(vector_store).save(index_dir)
+        for source, ids in new_ids_by_source.items():
+            files[source] = {
+                "sha256": (file_hashes or {}).get(source, ""),
+                "chunk_ids": ids,
+            }
+        save_manifest(index_dir, manifest)
+        # 챗봇 사이드바/점검 화면이 벡터를 읽지 않고 쓰는 문서 목록과 통계
+        save_catalog(
+            index_dir,
+            build_catalog(
+                index_dir,
+                (
+                    row_document(vector_store, row)
+                    for row in range(vector_store.index.ntotal)
+                ),
+                vector_store.index.d,
+                embedding_model,
+                chunking_version,
+            ),
+        )
+        print("FAISS 벡터DB가 성공적으로 생성 및 저장되었습니다.")
+        print(f"임베딩 캐시: {embeddings.stats()}")
+        return True
+
+    print("처리할 청크가 없어 FAISS 벡터DB를 생성할 수 없습니다.")
+    return False
+
+
+def build_uploaded_index(
+    pdf_docs, keep_missing: bool, index_config: IndexConfig, index_dir: str
+) -> bool:
+    """업로드된 PDF로 index_dir 의 벡터DB를 증분 갱신하며 진행 상황을 화면에 표시하는 함수"""
+    # 내용이 바뀌지 않은 파일은 다시 읽거나 임베딩하지 않음
+    plan = plan_incremental_build(pdf_docs, keep_missing, index_dir)
+    file_hashes = {_source_name(pdf): file_sha256(pdf) for pdf in pdf_docs}
+    if plan["unchanged"]:
+        st.info(f"변경되지 않은 문서 {len(plan['unchanged'])}개는 건너뜁니다.")
+    progress_bar = st.progress(0.0, text="PDF 텍스트를 읽는 중...")
+
+    def show_progress(source, done_pages, total_pages, file_index, file_count):
+        progress_bar.progress(
+            (file_index + done_pages / max(total_pages, 1)) / file_count,
+            text=f"[{file_index + 1}/{file_count}] {source} ({done_pages}/{total_pages}쪽)",
+        )
+
+    # 페이지 추출과 청크 분할이 스트림으로 함께 진행됨
+    with st.spinner("PDF 텍스트를 읽고 청크로 분할하는 중..."):
+        text_chunks = get_text_chunks(get_pdf_text(plan["changed"], show_progress))
+    progress_bar.empty()
+    embed_bar = st.progress(0.0, text="청크를 임베딩하는 중...")
+    try:
+        with st.spinner("벡터DB를 생성 및 저장하는 중..."):
+            return get_vector_store(
+                text_chunks,
+                lambda done, total: embed_bar.progress(
+                    done / max(total, 1), text=f"임베딩 {done}/{total}"
+                ),
+                file_hashes=file_hashes,
+                removed_sources=plan["removed"],
+                index_config=index_config,
+                index_dir=index_dir,
+            )
+    finally:
+        embed_bar.empty()
 
 
 def main():
@@ -141,20 +332,51 @@ def main():
         "PDF 파일을 업로드하고 '변환 및 저장' 버튼을 클릭하세요",
         accept_multiple_files=True,
     )
+    keep_missing = st.checkbox(
+        "업로드하지 않은 기존 문서는 벡터DB에 그대로 유지",
+        help="선택하지 않으면 벡터DB는 이번에 업로드한 파일들로만 구성됩니다.",
+    )
+    with st.expander("검색 인덱스 설정 (대규모 문서용)"):
+        kind = st.selectbox(
+            "인덱스 종류",
+            index_kinds,
+            help="flat: 정확한 검색, ivf_flat/ivf_pq: 클러스터 기반 근사 검색(pq는 압축), hnsw: 그래프 기반 근사 검색",
+        )
+        index_config: IndexConfig = {
+            "kind": kind,
+            "nprobe": st.number_input("nprobe (IVF)", 1, 1024, default_index_config["nprobe"]),
+            "ef_search": st.number_input("efSearch (HNSW)", 8, 2048, default_index_config["ef_search"]),
+            "pca_dim": st.number_input("PCA 차원 축소 (0: 사용 안 함)", 0, 3072, 0, step=64),
+        }
+        st.caption("recall@k/지연시간 비교: python converter/index_builder.py faiss_index")
+
     if st.button("변환 및 저장"):
         if pdf_docs:
             print("\n".join(map(lambda x: x.name, pdf_docs)))
-            with st.spinner("PDF 텍스트를 읽는 중..."):
-                documents = get_pdf_text(pdf_docs)
-            with st.spinner("텍스트를 청크로 분할하는 중..."):
-                text_chunks = get_text_chunks(documents)
-            with st.spinner("벡터DB를 생성 및 저장하는 중..."):
-                get_vector_store(text_chunks)
-            st.success("FAISS 벡터DB가 성공적으로 생성 및 저장되었습니다!")
-            st.info("이제 채팅 앱에서 이 데이터를 사용할 수 있습니다.")
+            # 챗봇이 읽는 벡터DB는 그대로 두고 복사본에서 빌드한 뒤 한 번에 교체
+            # (명령줄 빌드와 같은 잠금/임시 폴더/교체 방식)
+            saved = None
+            try:
+                with index_lock(index_path), staged_index_dir(index_path) as staging_dir:
+                    saved = build_uploaded_index(
+                        pdf_docs, keep_missing, index_config, staging_dir
+                    )
+                    if saved:
+                        swap_index_dir(staging_dir, index_path)
+            except IndexLocked:
+                st.error("다른 빌드가 실행 중입니다. 잠시 뒤 다시 시도해주세요.")
+            except Exception as e:
+                st.error(f"FAISS 벡터DB 생성 및 저장 중 오류 발생: {e}")
+                print(f"FAISS 벡터DB 생성 및 저장 중 오류 발생: {e}")
+                saved = None
+            st.session_state.faiss_index_created = bool(saved)
+            if saved:
+                st.success("FAISS 벡터DB가 성공적으로 생성 및 저장되었습니다!")
+                st.info("이제 채팅 앱에서 이 데이터를 사용할 수 있습니다.")
+            elif saved is False:
+                st.error("처리할 청크가 없어 FAISS 벡터DB를 생성할 수 없습니다.")
         else:
             st.warning("PDF 파일을 먼저 업로드해주세요.")
 
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,208 @@
+"""PDF 페이지를 여러 프로세스에서 병렬로 추출/정리하는 모듈
+
+페이지는 PyMuPDF 블록의 글꼴 크기/굵기로 제목과 본문을 구분한 블록 목록으로 만든다.
+작업 프로세스에서 import 되어야 하므로 streamlit 등 무거운 의존성을 두지 않는다.
+"""
+
+import os
+import re
+import tempfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import fitz
+
+pdf_workers = max(1, (os.cpu_count() or 2) - 1)
+pages_per_task = 16  # 작업 하나가 처리할 페이지 수
+max_pending_tasks = pdf_workers * 2  # 동시에 결과를 들고 있을 작업 수 (메모리 상한)
+
+# (파일 이름, 처리한 페이지 수, 전체 페이지 수, 파일 번호, 전체 파일 수)
+ProgressCallback = Callable[[str, int, int, int, int], None]
+# (제목 등급, 텍스트): 등급이 0 이면 본문, 클수록 상위 제목 (글꼴 크기 + 굵은 글씨 가산)
+PageBlock = Tuple[float, str]
+
+heading_size_ratio = 1.15  # 본문 글꼴보다 이 비율 이상 크면 제목
+heading_max_chars = 80  # 이보다 긴 블록은 글꼴과 관계없이 본문
+page_margin_ratio = 0.05  # 페이지 위/아래 이 비율 안의 블록(머리글/바닥글)은 제목으로 보지 않음
+
+
+# clean_pdf_text 가 쓰는 정규식은 모듈을 읽을 때 한 번만 컴파일한다.
+# 원래 순서(1~6단계)와 패턴은 그대로 두고, 바꿀 문자가 없는 단계는 건너뛴다.
+_page_number_re = re.compile(r"\n\s*\d+\s*\n")
+_dash_page_number_re = re.compile(r"\n\s*-\s*\d+\s*-\s*\n")
+_hyphen_break_re = re.compile(r"(\S)-\n(\S)")
+# 원래 패턴 (?<![.!?…다음임])\n(?=...) 과 같은 조건이지만 줄바꿈 문자로 시작해
+# 정규식 엔진이 줄바꿈 위치로 바로 건너뛸 수 있다
+_soft_newline_re = re.compile(r"\n(?<![.!?…다음임]\n)(?=[가-힣A-Za-z])")
+_blank_lines_re = re.compile(r"\n{2,}")
+_spaces_re = re.compile(r" {2,}")
+
+
+def clean_pdf_text(text):
+    """PDF 텍스트를 더 정교하게 정리하는 함수"""
+
+    # 1. 페이지 번호, 헤더/푸터 패턴 제거
+    text = _page_number_re.sub("\n", text)  # 페이지 번호
+    if "-" in text:
+        text = _dash_page_number_re.sub("\n", text)  # -1- 형태 페이지 번호
+
+    # 2. 불필요한 공백 문자 정리
+    text = text.replace("\xa0", " ")  # non-breaking space
+    # 원래 정규식 r"\u2000-\u200f" 는 범위가 아니라 세 글자 문자열과 일치했으므로 그대로 유지
+    text = text.replace("\u2000-\u200f", " ")  # 각종 공백 문자
+
+    # 3. 하이픈으로 연결된 단어 처리 (한글의 경우)
+    if "-\n" in text:
+        text = _hyphen_break_re.sub(r"\1\2", text)
+
+    # 4. 문장 끝이 아닌 줄바꿈을 공백으로 치환
+    # 한글 문장부호도 고려: ., !, ?, …, 다, 음, 임 등
+    text = _soft_newline_re.sub(" ", text)
+
+    # 5. 여러 줄바꿈을 하나로 통합
+    if "\n\n" in text:
+        text = _blank_lines_re.sub("\n\n", text)
+
+    # 6. 여러 공백을 하나로 통합
+    if "  " in text:
+        text = _spaces_re.sub(" ", text)
+
+    return text.strip()
+
+
+_bold_flag = 16
+_sentence_end_re = re.compile(r"[.!?…다음임]$")
+_page_number_only_re = re.compile(r"^[\s\-–\d]*$")
+_page_number_block_re = re.compile(r"^[\-–]?\s*\d+\s*[\-–]?$")  # "3", "- 3 -", "-3-"
+_dot_leader_re = re.compile(r"(?:\.\s?){4,}|·{3,}|…{2,}")  # 목차 항목의 점선
+
+
+def _heading_rank(spans: List[dict], text: str, body_size: float) -> float:
+    """블록이 제목이면 등급(글꼴 크기, 굵으면 +0.5), 아니면 0"""
+    if len(text) > heading_max_chars or _sentence_end_re.search(text):
+        return 0.0
+    if _page_number_only_re.match(text) or _dot_leader_re.search(text):
+        return 0.0
+    size = max(span["size"] for span in spans)
+    bold = all(span["flags"] & _bold_flag for span in spans if span["text"].strip())
+    if size >= body_size * heading_size_ratio or (bold and size >= body_size):
+        return round(size, 1) + (0.5 if bold else 0.0)
+    return 0.0
+
+
+def extract_page_blocks(page: "fitz.Page") -> List[PageBlock]:
+    """페이지를 읽는 순서대로 제목 블록과 (연속된 블록을 모아 정리한) 본문 블록으로 나눔
+
+    본문은 예전처럼 페이지 텍스트와 같은 형태(줄마다 줄바꿈)로 이어 붙인 뒤
+    clean_pdf_text 로 정리하므로 제목 줄을 빼면 정리 결과가 같다.
+    """
+    raw_blocks = []
+    size_chars: Counter = Counter()
+    for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+        lines = block.get("lines", [])
+        spans = [span for line in lines for span in line["spans"]]
+        if not spans:
+            continue
+        text = "".join(
+            "".join(span["text"] for span in line["spans"]) + "\n" for line in lines
+        )
+        raw_blocks.append((block["bbox"], spans, text))
+        for span in spans:
+            size_chars[round(span["size"], 1)] += len(span["text"].strip())
+    if not raw_blocks:
+        return []
+
+    # 글자 수가 가장 많은 글꼴 크기를 이 페이지의 본문 크기로 봄
+    body_size = size_chars.most_common(1)[0][0]
+    top = page.rect.height * page_margin_ratio
+    bottom = page.rect.height * (1 - page_margin_ratio)
+
+    blocks: List[PageBlock] = []
+    body: List[str] = []
+
+    def flush_body():
+        text = clean_pdf_text("".join(body))
+        body.clear()
+        if text:
+            blocks.append((0.0, text))
+
+    last = len(raw_blocks) - 1
+    for i, ((_, y0, _, y1), spans, text) in enumerate(raw_blocks):
+        stripped = " ".join(text.split())
+        in_margin = y1 <= top or y0 >= bottom
+        # 페이지 번호만 있는 머리글/바닥글 블록은 버림 (clean_pdf_text 의 페이지 번호
+        # 패턴은 앞에 줄바꿈이 있어야 하므로 페이지 맨 앞의 번호를 지우지 못함)
+        if _page_number_block_re.match(stripped) and (in_margin or i in (0, last)):
+            continue
+        rank = 0.0 if in_margin else _heading_rank(spans, stripped, body_size)
+        if rank:
+            flush_body()
+            blocks.append((rank, stripped))
+        else:
+            body.append(text)
+    flush_body()
+    return blocks
+
+
+def extract_pages(path: str, start: int, end: int) -> List[List[PageBlock]]:
+    """(작업 프로세스) PDF의 start~end-1 페이지를 읽어 페이지별 블록 목록을 반환"""
+    with fitz.open(path) as doc:
+        return [extract_page_blocks(doc[i]) for i in range(start, end)]
+
+
+def _materialize(pdf, temp_dir: str) -> Tuple[str, str]:
+    """업로드 파일이나 경로를 (파일 이름, 디스크 경로)로 바꾸는 함수
+
+    작업 프로세스에 바이트를 통째로 넘기지 않도록 업로드 파일은 임시 파일로 한 번만 쓴다.
+    """
+    if isinstance(pdf, (str, os.PathLike)):
+        path = os.fspath(pdf)
+        return os.path.basename(path), path
+
+    path = os.path.join(temp_dir, f"{len(os.listdir(temp_dir))}.pdf")
+    pdf.seek(0)  # 파일 포인터를 처음으로 이동
+    with open(path, "wb") as f:
+        f.write(pdf.getbuffer() if hasattr(pdf, "getbuffer") else pdf.read())
+    return pdf.name, path
+
+
+def iter_pdf_pages(
+    pdf_docs: Iterable, progress: Optional[ProgressCallback] = None
+) -> Iterator[Tuple[str, int, List[PageBlock]]]:
+    """PDF들의 페이지를 (파일 이름, 페이지 번호(1부터), 블록 목록) 순서대로 내보내는 함수
+
+    페이지 추출과 정리는 프로세스 풀에서 병렬로 하고, 결과는 파일/페이지 순서를 지켜
+    스트림으로 내보낸다. 동시에 메모리에 있는 결과는 max_pending_tasks 개로 제한된다.
+    """
+    pdf_docs = list(pdf_docs)
+    with tempfile.TemporaryDirectory(prefix="pdf_ingest_") as temp_dir:
+        files = []
+        for pdf in pdf_docs:
+            name, path = _materialize(pdf, temp_dir)
+            with fitz.open(path) as doc:
+                files.append((name, path, doc.page_count))
+
+        def tasks():
+            for file_index, (name, path, page_count) in enumerate(files):
+                for start in range(0, page_count, pages_per_task):
+                    end = min(start + pages_per_task, page_count)
+                    yield file_index, name, path, start, end, page_count
+
+        with ProcessPoolExecutor(max_workers=pdf_workers) as executor:
+            pending = deque()
+
+            def drain_one():
+                (file_index, name, _, start, end, page_count), future = pending.popleft()
+                for offset, blocks in enumerate(future.result()):
+                    yield name, start + offset + 1, blocks
+                if progress is not None:
+                    progress(name, end, page_count, file_index, len(files))
+
+            for task in tasks():
+                _, _, path, start, end, _ = task
+                pending.append((task, executor.submit(extract_pages, path, start, end)))
+                if len(pending) >= max_pending_tasks:
+                    yield from drain_one()
+            while pending:
+                yield from drain_one()
@@ -0,0 +1,136 @@
+"""제목 계층(섹션)을 경계로 청크를 나누고 페이지/섹션 정보를 남기는 모듈
+
+get_pdf_text 가 내보내는 블록 단위 Document(제목 등급 heading_rank 포함)를 받아
+섹션마다 본문을 모은 뒤 토큰 수 기준으로 분할한다. 청크는 섹션 경계를 넘지 않으며
+metadata 에 시작 페이지(page), 끝 페이지(page_end, 다를 때만), 섹션 경로(section)를 갖는다.
+"""
+
+from bisect import bisect_right
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+section_separator = " > "
+
+
+def section_path(headings: List[Tuple[float, str]]) -> str:
+    return section_separator.join(text for _, text in headings)
+
+
+def embedding_text(chunk: Document) -> str:
+    """임베딩할 텍스트 (섹션 경로를 앞에 붙여 제목의 단어로도 찾을 수 있게 함)"""
+    section = chunk.metadata.get("section")
+    return f"{section}\n{chunk.page_content}" if section else chunk.page_content
+
+
+class _Section:
+    """청크로 나누기 전까지 모아 둔 한 섹션의 본문 조각 [(페이지, 텍스트)]"""
+
+    def __init__(self, section: str):
+        self.section = section
+        self.parts: List[Tuple[int, str]] = []
+        self.chars = 0
+
+    def add(self, page: int, text: str):
+        self.parts.append((page, text))
+        self.chars += len(text) + 1
+
+    def split(
+        self, source: str, splitter: RecursiveCharacterTextSplitter, final: bool
+    ) -> Iterator[Document]:
+        """본문을 분할해 청크를 내보냄, final 이 아니면 마지막 조각은 다음 본문과 이어 다시 나눔"""
+        text = "\n".join(part for _, part in self.parts)
+        starts, pages = [], []
+        offset = 0
+        for page, part in self.parts:
+            starts.append(offset)
+            pages.append(page)
+            offset += len(part) + 1
+
+        def page_at(position: int) -> int:
+            return pages[bisect_right(starts, position) - 1]
+
+        pieces = splitter.split_text(text)
+        if not final:
+            if len(pieces) < 2:
+                return
+            pieces, carry = pieces[:-1], pieces[-1]
+
+        search_from = 0
+        for piece in pieces:
+            start = text.find(piece, search_from)
+            if start == -1:
+                start = max(0, text.find(piece))
+            search_from = start + 1
+            metadata = {"source": source, "page": page_at(start), "section": self.section}
+            page_end = page_at(start + len(piece) - 1)
+            if page_end != metadata["page"]:
+                metadata["page_end"] = page_end
+            yield Document(page_content=piece, metadata=metadata)
+
+        if final:
+            self.parts, self.chars = [], 0
+            return
+        # 남긴 조각이 걸친 본문 조각만 (페이지 정보와 함께) 남김
+        carry_start = text.find(carry, search_from)
+        if carry_start == -1:
+            carry_start = text.rfind(carry)
+        self.parts = [
+            (page, part[max(0, carry_start - start) :])
+            for (page, part), start in zip(self.parts, starts)
+            if start + len(part) > carry_start
+        ]
+        self.chars = sum(len(part) + 1 for _, part in self.parts)
+
+
+def chunk_sections(
+    blocks: Iterable[Document],
+    splitter: RecursiveCharacterTextSplitter,
+    length_function: Callable[[str], int],
+    min_section_tokens: int,
+    window_chars: int,
+) -> Iterator[Document]:
+    """블록 Document 스트림을 섹션 경계와 토큰 길이에 맞춰 청크로 나누는 함수
+
+    본문이 min_section_tokens 보다 짧은 섹션은 따로 청크를 만들지 않고 다음 제목을
+    한 줄로 넣어 이어지는 섹션과 합친다. 한 섹션의 본문이 window_chars 를 넘으면
+    파일 전체를 메모리에 모으지 않도록 그때까지의 본문을 먼저 분할한다.
+    """
+    source = None
+    headings: List[Tuple[float, str]] = []
+    current = _Section("")
+
+    def body_tokens() -> int:
+        return sum(length_function(part) for _, part in current.parts)
+
+    for block in blocks:
+        block_source = block.metadata["source"]
+        if block_source != source:
+            if source is not None:
+                yield from current.split(source, splitter, final=True)
+            source, headings, current = block_source, [], _Section("")
+
+        rank = block.metadata.get("heading_rank", 0)
+        page = block.metadata["page"]
+        if rank:
+            while headings and headings[-1][0] <= rank:
+                headings.pop()
+            headings.append((rank, block.page_content))
+            if not current.parts:
+                current.section = section_path(headings)
+            elif body_tokens() < min_section_tokens:
+                current.add(page, block.page_content)
+            else:
+                yield from current.split(source, splitter, final=True)
+                current = _Section(section_path(headings))
+            continue
+
+        if not current.parts:
+            current.section = section_path(headings)
+        current.add(page, block.page_content)
+        if current.chars >= window_chars:
+            yield from current.split(source, splitter, final=False)
+
+    if source is not None:
+        yield from current.split(source, splitter, final=True)
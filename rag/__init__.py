@@ -0,0 +1 @@
+"""챗봇 앱과 변환기가 함께 사용하는 검색(RAG) 보조 모듈"""
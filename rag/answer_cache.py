@@ -0,0 +1,107 @@
+"""질문 임베딩이 충분히 가까우면 이전 답변을 재사용하는 의미 기반 답변 캐시"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """코사인 거리 기준으로 답변을 찾는 TTL/LRU 캐시
+
+    인덱스 버전이 바뀌면(벡터DB 재생성) 저장된 답변을 모두 버린다.
+    """
+
+    def __init__(
+        self,
+        max_distance: float = 0.05,
+        ttl_seconds: float = 60 * 60 * 24,
+        max_items: int = 512,
+    ):
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[int] = []
+        self._next_key = 0
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm > 0 else array
+
+    def _check_version(self, version: str):
+        if self._version != version:
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _expire(self):
+        deadline = time.time() - self.ttl_seconds
+        expired = [k for k, e in self._entries.items() if e["created_at"] < deadline]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def lookup(
+        self, query_vector: Sequence[float], version: str
+    ) -> Optional[Dict[str, Any]]:
+        """가장 가까운 캐시 답변이 max_distance 이내이면 그 복사본을 반환"""
+        query = self._normalize(query_vector)
+        with self._lock:
+            self._check_version(version)
+            self._expire()
+            if not self._entries:
+                self._counters["misses"] += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries.keys())
+                self._matrix = np.stack(
+                    [self._entries[k]["vector"] for k in self._matrix_keys]
+                )
+
+            distances = 1.0 - self._matrix @ query
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                self._counters["misses"] += 1
+                return None
+
+            key = self._matrix_keys[best]
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return copy.deepcopy(self._entries[key]["response"])
+
+    def store(
+        self, query_vector: Sequence[float], version: str, response: Dict[str, Any]
+    ):
+        with self._lock:
+            self._check_version(version)
+            self._entries[self._next_key] = {
+                "vector": self._normalize(query_vector),
+                "response": copy.deepcopy(response),
+                "created_at": time.time(),
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "items": len(self._entries)}
@@ -0,0 +1,191 @@
+"""세션별 대화 기록을 크기 제한 안에서 관리하고 후속 질문을 이전 질문과 이어 주는 모듈
+
+- 화면에 표시할 메시지는 max_messages 개까지만 보관하고, 화면에는 최근 것부터 쪽 단위로 보여준다.
+- 최근 질문 max_turns 개는 핵심어와 질문 임베딩을 함께 저장하고, 그보다 오래된 질문은
+  핵심어만 남긴 한 줄 요약(summary_max_chars 이내)으로 줄인다.
+- "그럼 금액은요?" 같은 후속 질문은 저장해 둔 직전 질문의 임베딩과 섞은 벡터, 직전 질문의
+  핵심어를 붙인 검색어로 함께 검색하므로 이전 대화를 다시 임베딩하거나 LLM 으로 질문을
+  다시 쓰는 추가 요청이 없다.
+"""
+
+import re
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence, TypedDict
+
+import numpy as np
+
+Message = Dict[str, str]
+
+# 앞 질문을 가리키는 말로 시작하는 질문
+# - 앞 대화를 전제로 하는 접속어: "그럼 신청 기간은?"
+# - 조사가 붙은 지시대명사: "그건 누가 받나요?", "거기서도 되나요?"
+# - 지시 관형사 + 의존 명사: "그 경우에는?", "이때도 같나요?"
+# ("그 학교", "해당 부서", "위생 점검"처럼 지시어로 시작해도 혼자 완결된 질문은 제외)
+_follow_up_start_re = re.compile(
+    r"^(?:(?:그럼|그러면|그렇다면)(?:\s|$|[?,.])"
+    r"|(?:그것|이것|저것|그거|이거|저거|거기)"
+    r"(?:은|는|이|가|을|를|도|만|에|에도|에서|에서도|으로|로|의|서|서도)?(?:\s|$|[?,.])"
+    r"|(?:그건|이건|저건|그게|이게|저게|그걸|이걸)(?:\s|$|[?,.])"
+    r"|(?:(?:그|이|저)\s(?:경우|때|중|외|밖|다음|전|후)|그때|이때|그중|그외|그다음|그전|그후)"
+    r"(?:에|에는|에도|에서|은|는|도|엔)?(?:\s|$|[?,.]))"
+)
+# 주어만 남기고 서술어를 생략한 질문, 예: "금액은요?", "신청 기간도요?"
+# ("얼마인가요?" 처럼 서술어로 끝나는 긴 질문과 구분하려고 짧은 질문에만 적용하고,
+# 조사 "가"는 받침 없는 글자 뒤에만 오므로 "다른가요", "가능한가요"는 제외)
+_open_syllables = "".join(chr(0xAC00 + i * 28) for i in range(19 * 21))
+_elliptical_end_re = re.compile(
+    rf"(?:은|는|이|(?<=[{_open_syllables}])가|도|만|의|에|에서|으로|로)요\s*\??$"
+)
+# 명사 없이 의문사만 남은 질문, 예: "왜요?", "언제까지요?"
+_bare_question_re = re.compile(
+    r"^(?:왜|언제|언제까지|어디|어디서|얼마|얼마나|누가|누구|어떻게|뭐|무엇|몇)"
+    r"(?:요|인가요|예요|이에요|죠|나요)?\s*\??$"
+)
+_word_re = re.compile(r"[0-9A-Za-z가-힣]+")
+
+
+class Turn(TypedDict):
+    question: str
+    keywords: str  # 검색에 다시 쓸 핵심어 (후속 질문이면 이어받은 주제 포함)
+    vector: Optional[np.ndarray]  # 정규화한 질문 임베딩 (후속 질문이면 섞은 벡터)
+
+
+class FollowUp(TypedDict):
+    question: str  # 직전 질문과 요약을 붙여 LLM 에 보낼 질문
+    search_text: str  # 직전 질문의 핵심어를 붙인 검색어
+    previous_vector: Optional[List[float]]  # 직전 질문의 임베딩 (없으면 search_text 를 임베딩)
+
+
+def normalize_vector(vector: Sequence[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm > 0 else array
+
+
+def blend_vectors(
+    current: Sequence[float], previous: Sequence[float], weight: float
+) -> List[float]:
+    """현재 질문 벡터에 weight, 직전 질문 벡터에 1 - weight 를 준 정규화된 평균"""
+    blended = weight * normalize_vector(current) + (1 - weight) * normalize_vector(previous)
+    return normalize_vector(blended).tolist()
+
+
+def merge_keywords(*texts: str, max_words: int = 12) -> str:
+    """여러 핵심어 문자열을 순서대로 합치고 중복을 뺀 뒤 max_words 개까지 남김"""
+    words: List[str] = []
+    for text in texts:
+        for word in text.split():
+            if word not in words:
+                words.append(word)
+    return " ".join(words[:max_words])
+
+
+class ChatHistory:
+    """한 세션의 메시지, 최근 질문(임베딩 포함), 오래된 질문의 요약"""
+
+    def __init__(
+        self,
+        greeting: str,
+        max_messages: int = 200,
+        max_turns: int = 6,
+        summary_max_chars: int = 300,
+        follow_up_max_words: int = 0,
+    ):
+        self.greeting = greeting
+        self.max_messages = max_messages
+        self.summary_max_chars = summary_max_chars
+        self.follow_up_max_words = follow_up_max_words
+        self.messages: List[Message] = []
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.summary = ""
+        self.dropped_messages = 0  # max_messages 를 넘어 버린 오래된 메시지 수
+        self.clear()
+
+    def clear(self):
+        self.messages = [{"role": "assistant", "content": self.greeting}]
+        self.turns.clear()
+        self.summary = ""
+        self.dropped_messages = 0
+
+    def add_message(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+        overflow = len(self.messages) - self.max_messages
+        if overflow > 0:
+            del self.messages[:overflow]
+            self.dropped_messages += overflow
+
+    def page(self, count: int) -> List[Message]:
+        """화면에 표시할 최근 메시지 count 개"""
+        return self.messages[-count:] if count > 0 else []
+
+    def is_follow_up(self, question: str) -> bool:
+        """앞 질문에 기대는 질문인지 (앞 대화를 가리키는 말로 시작하거나, 서술어를 생략했거나,
+        의문사만 남음)
+
+        follow_up_max_words 가 0보다 크면 그 단어 수 이하의 질문도 모두 후속 질문으로 본다
+        ("출장비" 처럼 한 단어로 새 주제를 묻는 질문까지 포함되므로 기본값은 0, 사용 안 함).
+        """
+        question = question.strip()
+        words = len(_word_re.findall(question))
+        return bool(
+            _follow_up_start_re.match(question)
+            or (words <= 3 and _elliptical_end_re.search(question))
+            or _bare_question_re.match(question)
+            or words <= self.follow_up_max_words
+        )
+
+    def resolve(self, question: str) -> Optional[FollowUp]:
+        """후속 질문이면 직전 질문과 이어 검색/답변할 정보를, 아니면 None 을 반환"""
+        if not self.turns or not self.is_follow_up(question):
+            return None
+        previous = self.turns[-1]
+        lines = []
+        if self.summary:
+            lines.append(f"앞선 대화 주제: {self.summary}")
+        lines.append(f"직전 질문: {previous['question']}")
+        lines.append(f"현재 질문: {question}")
+        return {
+            "question": "\n".join(lines),
+            "search_text": f"{previous['keywords']} {question}".strip(),
+            "previous_vector": (
+                previous["vector"].tolist() if previous["vector"] is not None else None
+            ),
+        }
+
+    def add_turn(
+        self,
+        question: str,
+        keywords: str,
+        vector: Optional[Sequence[float]],
+        follow_up: Optional[FollowUp] = None,
+        follow_up_weight: float = 0.6,
+    ):
+        """답변한 질문을 최근 질문에 추가, 가장 오래된 질문은 핵심어만 요약에 남김
+
+        후속 질문은 직전 질문의 주제(핵심어, 임베딩)를 이어받아 저장하므로 후속 질문이
+        여러 번 이어져도 처음 주제를 따라간다.
+        """
+        if follow_up is not None:
+            previous = self.turns[-1] if self.turns else None
+            if previous is not None:
+                keywords = merge_keywords(keywords, previous["keywords"])
+            if vector is not None and follow_up["previous_vector"] is not None:
+                vector = blend_vectors(vector, follow_up["previous_vector"], follow_up_weight)
+
+        if len(self.turns) == self.turns.maxlen:
+            self._summarize(self.turns[0])
+        self.turns.append(
+            {
+                "question": question,
+                "keywords": keywords,
+                "vector": normalize_vector(vector) if vector is not None else None,
+            }
+        )
+
+    def _summarize(self, turn: Turn):
+        topic = turn["keywords"] or turn["question"]
+        summary = f"{self.summary}, {topic}" if self.summary else topic
+        # 글자 수를 넘으면 오래된 주제부터 버림
+        while len(summary) > self.summary_max_chars and ", " in summary:
+            summary = summary.split(", ", 1)[1]
+        self.summary = summary[-self.summary_max_chars :]
@@ -0,0 +1,300 @@
+"""여러 사용자의 질문을 제공자별 동시 실행 한도와 요청 속도 안에서 처리하는 서비스 계층
+
+- 제공자(임베딩, LLM)마다 동시 실행 수(세마포어)와 분당 요청 수(토큰 버킷)를 제한하고,
+  한도를 넘는 요청은 도착 순서대로 대기열에서 기다린다.
+- 같은 질문이 이미 처리 중이면 새로 처리하지 않고 그 결과를 함께 받는다.
+- 대기열과 한도는 백그라운드 스레드의 asyncio 이벤트 루프에서 관리하며, 실제 검색/생성
+  작업(동기 함수)은 작업 스레드에서 실행된다.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from rag.embedding_cache import normalize_text
+
+# (동시 실행 수, 분당 요청 수)
+ProviderLimits = Dict[str, Tuple[int, float]]
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """제공자가 요청 한도 초과(429)로 거절한 오류인지 확인"""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "resource exhausted" in message or "rate limit" in message
+
+
+class ProviderLimiter:
+    """동시 실행 수와 분당 요청 수를 함께 제한하는 FIFO 대기열 (이벤트 루프 안에서만 사용)"""
+
+    def __init__(self, name: str, max_concurrency: int, requests_per_minute: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate_per_second = requests_per_minute / 60.0
+        self.capacity = float(max(1, max_concurrency))
+        self.active = 0
+        self._tokens = self.capacity
+        self._refilled_at = time.monotonic()
+        self._waiters: Deque[Tuple[str, asyncio.Future]] = deque()
+        self._wake_handle: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._refilled_at) * self.rate_per_second
+        )
+        self._refilled_at = now
+
+    def _wake(self):
+        self._wake_handle = None
+        self._refill()
+        while self._waiters and self.active < self.max_concurrency and self._tokens >= 1:
+            _, future = self._waiters.popleft()
+            if future.done():
+                continue
+            self._tokens -= 1
+            self.active += 1
+            future.set_result(None)
+
+        # 자리는 있는데 토큰이 부족하면 다음 토큰이 생길 때 다시 깨움
+        if (
+            self._waiters
+            and self.active < self.max_concurrency
+            and self._wake_handle is None
+            and self.rate_per_second > 0
+        ):
+            delay = (1 - self._tokens) / self.rate_per_second
+            self._wake_handle = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    async def acquire(self, waiter_id: str):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((waiter_id, future))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def position(self, waiter_id: str) -> Optional[int]:
+        """대기열에서의 순번 (1부터), 대기 중이 아니면 None"""
+        for i, (candidate, _) in enumerate(list(self._waiters), 1):
+            if candidate == waiter_id:
+                return i
+        return None
+
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+
+class ChatTicket:
+    """제출된 질문 하나의 처리 상태 (같은 질문을 합친 요청들은 같은 티켓을 공유)"""
+
+    def __init__(self, key: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.future: "concurrent.futures.Future[Any]" = concurrent.futures.Future()
+        self.waiting_for: Optional[str] = None  # 대기 중인 제공자 이름
+        self.subscribers = 1
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        return self.future.result(timeout)
+
+
+class ChatService:
+    """질문 처리를 작업 스레드에 맡기고 제공자별 한도와 중복 요청 합치기를 담당하는 서비스"""
+
+    def __init__(self, limits: ProviderLimits, max_workers: int = 32):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="chat-service", daemon=True
+        )
+        self._thread.start()
+        self.limiters = {
+            name: ProviderLimiter(name, concurrency, rpm)
+            for name, (concurrency, rpm) in limits.items()
+        }
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="chat-worker"
+        )
+        self._inflight: Dict[str, ChatTicket] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {"submitted": 0, "coalesced": 0}
+
+    def join(self, key: str) -> Tuple[ChatTicket, bool]:
+        """key 로 처리 중인 티켓에 합류하거나 새 티켓을 만듦, (티켓, 새로 만들었는지)
+
+        새 티켓을 받은 쪽은 처리가 끝나면 반드시 resolve 를 불러야 한다.
+        """
+        with self._lock:
+            self._counters["submitted"] += 1
+            ticket = self._inflight.get(key)
+            if ticket is not None and not ticket.done():
+                ticket.subscribers += 1
+                self._counters["coalesced"] += 1
+                return ticket, False
+            ticket = ChatTicket(key)
+            self._inflight[key] = ticket
+            return ticket, True
+
+    def resolve(
+        self, ticket: ChatTicket, result: Any = None, error: Optional[BaseException] = None
+    ):
+        """티켓의 결과(또는 오류)를 기다리던 모든 요청에 전달"""
+        with self._lock:
+            if self._inflight.get(ticket.key) is ticket:
+                del self._inflight[ticket.key]
+        if error is not None:
+            ticket.future.set_exception(error)
+        else:
+            ticket.future.set_result(result)
+
+    def submit(
+        self,
+        question: str,
+        fn: Callable[..., Any],
+        *args: Any,
+        key: Optional[str] = None,
+        wrap: Optional[Callable[[Callable[[], Any]], Callable[[], Any]]] = None,
+    ) -> ChatTicket:
+        """fn(*args) 를 작업 스레드에서 실행하는 티켓을 반환
+
+        같은 key(기본: 공백을 정리한 질문)의 작업이 이미 처리 중이면 그 티켓을 돌려준다.
+        wrap 은 작업 스레드에서 실행할 함수를 감싸는 데 쓴다 (예: Streamlit 실행 컨텍스트 연결).
+        """
+        ticket, created = self.join(key or normalize_text(question))
+        if not created:
+            return ticket
+
+        def run() -> Any:
+            with self.bind(ticket):
+                return fn(*args)
+
+        job = wrap(run) if wrap else run
+
+        def finish(future: "concurrent.futures.Future[Any]"):
+            error = future.exception()
+            if error is not None:
+                self.resolve(ticket, error=error)
+            else:
+                self.resolve(ticket, future.result())
+
+        self._executor.submit(job).add_done_callback(finish)
+        return ticket
+
+    @contextmanager
+    def bind(
+        self, ticket: ChatTicket, on_wait: Optional[Callable[[int], None]] = None
+    ) -> Iterator[None]:
+        """현재 스레드에서 실행하는 slot 을 ticket 의 대기로 기록하고 on_wait 을 기본으로 씀
+
+        submit 을 거치지 않고 호출한 스레드에서 직접 처리할 때(예: 답변 스트리밍) 사용한다.
+        """
+        previous = (getattr(self._local, "ticket", None), getattr(self._local, "on_wait", None))
+        self._local.ticket, self._local.on_wait = ticket, on_wait
+        try:
+            yield
+        finally:
+            self._local.ticket, self._local.on_wait = previous
+
+    @contextmanager
+    def slot(
+        self,
+        provider: str,
+        on_wait: Optional[Callable[[int], None]] = None,
+        poll_interval: float = 0.25,
+    ) -> Iterator[None]:
+        """제공자 한도 안에서 실행할 구간 (동기 코드용, 어느 스레드에서나 사용 가능)
+
+        자리가 날 때까지 기다리며, 기다리는 동안 on_wait(대기 순번)을 주기적으로 부른다.
+        on_wait 을 주지 않으면 bind 로 지정한 콜백을 쓴다.
+        """
+        limiter = self.limiters.get(provider)
+        if limiter is None:
+            yield
+            return
+
+        ticket: Optional[ChatTicket] = getattr(self._local, "ticket", None)
+        on_wait = on_wait or getattr(self._local, "on_wait", None)
+        waiter_id = ticket.id if ticket is not None else uuid.uuid4().hex[:12]
+        acquired = asyncio.run_coroutine_threadsafe(limiter.acquire(waiter_id), self._loop)
+        if ticket is not None:
+            ticket.waiting_for = provider
+        try:
+            while True:
+                try:
+                    acquired.result(timeout=poll_interval)
+                    break
+                except concurrent.futures.TimeoutError:
+                    if on_wait is not None:
+                        position = limiter.position(waiter_id)
+                        if position is not None:
+                            on_wait(position)
+        except BaseException:
+            # 취소하기 직전에 자리를 받았다면 바로 돌려줌
+            if not acquired.cancel() and acquired.exception() is None:
+                self._loop.call_soon_threadsafe(limiter.release)
+            raise
+        finally:
+            if ticket is not None:
+                ticket.waiting_for = None
+
+        try:
+            yield
+        finally:
+            self._loop.call_soon_threadsafe(limiter.release)
+
+    def queue_position(self, ticket: ChatTicket) -> Optional[Tuple[str, int]]:
+        """티켓이 대기 중이면 (제공자 이름, 순번), 실행 중이거나 끝났으면 None"""
+        provider = ticket.waiting_for
+        if provider is None:
+            return None
+        position = self.limiters[provider].position(ticket.id)
+        return (provider, position) if position is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = {**self._counters, "inflight": len(self._inflight)}
+        for name, limiter in self.limiters.items():
+            stats[name] = {"active": limiter.active, "waiting": limiter.waiting()}
+        return stats
+
+
+class LimitedEmbeddings(Embeddings):
+    """임베딩 API 를 부를 때마다 서비스의 제공자 한도 안에서 실행하는 래퍼
+
+    CachedEmbeddings 안쪽에 두면 캐시에 없는 질문만 한도 자리를 차지한다.
+    """
+
+    def __init__(
+        self, embeddings: Embeddings, service: ChatService, provider: str = "embeddings"
+    ):
+        self.embeddings = embeddings
+        self.service = service
+        self.provider = provider
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.service.slot(self.provider):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self.service.slot(self.provider):
+            return self.embeddings.embed_query(text)
@@ -0,0 +1,182 @@
+"""검색된 청크를 프롬프트에 넣기 전에 중복을 줄이고 토큰 예산에 맞추는 모듈
+
+1. 같은 출처에서 앞 청크의 끝과 뒤 청크의 앞이 겹치면(청크 분할 overlap)
+   겹친 부분을 한 번만 남기고 두 청크를 하나로 합친다.
+2. MMR(Maximal Marginal Relevance)로 관련성이 높으면서 서로 덜 겹치는 청크부터 고른다.
+3. 추정 토큰 수가 예산을 넘지 않을 때까지만 담는다.
+"""
+
+import math
+import re
+from typing import Any, Dict, FrozenSet, List, Sequence, Tuple
+
+from langchain.schema import Document
+
+ScoredDocument = Tuple[Document, float]  # (청크, 0~1 관련도 점수, 높을수록 관련 있음)
+
+_non_hangul_re = re.compile(r"[^가-힣ㄱ-ㅎㅏ-ㅣ]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """LLM 입력 토큰 수 추정 (한글은 1.5글자, 그 밖의 글자는 4글자를 1토큰으로 계산)"""
+    hangul = len(_non_hangul_re.sub("", text))
+    return math.ceil(hangul / 1.5 + (len(text) - hangul) / 4)
+
+
+def overlap_length(
+    left: str, right: str, min_overlap: int = 30, max_overlap: int = 400
+) -> int:
+    """left 의 끝과 right 의 앞이 겹치는 가장 긴 길이 (min_overlap 미만이면 0)"""
+    if len(left) < min_overlap or len(right) < min_overlap:
+        return 0
+    probe = right[:min_overlap]
+    start = left.find(probe, max(0, len(left) - max_overlap))
+    while start != -1:
+        length = len(left) - start
+        if right.startswith(left[start:]):
+            return length
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def _merged_metadata(first: Dict[str, Any], second: Dict[str, Any]) -> Dict[str, Any]:
+    """앞 청크의 메타데이터에 두 청크의 페이지 범위(page ~ page_end)를 합친 것"""
+    metadata = dict(first)
+    pages = [
+        page
+        for source in (first, second)
+        for page in (source.get("page"), source.get("page_end"))
+        if page is not None
+    ]
+    if pages:
+        metadata["page"] = min(pages)
+        metadata.pop("page_end", None)
+        if max(pages) != metadata["page"]:
+            metadata["page_end"] = max(pages)
+    return metadata
+
+
+def merge_adjacent_chunks(
+    scored_docs: Sequence[ScoredDocument], min_overlap: int = 30
+) -> List[ScoredDocument]:
+    """같은 출처에서 이어지는(겹치는) 청크를 하나로 합치는 함수
+
+    다른 청크에 통째로 들어 있는 청크는 버린다. 합친 청크는 앞쪽 청크의
+    메타데이터(페이지 범위는 두 청크를 합친 범위)와 둘 중 더 높은 점수를 갖는다. 결과 순서는 처음 나온
+    청크의 순서를 따른다.
+    """
+    merged: List[ScoredDocument] = []
+    for doc, score in scored_docs:
+        content = doc.page_content
+        source = doc.metadata.get("source")
+        absorbed = False
+        for i, (other, other_score) in enumerate(merged):
+            if other.metadata.get("source") != source:
+                continue
+            other_content = other.page_content
+            if content in other_content:
+                merged[i] = (other, max(score, other_score))
+            elif other_content in content:
+                merged[i] = (
+                    Document(page_content=content, metadata=dict(doc.metadata)),
+                    max(score, other_score),
+                )
+            elif overlap := overlap_length(other_content, content, min_overlap):
+                merged[i] = (
+                    Document(
+                        page_content=other_content + content[overlap:],
+                        metadata=_merged_metadata(other.metadata, doc.metadata),
+                    ),
+                    max(score, other_score),
+                )
+            elif overlap := overlap_length(content, other_content, min_overlap):
+                merged[i] = (
+                    Document(
+                        page_content=content + other_content[overlap:],
+                        metadata=_merged_metadata(doc.metadata, other.metadata),
+                    ),
+                    max(score, other_score),
+                )
+            else:
+                continue
+            absorbed = True
+            break
+        if not absorbed:
+            merged.append((doc, score))
+
+    # 합친 결과가 다시 다른 청크와 이어질 수 있으므로 더 합칠 것이 없을 때까지 반복
+    if len(merged) < len(scored_docs):
+        return merge_adjacent_chunks(merged, min_overlap)
+    return merged
+
+
+def _bigrams(text: str) -> FrozenSet[str]:
+    compact = "".join(text.split())
+    return frozenset(compact[i : i + 2] for i in range(len(compact) - 1))
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def mmr_order(
+    scored_docs: Sequence[ScoredDocument], mmr_lambda: float = 0.7
+) -> List[ScoredDocument]:
+    """관련성과 이미 고른 청크와의 글자 바이그램 유사도로 MMR 순서를 매기는 함수
+
+    관련성은 재정렬 단계에서 보정한 점수(rag.reranker, 0~1)를 그대로 쓴다.
+    """
+    remaining = list(range(len(scored_docs)))
+    grams = [_bigrams(doc.page_content) for doc, _ in scored_docs]
+    relevance = [score for _, score in scored_docs]
+    # 후보마다 지금까지 고른 청크와의 최대 유사도 (고를 때마다 갱신)
+    redundancy = [0.0] * len(scored_docs)
+    selected: List[int] = []
+    while remaining:
+        best = max(
+            remaining,
+            key=lambda i: mmr_lambda * relevance[i] - (1.0 - mmr_lambda) * redundancy[i],
+        )
+        selected.append(best)
+        remaining.remove(best)
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], _jaccard(grams[i], grams[best]))
+    return [scored_docs[i] for i in selected]
+
+
+def pack_context(
+    scored_docs: Sequence[ScoredDocument],
+    token_budget: int,
+    mmr_lambda: float = 0.7,
+    min_overlap: int = 30,
+) -> List[ScoredDocument]:
+    """겹침 제거 → MMR 순서 → 토큰 예산 순으로 프롬프트에 넣을 청크를 고르는 함수
+
+    예산에 맞지 않는 청크는 건너뛰고 더 작은 다음 청크를 시도한다. 첫 청크만으로
+    예산을 넘으면 그 청크를 예산에 맞게 잘라서라도 하나는 넣는다.
+    """
+    candidates = mmr_order(merge_adjacent_chunks(scored_docs, min_overlap), mmr_lambda)
+
+    packed: List[ScoredDocument] = []
+    used_tokens = 0
+    for doc, score in candidates:
+        tokens = estimate_tokens(doc.page_content)
+        if used_tokens + tokens <= token_budget:
+            packed.append((doc, score))
+            used_tokens += tokens
+
+    if not packed and candidates:
+        doc, score = candidates[0]
+        ratio = token_budget / max(estimate_tokens(doc.page_content), 1)
+        packed.append(
+            (
+                Document(
+                    page_content=doc.page_content[: int(len(doc.page_content) * ratio)],
+                    metadata=dict(doc.metadata),
+                ),
+                score,
+            )
+        )
+    return packed
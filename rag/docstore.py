@@ -0,0 +1,233 @@
+"""pickle 대신 메모리 맵으로 읽는 문서 저장소 (index.pkl 대체)
+
+인덱스 폴더에 다음 파일을 쓴다.
+
+- docstore.json: 형식 버전과 FAISS 행 순서대로의 문서 ID 목록
+- docstore_offsets.npy: 행마다 (본문 오프셋, 본문 길이, 메타데이터 오프셋, 메타데이터 길이)
+- docstore.bin: UTF-8 본문과 JSON 메타데이터를 이어 붙인 바이트
+
+docstore.bin 과 오프셋 표는 mmap 으로 열리므로 여러 프로세스가 운영체제 페이지 캐시를
+공유하고, Document 객체는 검색 결과로 요청된 문서만 만든다. 파일은 임시 이름으로 쓴 뒤
+os.replace 로 바꾸므로, 다시 저장해도 이미 열어 둔 프로세스는 이전 파일을 그대로 읽는다.
+
+기존 index.pkl 변환:
+
+    python -m rag.docstore faiss_index --remove-pickle
+"""
+
+import argparse
+import json
+import mmap
+import os
+import pickle
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Union
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+docstore_version = 1
+header_file_name = "docstore.json"
+offsets_file_name = "docstore_offsets.npy"
+blob_file_name = "docstore.bin"
+faiss_file_name = "index.faiss"
+flat_file_name = "index_flat.faiss"  # 근사 인덱스를 쓸 때 함께 저장되는 정확한 인덱스
+params_file_name = "index_params.json"
+pickle_file_name = "index.pkl"
+
+
+class MmapDocstore(Docstore):
+    """docstore.bin 을 메모리 맵으로 열어 요청된 문서만 Document 로 만드는 읽기 전용 저장소"""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, header_file_name), encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("version") != docstore_version:
+            raise ValueError(f"지원하지 않는 docstore 형식입니다: {header.get('version')}")
+
+        self.ids: List[str] = header["ids"]
+        self._rows: Dict[str, int] = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._offsets = np.load(
+            os.path.join(index_dir, offsets_file_name), mmap_mode="r"
+        )
+
+        self._blob: Union[mmap.mmap, bytes] = b""
+        with open(os.path.join(index_dir, blob_file_name), "rb") as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # 파일을 하나씩 여는 사이에 다시 저장되면 서로 다른 버전이 섞일 수 있으므로 확인
+        if len(self._offsets) != len(self.ids) or (
+            len(self.ids)
+            and int((self._offsets[:, 2] + self._offsets[:, 3]).max()) > len(self._blob)
+        ):
+            raise ValueError(f"docstore 파일이 서로 맞지 않습니다 (저장 중일 수 있음): {index_dir}")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row_document(self, row: int) -> Document:
+        """FAISS 행 번호로 문서를 만드는 함수"""
+        text_offset, text_length, meta_offset, meta_length = (
+            int(value) for value in self._offsets[row]
+        )
+        text = self._blob[text_offset : text_offset + text_length].decode("utf-8")
+        metadata = json.loads(self._blob[meta_offset : meta_offset + meta_length])
+        return Document(page_content=text, metadata=metadata, id=self.ids[row])
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self._rows.get(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self.row_document(row)
+
+
+@contextmanager
+def replacing_path(path: str) -> Iterator[str]:
+    """path 옆의 임시 파일 경로를 주고, 블록이 끝나면 os.replace 로 path 를 교체
+
+    기존 파일을 잘라 다시 쓰지 않으므로 그 파일을 메모리 맵으로 연 프로세스는 이전
+    내용(inode)을 계속 읽는다. 블록에서 예외가 나면 임시 파일만 지운다.
+    """
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def write_docstore(
+    index_dir: str, docstore: Docstore, index_to_docstore_id: Dict[int, str]
+):
+    """FAISS 행 순서대로 문서를 docstore 파일들에 기록하는 함수"""
+    ids = [index_to_docstore_id[row] for row in range(len(index_to_docstore_id))]
+    offsets = np.zeros((len(ids), 4), dtype=np.int64)
+
+    position = 0
+    with replacing_path(os.path.join(index_dir, blob_file_name)) as blob_path, open(
+        blob_path, "wb"
+    ) as blob:
+        for row, doc_id in enumerate(ids):
+            doc = docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                raise ValueError(f"문서 {doc_id} 를 docstore 에서 찾을 수 없습니다.")
+            text = doc.page_content.encode("utf-8")
+            metadata = json.dumps(doc.metadata, ensure_ascii=False).encode("utf-8")
+            offsets[row] = (position, len(text), position + len(text), len(metadata))
+            blob.write(text)
+            blob.write(metadata)
+            position += len(text) + len(metadata)
+
+    with replacing_path(os.path.join(index_dir, offsets_file_name)) as offsets_path:
+        with open(offsets_path, "wb") as f:
+            np.save(f, offsets)
+    with replacing_path(os.path.join(index_dir, header_file_name)) as header_path:
+        with open(header_path, "w", encoding="utf-8") as f:
+            json.dump({"version": docstore_version, "ids": ids}, f, ensure_ascii=False)
+
+
+def has_mmap_docstore(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, header_file_name))
+
+
+def load_faiss_index(
+    index_dir: str, embeddings: Embeddings, in_memory: bool = False
+) -> FAISS:
+    """index.faiss 와 mmap docstore 로 FAISS 벡터스토어를 만드는 함수
+
+    in_memory=True 이면 문서를 모두 InMemoryDocstore 로 읽어 추가/삭제가 가능한
+    벡터스토어를 반환한다 (변환기의 증분 빌드용). 새 형식이 없고 index.pkl 만 있으면
+    기존 방식(pickle)으로 읽는다.
+    """
+    if not has_mmap_docstore(index_dir):
+        print("경고: index.pkl(pickle) 형식의 벡터DB를 읽습니다. 'python -m rag.docstore' 로 변환하세요.")
+        return FAISS.load_local(
+            index_dir, embeddings, allow_dangerous_deserialization=True
+        )
+
+    flat_path = os.path.join(index_dir, flat_file_name)
+    if in_memory and os.path.exists(flat_path):
+        # 증분 빌드는 항상 정확한 인덱스에 대해 추가/삭제한 뒤 근사 인덱스를 다시 만든다
+        index = faiss.read_index(flat_path)
+    else:
+        index = faiss.read_index(os.path.join(index_dir, faiss_file_name))
+        _prepare_search_index(index, index_dir)
+    mmap_docstore = MmapDocstore(index_dir)
+    index_to_docstore_id = dict(enumerate(mmap_docstore.ids))
+
+    docstore: Docstore = mmap_docstore
+    if in_memory:
+        docstore = InMemoryDocstore(
+            {
+                doc_id: mmap_docstore.row_document(row)
+                for row, doc_id in index_to_docstore_id.items()
+            }
+        )
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
+def _prepare_search_index(index: faiss.Index, index_dir: str):
+    """근사 인덱스의 검색 파라미터(nprobe/efSearch)를 적용하고 벡터 복원을 준비"""
+    params_path = os.path.join(index_dir, params_file_name)
+    if not os.path.exists(params_path):
+        return
+    with open(params_path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    params = []
+    if config.get("kind") in ("ivf_flat", "ivf_pq"):
+        params.append(f"nprobe={config['nprobe']}")
+        # 하이브리드 검색에서 키워드로만 찾은 문서의 거리를 계산할 때 필요
+        faiss.extract_index_ivf(index).make_direct_map()
+    elif config.get("kind") == "hnsw":
+        params.append(f"efSearch={config['ef_search']}")
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, ",".join(params))
+
+
+def save_faiss_index(vector_store: FAISS, index_dir: str):
+    """벡터스토어를 index.faiss + mmap docstore 형식으로 저장하는 함수"""
+    os.makedirs(index_dir, exist_ok=True)
+    with replacing_path(os.path.join(index_dir, faiss_file_name)) as faiss_path:
+        faiss.write_index(vector_store.index, faiss_path)
+    write_docstore(index_dir, vector_store.docstore, vector_store.index_to_docstore_id)
+
+    pickle_path = os.path.join(index_dir, pickle_file_name)
+    if os.path.exists(pickle_path):
+        os.remove(pickle_path)
+
+
+def convert_pickle_docstore(index_dir: str, remove_pickle: bool = False):
+    """기존 index.pkl 의 docstore 를 새 형식으로 변환하는 함수 (신뢰할 수 있는 파일에만 사용)"""
+    with open(os.path.join(index_dir, pickle_file_name), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    write_docstore(index_dir, docstore, index_to_docstore_id)
+    print(f"문서 {len(index_to_docstore_id)}개를 변환했습니다: {index_dir}")
+    if remove_pickle:
+        os.remove(os.path.join(index_dir, pickle_file_name))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="index.pkl 을 mmap docstore 로 변환")
+    parser.add_argument("index_dir", nargs="?", default="faiss_index")
+    parser.add_argument(
+        "--remove-pickle", action="store_true", help="변환 후 index.pkl 삭제"
+    )
+    args = parser.parse_args(argv)
+    convert_pickle_docstore(args.index_dir, args.remove_pickle)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""질문/문서 임베딩을 메모리 LRU와 SQLite 디스크 캐시에 저장하는 모듈"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_PATH = os.path.join(ROOT_DIR, ".cache", "embeddings.sqlite3")
+
+
+def normalize_text(text: str) -> str:
+    """캐시 키용으로 공백을 하나로 합친 텍스트 (preprocess_question과 동일한 규칙)"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class CachedEmbeddings(Embeddings):
+    """임베딩 객체를 감싸 같은 텍스트에 대한 API 호출을 줄이는 래퍼
+
+    메모리 LRU를 먼저 보고, 없으면 SQLite 디스크 캐시, 그래도 없으면
+    원래 임베딩 객체를 호출한다. 디스크 캐시는 개수와 나이 기준으로 정리된다.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+        max_memory_items: int = 2048,
+        max_disk_items: int = 200_000,
+        max_age_seconds: float = 60 * 60 * 24 * 30,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.max_age_seconds = max_age_seconds
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self._conn: Optional[sqlite3.Connection] = None
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+            self._prune()
+
+    def _key(self, text: str, kind: str) -> str:
+        raw = f"{self.model_name}\0{kind}\0{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """메모리와 디스크에서 찾은 벡터를 반환 (카운터 갱신 포함)"""
+        found: Dict[str, np.ndarray] = {}
+        disk_keys = []
+        with self._lock:
+            for key in keys:
+                if key in found:
+                    continue
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self._counters["memory_hits"] += 1
+                elif key not in disk_keys:
+                    disk_keys.append(key)
+
+            if disk_keys and self._conn is not None:
+                now = time.time()
+                min_created = now - self.max_age_seconds
+                for start in range(0, len(disk_keys), 500):
+                    part = disk_keys[start : start + 500]
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings "
+                        f"WHERE created_at >= ? AND key IN ({','.join('?' * len(part))})",
+                        [min_created, *part],
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+                        self._counters["disk_hits"] += 1
+                    if rows:
+                        self._conn.executemany(
+                            "UPDATE embeddings SET accessed_at = ? WHERE key = ?",
+                            [(now, key) for key, _ in rows],
+                        )
+                self._conn.commit()
+        return found
+
+    def _store(self, items: Dict[str, np.ndarray]):
+        with self._lock:
+            # 실제로 API를 호출해 받아온 항목만 실패로 센다 (재시도는 중복 집계하지 않음)
+            self._counters["misses"] += len(items)
+            for key, vector in items.items():
+                self._remember(key, vector)
+            if self._conn is None:
+                return
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                [(key, vector.tobytes(), now, now) for key, vector in items.items()],
+            )
+            self._conn.commit()
+            self._writes_since_prune += len(items)
+            if self._writes_since_prune >= 1000:
+                self._prune()
+
+    def _prune(self):
+        """오래된 항목과 최대 개수를 넘는 항목(가장 오래 안 쓴 순)을 디스크에서 삭제"""
+        if self._conn is None:
+            return
+        self._writes_since_prune = 0
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE created_at < ?",
+            (time.time() - self.max_age_seconds,),
+        )
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_disk_items:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "SELECT key FROM embeddings ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_disk_items,),
+            )
+        self._conn.commit()
+
+    def _embed(self, texts: List[str], kind: str) -> List[List[float]]:
+        keys = [self._key(text, kind) for text in texts]
+        found = self._lookup(keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            if kind == "query" and len(missing) == 1:
+                vectors = [self.embeddings.embed_query(t) for t in missing.values()]
+            else:
+                # 질문 여러 개도 한 번의 배치 요청으로 보냄 (OpenAI 는 질문/문서 임베딩이 같음)
+                vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_items = {
+                key: np.asarray(vector, dtype=np.float32)
+                for key, vector in zip(missing.keys(), vectors)
+            }
+            self._store(new_items)
+            found.update(new_items)
+
+        return [found[key].tolist() for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "document")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "query")[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """질문 여러 개를 임베딩 (캐시에 없는 것만 한 번의 요청으로 계산)"""
+        return self._embed(texts, "query")
+
+    def stats(self) -> Dict[str, float]:
+        """캐시 적중/실패 횟수와 적중률"""
+        with self._lock:
+            stats: Dict[str, float] = dict(self._counters)
+            stats["memory_items"] = len(self._memory)
+        total = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["disk_hits"]) / total if total else 0.0
+        )
+        return stats
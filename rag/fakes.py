@@ -0,0 +1,104 @@
+"""API 없이 오프라인으로 돌릴 때 쓰는 결정적 가짜 임베딩/LLM"""
+
+import hashlib
+import re
+import time
+from typing import Any, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+def hash_embedding(text: str, dimensions: int = 256) -> np.ndarray:
+    """글자 바이그램을 해싱해 만든 정규화 벡터 (같은 글자가 많이 겹칠수록 가까움)"""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    compact = "".join(text.split())
+    grams = [compact[i : i + 2] for i in range(max(len(compact) - 1, 1))]
+    for gram in grams:
+        digest = hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        vector[value % dimensions] += 1.0 if (value >> 32) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class HashingEmbeddings(Embeddings):
+    """hash_embedding 을 쓰는 결정적 임베딩 (네트워크 호출 없음)"""
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [hash_embedding(text, self.dimensions).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return hash_embedding(text, self.dimensions).tolist()
+
+
+class StubChatModel(BaseChatModel):
+    """정해진 지연 후 고정 답변을 돌려주는 LLM 대역 (스트리밍 지원)
+
+    마지막으로 받은 프롬프트 길이를 기록해 벤치마크에서 입력 크기를 비교할 수 있다.
+    """
+
+    answer: str = "제공된 문서를 바탕으로 답변드립니다. 자세한 내용은 참고 문서를 확인하세요."
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    last_prompt_chars: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def _prompt_chars(self, messages: List[BaseMessage]) -> int:
+        return sum(len(str(message.content)) for message in messages)
+
+    def _usage(self) -> dict:
+        # 글자 수를 토큰 수로 간주 (실제 모델의 usage_metadata 와 같은 형태)
+        output_tokens = len(self.answer)
+        return {
+            "input_tokens": self.last_prompt_chars,
+            "output_tokens": output_tokens,
+            "total_tokens": self.last_prompt_chars + output_tokens,
+        }
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self.last_prompt_chars = self._prompt_chars(messages)
+        time.sleep(self.first_token_latency + self.token_latency * len(self.answer))
+        return ChatResult(
+            generations=[
+                ChatGeneration(
+                    message=AIMessage(content=self.answer, usage_metadata=self._usage())
+                )
+            ]
+        )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        self.last_prompt_chars = self._prompt_chars(messages)
+        time.sleep(self.first_token_latency)
+        tokens = re.findall(r"\S+\s*", self.answer)
+        for i, token in enumerate(tokens):
+            time.sleep(self.token_latency)
+            usage = self._usage() if i == len(tokens) - 1 else None
+            chunk = ChatGenerationChunk(
+                message=AIMessageChunk(content=token, usage_metadata=usage)
+            )
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
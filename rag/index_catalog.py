@@ -0,0 +1,173 @@
+"""벡터DB 폴더에 함께 저장하는 문서 목록과 인덱스 통계(catalog.json)
+
+변환기가 빌드할 때 한 번 만들어 두므로, 챗봇의 사이드바와 벡터DB 점검 화면은
+벡터를 읽거나 임베딩 API 를 부르지 않고 이 작은 JSON 파일만 읽는다.
+catalog.json 이 없는 예전 벡터DB는 다음 명령으로 만들 수 있다.
+
+    python -m rag.index_catalog faiss_index
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, TypedDict
+
+import faiss
+from langchain.schema import Document
+
+from rag.docstore import MmapDocstore, faiss_file_name, params_file_name, replacing_path
+
+catalog_file_name = "catalog.json"
+catalog_version = 1
+sample_count = 5  # 점검 화면에 보여줄 샘플 청크 수 (문서마다 첫 청크)
+preview_chars = 200
+
+
+class SourceStats(TypedDict):
+    source: str
+    chunks: int
+    pages: int  # 청크가 있는 마지막 페이지 번호 (페이지 정보가 없는 예전 벡터DB는 0)
+    sections: int
+    chars: int
+
+
+class ChunkSample(TypedDict):
+    source: str
+    page: Optional[int]
+    page_end: Optional[int]
+    section: str
+    chars: int
+    preview: str
+
+
+class Catalog(TypedDict):
+    version: int
+    built_at: float
+    embedding_model: str
+    chunking: str
+    index: Dict[str, Any]  # kind, dimension, vectors, files(파일별 바이트), total_bytes
+    sources: List[SourceStats]
+    samples: List[ChunkSample]
+
+
+def build_catalog(
+    index_dir: str,
+    documents: Iterable[Document],
+    dimension: int,
+    embedding_model: str = "",
+    chunking: str = "",
+) -> Catalog:
+    """저장이 끝난 벡터DB 폴더의 파일 크기와 문서(청크) 목록으로 카탈로그를 만드는 함수"""
+    stats: Dict[str, SourceStats] = {}
+    sections: Dict[str, set] = {}
+    samples: Dict[str, ChunkSample] = {}
+    vectors = 0
+    for doc in documents:
+        vectors += 1
+        metadata = doc.metadata
+        source = metadata.get("source", "Unknown")
+        entry = stats.setdefault(
+            source, {"source": source, "chunks": 0, "pages": 0, "sections": 0, "chars": 0}
+        )
+        entry["chunks"] += 1
+        entry["chars"] += len(doc.page_content)
+        last_page = metadata.get("page_end") or metadata.get("page") or 0
+        entry["pages"] = max(entry["pages"], last_page)
+        sections.setdefault(source, set()).add(metadata.get("section", ""))
+        if source not in samples:
+            samples[source] = {
+                "source": source,
+                "page": metadata.get("page"),
+                "page_end": metadata.get("page_end"),
+                "section": metadata.get("section", ""),
+                "chars": len(doc.page_content),
+                "preview": doc.page_content[:preview_chars],
+            }
+    for source, entry in stats.items():
+        entry["sections"] = len(sections[source] - {""})
+
+    kind = "flat"
+    params_path = os.path.join(index_dir, params_file_name)
+    if os.path.exists(params_path):
+        with open(params_path, encoding="utf-8") as f:
+            kind = json.load(f).get("kind", kind)
+    files = {
+        name: os.path.getsize(os.path.join(index_dir, name))
+        for name in sorted(os.listdir(index_dir))
+        if name != catalog_file_name and os.path.isfile(os.path.join(index_dir, name))
+    }
+    ordered = sorted(stats)
+    return {
+        "version": catalog_version,
+        "built_at": time.time(),
+        "embedding_model": embedding_model,
+        "chunking": chunking,
+        "index": {
+            "kind": kind,
+            "dimension": dimension,
+            "vectors": vectors,
+            "files": files,
+            "total_bytes": sum(files.values()),
+        },
+        "sources": [stats[source] for source in ordered],
+        "samples": [samples[source] for source in ordered[:sample_count]],
+    }
+
+
+def save_catalog(index_dir: str, catalog: Catalog):
+    with replacing_path(os.path.join(index_dir, catalog_file_name)) as path:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(catalog, f, ensure_ascii=False, indent=1)
+
+
+def load_catalog(index_dir: str) -> Optional[Catalog]:
+    """catalog.json 을 읽음, 없거나 형식 버전이 다르면 None"""
+    path = os.path.join(index_dir, catalog_file_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        catalog = json.load(f)
+    if catalog.get("version") != catalog_version:
+        return None
+    return catalog
+
+
+def catalog_from_index_dir(index_dir: str) -> Catalog:
+    """catalog.json 이 없는 벡터DB의 카탈로그를 docstore 메타데이터로 만드는 함수
+
+    index.faiss 는 메모리 맵으로 열어 헤더(차원)만 읽고, 임베딩 API 는 부르지 않는다.
+    """
+    docstore = MmapDocstore(index_dir)
+    index = faiss.read_index(
+        os.path.join(index_dir, faiss_file_name),
+        faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+    )
+    manifest: Dict[str, Any] = {}
+    manifest_path = os.path.join(index_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    return build_catalog(
+        index_dir,
+        (docstore.row_document(row) for row in range(len(docstore))),
+        index.d,
+        manifest.get("embedding_model", ""),
+        manifest.get("chunking", ""),
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="벡터DB 폴더에 catalog.json 생성")
+    parser.add_argument("index_dir", nargs="?", default="faiss_index")
+    args = parser.parse_args(argv)
+    catalog = catalog_from_index_dir(args.index_dir)
+    save_catalog(args.index_dir, catalog)
+    print(
+        f"문서 {len(catalog['sources'])}개, 청크 {catalog['index']['vectors']}개의 "
+        f"카탈로그를 저장했습니다: {os.path.join(args.index_dir, catalog_file_name)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
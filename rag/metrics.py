@@ -0,0 +1,318 @@
+"""챗봇 요청의 단계별 소요 시간과 토큰/캐시 정보를 기록하고 내보내는 모듈
+
+요청 하나는 RequestTrace 로 기록되고, 끝나면 MetricsRecorder 에 등록된
+싱크(JSON 로그, 프로메테우스 텍스트, 메모리 링버퍼)로 전달된다.
+"""
+
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Sequence, TextIO
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# 프로메테우스 히스토그램 구간 (밀리초)
+latency_buckets_ms = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class RequestTrace:
+    """질문 하나를 처리하는 동안의 단계별 시간(span), 토큰 수, 캐시 적중 여부"""
+
+    def __init__(self, question: str, mode: str = "invoke"):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.question_chars = len(question)
+        self.started_at = time.time()
+        self.spans: Dict[str, float] = {}
+        self.tokens: Dict[str, int] = {}
+        self.flags: Dict[str, bool] = {}
+        self.status = "ok"
+        self._start = time.perf_counter()
+        self._finished = False
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """with 블록의 소요 시간을 name 단계에 더함 (같은 단계를 여러 번 재면 합산)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, (time.perf_counter() - start) * 1000)
+
+    def add_span(self, name: str, elapsed_ms: float):
+        self.spans[name] = self.spans.get(name, 0.0) + elapsed_ms
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "mode": self.mode,
+            "status": self.status,
+            "question_chars": self.question_chars,
+            "spans_ms": {name: round(value, 3) for name, value in self.spans.items()},
+            "tokens": dict(self.tokens),
+            "flags": dict(self.flags),
+        }
+
+
+class LLMTimingCallback(BaseCallbackHandler):
+    """체인 실행 중 프롬프트 조립, 첫 토큰까지의 시간, LLM 전체 시간과 토큰 사용량을 기록
+
+    체인 시작부터 모델 호출 직전까지를 prompt, 모델 호출부터 첫 토큰까지를
+    llm_ttft, 모델 호출 전체를 llm_total 로 남긴다. 스트리밍하지 않으면
+    첫 토큰 시간은 전체 시간과 같다.
+    """
+
+    def __init__(self, trace: RequestTrace):
+        self.trace = trace
+        self._chain_start: Optional[float] = None
+        self._llm_start: Optional[float] = None
+        self._first_token: Optional[float] = None
+
+    def on_chain_start(self, serialized, inputs, *, parent_run_id=None, **kwargs):
+        if parent_run_id is None and self._chain_start is None:
+            self._chain_start = time.perf_counter()
+
+    def _on_model_start(self):
+        self._llm_start = time.perf_counter()
+        if self._chain_start is not None:
+            self.trace.add_span("prompt", (self._llm_start - self._chain_start) * 1000)
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._on_model_start()
+        self.trace.tokens["prompt_chars"] = sum(
+            len(str(message.content)) for batch in messages for message in batch
+        )
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._on_model_start()
+        self.trace.tokens["prompt_chars"] = sum(len(prompt) for prompt in prompts)
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        if self._first_token is None and self._llm_start is not None:
+            self._first_token = time.perf_counter()
+            self.trace.add_span("llm_ttft", (self._first_token - self._llm_start) * 1000)
+
+    def on_llm_end(self, response: LLMResult, **kwargs):
+        if self._llm_start is None:
+            return
+        total_ms = (time.perf_counter() - self._llm_start) * 1000
+        self.trace.add_span("llm_total", total_ms)
+        if self._first_token is None:
+            self.trace.add_span("llm_ttft", total_ms)
+
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or {}
+                for key in ("input_tokens", "output_tokens", "total_tokens"):
+                    if key in usage:
+                        self.trace.tokens[key] = (
+                            self.trace.tokens.get(key, 0) + usage[key]
+                        )
+                self.trace.tokens["answer_chars"] = self.trace.tokens.get(
+                    "answer_chars", 0
+                ) + len(generation.text)
+
+    def on_llm_error(self, error: BaseException, **kwargs):
+        self.trace.status = "error"
+
+
+class MetricsSink:
+    """완료된 요청 기록을 받는 싱크의 기본 클래스"""
+
+    def emit(self, record: Dict[str, Any]):
+        raise NotImplementedError
+
+
+class JsonLogSink(MetricsSink):
+    """요청마다 JSON 한 줄을 파일(또는 표준 출력)에 남기는 싱크"""
+
+    def __init__(self, path: Optional[str] = None, stream: Optional[TextIO] = None):
+        self.path = path
+        self.stream = stream if stream is not None else (None if path else sys.stdout)
+        self._lock = threading.Lock()
+
+    def emit(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            else:
+                self.stream.write(line + "\n")
+                self.stream.flush()
+
+
+class RingBufferSink(MetricsSink):
+    """최근 요청 기록을 메모리에 보관하는 싱크 (관리자 패널에서 사용)"""
+
+    def __init__(self, max_items: int = 500):
+        self._records: "deque[Dict[str, Any]]" = deque(maxlen=max_items)
+        self._lock = threading.Lock()
+
+    def emit(self, record: Dict[str, Any]):
+        with self._lock:
+            self._records.append(record)
+
+    def recent(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """최근 기록을 최신순으로 반환"""
+        with self._lock:
+            records = list(self._records)
+        records.reverse()
+        return records[:limit] if limit else records
+
+    def percentiles(
+        self, quantiles: Sequence[int] = (50, 95, 99)
+    ) -> Dict[str, Dict[str, float]]:
+        """보관 중인 기록의 단계별 지연 백분위수 (밀리초)"""
+        by_stage: Dict[str, List[float]] = {}
+        for record in self.recent():
+            for stage, value in record["spans_ms"].items():
+                by_stage.setdefault(stage, []).append(value)
+        return {
+            stage: {
+                f"p{q}": round(float(np.percentile(values, q)), 1) for q in quantiles
+            }
+            for stage, values in by_stage.items()
+        }
+
+
+class PrometheusSink(MetricsSink):
+    """단계별 지연 히스토그램과 카운터를 프로메테우스 텍스트 형식으로 집계하는 싱크"""
+
+    def __init__(self, buckets: Sequence[float] = latency_buckets_ms):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._requests: Dict[str, int] = {}
+        self._flags: Dict[str, int] = {}
+        self._tokens: Dict[str, int] = {}
+        self._histograms: Dict[str, Dict[str, Any]] = {}
+
+    def emit(self, record: Dict[str, Any]):
+        with self._lock:
+            key = f'mode="{record["mode"]}",status="{record["status"]}"'
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for flag, value in record["flags"].items():
+                if value:
+                    self._flags[flag] = self._flags.get(flag, 0) + 1
+            for name, value in record["tokens"].items():
+                self._tokens[name] = self._tokens.get(name, 0) + value
+            for stage, value in record["spans_ms"].items():
+                histogram = self._histograms.setdefault(
+                    stage, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                )
+                for i, bound in enumerate(self.buckets):
+                    if value <= bound:
+                        histogram["counts"][i] += 1
+                histogram["sum"] += value
+                histogram["count"] += 1
+
+    def render(self) -> str:
+        """/metrics 응답 본문"""
+        lines = [
+            "# HELP chatbot_requests_total Chat requests by mode and status.",
+            "# TYPE chatbot_requests_total counter",
+        ]
+        with self._lock:
+            for labels, value in sorted(self._requests.items()):
+                lines.append(f"chatbot_requests_total{{{labels}}} {value}")
+
+            lines += [
+                "# HELP chatbot_cache_hits_total Requests where the named cache hit.",
+                "# TYPE chatbot_cache_hits_total counter",
+            ]
+            for flag, value in sorted(self._flags.items()):
+                lines.append(f'chatbot_cache_hits_total{{cache="{flag}"}} {value}')
+
+            lines += [
+                "# HELP chatbot_tokens_total Token and character counts sent to/received from the LLM.",
+                "# TYPE chatbot_tokens_total counter",
+            ]
+            for name, value in sorted(self._tokens.items()):
+                lines.append(f'chatbot_tokens_total{{kind="{name}"}} {value}')
+
+            lines += [
+                "# HELP chatbot_stage_latency_ms Per-stage latency in milliseconds.",
+                "# TYPE chatbot_stage_latency_ms histogram",
+            ]
+            for stage, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(self.buckets, histogram["counts"]):
+                    lines.append(
+                        f'chatbot_stage_latency_ms_bucket{{stage="{stage}",le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'chatbot_stage_latency_ms_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}'
+                )
+                lines.append(
+                    f'chatbot_stage_latency_ms_sum{{stage="{stage}"}} {histogram["sum"]:.3f}'
+                )
+                lines.append(
+                    f'chatbot_stage_latency_ms_count{{stage="{stage}"}} {histogram["count"]}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(
+    sink: PrometheusSink, port: int, host: str = "0.0.0.0"
+) -> ThreadingHTTPServer:
+    """백그라운드 스레드에서 GET /metrics 로 집계를 내보내는 HTTP 서버를 띄움"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = sink.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class MetricsRecorder:
+    """요청 기록을 만들고, 끝난 기록을 모든 싱크로 보내는 객체"""
+
+    def __init__(self, sinks: Sequence[MetricsSink] = ()):
+        self.sinks = list(sinks)
+
+    def start(self, question: str, mode: str = "invoke") -> RequestTrace:
+        return RequestTrace(question, mode)
+
+    def finish(self, trace: RequestTrace):
+        """전체 시간을 기록하고 싱크로 내보냄 (여러 번 불러도 한 번만 내보냄)"""
+        if trace._finished:
+            return
+        trace._finished = True
+        trace.add_span("total", trace.elapsed_ms())
+        record = trace.to_dict()
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                print(f"메트릭 내보내기 실패 ({type(sink).__name__}): {e}")
+
+    def find_sink(self, sink_type: type) -> Optional[MetricsSink]:
+        for sink in self.sinks:
+            if isinstance(sink, sink_type):
+                return sink
+        return None
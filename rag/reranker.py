@@ -0,0 +1,181 @@
+"""검색 후보를 질문과 함께 다시 점수 매겨 LLM 에 보낼 청크를 고르는 재정렬 단계
+
+- FAISS 거리(정규화된 임베딩의 L2 제곱 거리 d)는 코사인 유사도 1 - d/2 로 바꿔 0~1 로
+  보정하므로, 이후 단계의 점수는 모두 "높을수록 관련 있음"이다.
+- 재정렬 모델은 로컬 CPU 크로스 인코더(sentence-transformers, 선택 설치)이고, 없으면
+  질문 단어의 글자 바이그램이 청크에 얼마나 들어 있는지로 점수를 매기는 어휘 기반 방식을 쓴다.
+- 후보 하나당 재정렬 시간을 지수 평균으로 추적해 지연 예산(budget_ms) 안에 들어갈
+  만큼만 후보를 한 번의 배치로 보낸다.
+"""
+
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+ScoredDocument = Tuple[Document, float]
+
+_word_re = re.compile(r"[0-9A-Za-z가-힣]+")
+
+
+def calibrated_similarity(distance: float) -> float:
+    """L2 제곱 거리를 0~1 유사도로 (코사인 유사도 1 - d/2, 음수는 0)"""
+    return min(1.0, max(0.0, 1.0 - distance / 2.0))
+
+
+class Reranker:
+    """(질문, 청크) 쌍마다 0~1 관련도 점수를 매기는 재정렬 모델
+
+    weight 는 최종 점수에서 이 모델 점수의 비중이다 (나머지는 벡터 유사도).
+    """
+
+    name = "none"
+    weight = 0.0
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        raise NotImplementedError
+
+
+class LexicalReranker(Reranker):
+    """질문 단어의 글자 바이그램 중 청크에 들어 있는 비율 (모델 없이 쓰는 대체 방식)"""
+
+    name = "lexical"
+
+    def __init__(self, weight: float = 0.4):
+        self.weight = weight
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        query_grams = {
+            word[i : i + 2]
+            for word in _word_re.findall(query.lower())
+            for i in range(len(word) - 1)
+        }
+        if not query_grams:
+            return [0.0] * len(texts)
+        # 청크 쪽은 바이그램 집합을 만들지 않고 부분 문자열 검색으로 확인 (할당 없이 빠름)
+        scores = []
+        for text in texts:
+            text = text.lower()
+            scores.append(sum(gram in text for gram in query_grams) / len(query_grams))
+        return scores
+
+
+class CrossEncoderReranker(Reranker):
+    """sentence-transformers 크로스 인코더 (점수 한 개 모델은 시그모이드를 거친 0~1 확률)"""
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str, weight: float = 0.8, max_length: int = 512):
+        from sentence_transformers import CrossEncoder  # 선택 의존성
+
+        self.model_name = model_name
+        self.weight = weight
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        if not texts:
+            return []
+        scores = self.model.predict(
+            [(query, text) for text in texts],
+            batch_size=len(texts),
+            show_progress_bar=False,
+        )
+        return np.clip(np.asarray(scores, dtype=np.float32), 0.0, 1.0).tolist()
+
+
+def load_reranker(kind: str, model_name: str) -> Optional[Reranker]:
+    """kind: auto(크로스 인코더를 쓸 수 없으면 어휘 기반) | cross-encoder | lexical | none"""
+    if kind == "none":
+        return None
+    if kind in ("auto", "cross-encoder"):
+        try:
+            return CrossEncoderReranker(model_name)
+        except Exception as e:
+            if kind == "cross-encoder":
+                print(f"크로스 인코더를 불러올 수 없습니다: {e}")
+            print("어휘 기반 재정렬을 사용합니다.")
+    return LexicalReranker()
+
+
+class RerankStage:
+    """재정렬 모델을 지연 예산 안에서 실행하고 소요 시간을 집계하는 단계 (스레드 안전)"""
+
+    def __init__(
+        self,
+        reranker: Optional[Reranker],
+        budget_ms: float,
+        min_candidates: int = 4,
+        smoothing: float = 0.2,
+    ):
+        self.reranker = reranker
+        self.budget_ms = budget_ms
+        self.min_candidates = min_candidates
+        self.smoothing = smoothing
+        self._ms_per_candidate = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "over_budget": 0, "errors": 0, "trimmed": 0}
+
+    def candidate_limit(self, count: int) -> int:
+        """예산 안에 재정렬할 수 있는 후보 수 (최근 후보당 시간으로 예측)"""
+        with self._lock:
+            per_candidate = self._ms_per_candidate
+        if per_candidate <= 0:
+            return count
+        fits = int(self.budget_ms / per_candidate)
+        return max(min(self.min_candidates, count), min(count, fits))
+
+    def _record(self, elapsed_ms: float, candidates: int, trimmed: bool):
+        with self._lock:
+            per_candidate = elapsed_ms / max(candidates, 1)
+            self._ms_per_candidate = (
+                per_candidate
+                if self._ms_per_candidate <= 0
+                else self.smoothing * per_candidate
+                + (1 - self.smoothing) * self._ms_per_candidate
+            )
+            self._counters["calls"] += 1
+            self._counters["over_budget"] += elapsed_ms > self.budget_ms
+            self._counters["trimmed"] += trimmed
+
+    def rerank(
+        self, query: str, scored_docs: Sequence[ScoredDocument], top_n: int
+    ) -> Tuple[List[ScoredDocument], Dict[str, float]]:
+        """(문서, FAISS 거리) 후보를 보정된 점수 내림차순의 상위 top_n (문서, 점수)로
+
+        후보는 거리순으로 받는다고 가정하고, 예산을 넘을 것 같으면 뒤쪽 후보를 뺀다.
+        두 번째 반환값은 기록용 정보 (재정렬한 후보 수, 소요 시간).
+        """
+        similarities = [calibrated_similarity(distance) for _, distance in scored_docs]
+        ranked = list(zip([doc for doc, _ in scored_docs], similarities))
+        info: Dict[str, float] = {"candidates": 0, "elapsed_ms": 0.0}
+        if self.reranker is not None and ranked:
+            limit = self.candidate_limit(len(ranked))
+            ranked = ranked[:limit]
+            start = time.perf_counter()
+            try:
+                scores = self.reranker.score(query, [doc.page_content for doc, _ in ranked])
+            except Exception as e:
+                print(f"재정렬 실패, 벡터 유사도 순서를 사용합니다: {e}")
+                with self._lock:
+                    self._counters["errors"] += 1
+            else:
+                weight = self.reranker.weight
+                ranked = [
+                    (doc, weight * score + (1 - weight) * similarity)
+                    for (doc, similarity), score in zip(ranked, scores)
+                ]
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self._record(elapsed_ms, len(ranked), limit < len(scored_docs))
+                info = {"candidates": len(ranked), "elapsed_ms": elapsed_ms}
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked[:top_n], info
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats: Dict[str, float] = dict(self._counters)
+            stats["ms_per_candidate"] = round(self._ms_per_candidate, 3)
+        stats["budget_ms"] = self.budget_ms
+        return stats
@@ -0,0 +1,100 @@
+"""벡터(FAISS) 검색과 BM25 키워드 검색을 합치는 하이브리드 검색"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+
+from rag.sparse_index import SparseIndex
+
+rrf_k = 60  # Reciprocal Rank Fusion 상수
+
+
+def row_document(db: FAISS, row: int) -> Document:
+    """FAISS 행 번호에 해당하는 문서"""
+    doc = db.docstore.search(db.index_to_docstore_id[row])
+    if not isinstance(doc, Document):
+        raise ValueError(f"FAISS 행 {row} 의 문서를 찾을 수 없습니다.")
+    return doc
+
+
+def build_sparse_index_from_store(db: FAISS) -> SparseIndex:
+    """sparse_index.npz 가 없는 기존 인덱스용: docstore 본문으로 역색인을 만드는 함수"""
+    return SparseIndex.build(
+        [row_document(db, row).page_content for row in range(db.index.ntotal)]
+    )
+
+
+def _dense_distances(db: FAISS, query: np.ndarray, rows: List[int]) -> Dict[int, float]:
+    """벡터 검색 결과에 없던 행들의 (제곱 L2) 거리를 계산하는 함수"""
+    distances: Dict[int, float] = {}
+    for row in rows:
+        try:
+            vector = db.index.reconstruct(row)
+        except RuntimeError:
+            continue
+        distances[row] = float(np.sum((vector - query) ** 2))
+    return distances
+
+
+def hybrid_search(
+    db: FAISS,
+    sparse_index: Optional[SparseIndex],
+    query_text: str,
+    query_vector: Sequence[float],
+    k: int,
+    fetch_k: int = 20,
+) -> List[Tuple[Document, float]]:
+    """벡터 검색과 BM25 검색 순위를 RRF 로 합쳐 상위 k 개 (문서, 벡터 거리)를 반환
+
+    점수는 기존과 같이 FAISS 거리(낮을수록 가까움)를 돌려주며, 키워드 검색에서만
+    찾은 문서도 질문 벡터와의 거리를 계산해 채운다.
+    """
+    return hybrid_search_many(
+        db, sparse_index, [query_text], [query_vector], k=k, fetch_k=fetch_k
+    )[0]
+
+
+def hybrid_search_many(
+    db: FAISS,
+    sparse_index: Optional[SparseIndex],
+    query_texts: Sequence[str],
+    query_vectors: Sequence[Sequence[float]],
+    k: int,
+    fetch_k: int = 20,
+) -> List[List[Tuple[Document, float]]]:
+    """여러 질문을 한 번에 검색하는 hybrid_search
+
+    벡터 검색은 질문 행렬 하나로 FAISS 에 보내 (FAISS 내부에서 병렬 처리)
+    질문 수만큼 따로 호출하지 않는다. 결과는 질문 순서대로 반환한다.
+    """
+    queries = np.asarray(query_vectors, dtype=np.float32)
+    use_sparse = sparse_index is not None and len(sparse_index) == db.index.ntotal
+    all_distances, all_rows = db.index.search(queries, fetch_k if use_sparse else k)
+
+    results = []
+    for query_text, query, distances, rows in zip(
+        query_texts, queries, all_distances, all_rows
+    ):
+        dense = {
+            int(row): float(distance)
+            for row, distance in zip(rows, distances)
+            if row != -1
+        }
+        if not use_sparse:
+            results.append([(row_document(db, row), d) for row, d in dense.items()])
+            continue
+
+        sparse = sparse_index.search(query_text, fetch_k)
+        fused: Dict[int, float] = {}
+        for rank, row in enumerate(dense):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (rrf_k + rank + 1)
+        for rank, (row, _) in enumerate(sparse):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (rrf_k + rank + 1)
+
+        top_rows = sorted(fused, key=fused.get, reverse=True)[:k]
+        dense.update(_dense_distances(db, query, [r for r in top_rows if r not in dense]))
+        worst = max(dense.values()) if dense else 0.0
+        results.append([(row_document(db, row), dense.get(row, worst)) for row in top_rows])
+    return results
@@ -0,0 +1,135 @@
+"""한국어용 글자 바이그램 BM25 역색인
+
+벡터 검색이 놓치기 쉬운 정확한 용어(늘봄지원실장, 자유수강권, 제16조 등)를 찾기 위해
+FAISS 인덱스와 같은 행 번호로 문서를 색인한다. 인덱스 폴더의 sparse_index.npz 에
+CSR 형태의 포스팅 목록으로 저장하며 pickle 을 쓰지 않는다.
+"""
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+sparse_file_name = "sparse_index.npz"
+
+_TOKEN_RE = re.compile(r"[가-힣]+|[A-Za-z]+|\d+(?:[.\-]\d+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """한글은 글자 바이그램, 영문은 소문자 단어, 숫자는 번호 단위로 나누는 함수"""
+    tokens: List[str] = []
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group().lower()
+        if "가" <= token[0] <= "힣" and len(token) > 1:
+            tokens.extend(token[i : i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+class SparseIndex:
+    """BM25 점수로 문서 행 번호를 찾는 역색인"""
+
+    def __init__(
+        self,
+        terms: Sequence[str],
+        term_ptr: np.ndarray,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.term_to_id: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.term_ptr = term_ptr
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, texts: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        """FAISS 행 순서의 문서 본문 목록으로 역색인을 만드는 함수"""
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[row] = sum(counts.values())
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((row, count))
+
+        terms = sorted(postings)
+        term_ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            term_ptr[i + 1] = term_ptr[i] + len(postings[term])
+        doc_ids = np.empty(term_ptr[-1], dtype=np.int32)
+        term_freqs = np.empty(term_ptr[-1], dtype=np.float32)
+        for i, term in enumerate(terms):
+            rows, counts = zip(*postings[term])
+            doc_ids[term_ptr[i] : term_ptr[i + 1]] = rows
+            term_freqs[term_ptr[i] : term_ptr[i + 1]] = counts
+        return cls(terms, term_ptr, doc_ids, term_freqs, doc_lengths, k1, b)
+
+    def save(self, index_dir: str):
+        terms = sorted(self.term_to_id, key=self.term_to_id.get)
+        np.savez(
+            os.path.join(index_dir, sparse_file_name),
+            terms=np.array(terms, dtype=str),
+            term_ptr=self.term_ptr,
+            doc_ids=self.doc_ids,
+            term_freqs=self.term_freqs,
+            doc_lengths=self.doc_lengths,
+            params=np.array([self.k1, self.b], dtype=np.float64),
+        )
+
+    @classmethod
+    def load(cls, index_dir: str):
+        with np.load(os.path.join(index_dir, sparse_file_name)) as data:
+            k1, b = data["params"]
+            return cls(
+                data["terms"].tolist(),
+                data["term_ptr"],
+                data["doc_ids"],
+                data["term_freqs"],
+                data["doc_lengths"],
+                float(k1),
+                float(b),
+            )
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """BM25 점수가 높은 순서로 (행 번호, 점수)를 반환"""
+        if not len(self):
+            return []
+        scores = np.zeros(len(self), dtype=np.float32)
+        length_norm = self.k1 * (
+            1 - self.b + self.b * self.doc_lengths / max(self.avg_length, 1e-9)
+        )
+        for term, query_count in Counter(tokenize(query)).items():
+            term_id = self.term_to_id.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+            rows = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            df = end - start
+            idf = math.log(1 + (len(self) - df + 0.5) / (df + 0.5))
+            scores[rows] += query_count * idf * tf * (self.k1 + 1) / (tf + length_norm[rows])
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+
+def has_sparse_index(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, sparse_file_name))
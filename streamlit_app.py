@@ -2,17 +2,49 @@
 
 import os
 import re
+import hashlib
+import threading
+import time
+import concurrent.futures
+from contextlib import contextmanager
 import streamlit as st
 from langchain_community.vectorstores import FAISS
 from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from langchain_openai import OpenAIEmbeddings
 from langchain.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain.schema import Document
 from dotenv import load_dotenv
-from typing import List, TypedDict, Tuple
+from typing import Callable, Iterator, List, Optional, TypedDict, Tuple
 import base64
 
-from langchain.chains.retrieval import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from rag.answer_cache import SemanticAnswerCache
+from rag.chat_history import ChatHistory, FollowUp, blend_vectors
+from rag.chat_service import (
+    ChatService,
+    ChatTicket,
+    LimitedEmbeddings,
+    is_rate_limit_error,
+)
+from rag.context_packing import estimate_tokens, pack_context
+from rag.docstore import load_faiss_index
+from rag.embedding_cache import CachedEmbeddings, normalize_text
+from rag.index_catalog import Catalog, catalog_from_index_dir, load_catalog
+from rag.metrics import (
+    JsonLogSink,
+    LLMTimingCallback,
+    MetricsRecorder,
+    PrometheusSink,
+    RequestTrace,
+    RingBufferSink,
+    serve_prometheus,
+)
+from rag.reranker import RerankStage, calibrated_similarity, load_reranker
+from rag.retrieval import build_sparse_index_from_store, hybrid_search_many
+from rag.sparse_index import SparseIndex, has_sparse_index
 
 load_dotenv()
 
@@ -26,12 +58,52 @@ def get_image_base64(image_path):
 
 
 llm_model = "gemini-2.5-flash"
+llm_temperature = 0.3  # 더 일관된 답변을 위해 낮춤
 embedding_model = "text-embedding-3-large"
+index_path = "faiss_index"
+search_k = 6  # 재정렬을 끈 경우 검색 및 LLM 컨텍스트에 사용할 문서 수
+rerank_enabled = os.getenv("RERANK", "1") != "0"  # 검색 후보를 재정렬해 상위 몇 개만 LLM 에 보냄
+reranker_kind = os.getenv("RERANKER", "auto")  # auto | cross-encoder | lexical (auto: 모델이 없으면 lexical)
+reranker_model = os.getenv("RERANKER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+rerank_candidates = 12  # 재정렬할 검색 후보 수 (질문 변형마다 이만큼 검색한 뒤 중복을 합침)
+rerank_top_n = 4  # 재정렬 후 LLM 컨텍스트에 넣을 최대 청크 수
+rerank_budget_ms = float(os.getenv("RERANK_BUDGET_MS", "150"))  # 재정렬 지연 예산 (넘으면 후보 수를 줄임)
+relevance_threshold = 0.3  # 보정된 관련도 점수(0~1)가 이 값 이상이면 관련 문서
+hybrid_search_enabled = os.getenv("HYBRID_SEARCH", "1") != "0"  # 벡터 + 키워드(BM25) 검색
+multi_query_enabled = os.getenv("MULTI_QUERY", "1") != "0"  # 질문 변형 여러 개로 함께 검색
+query_rewrite_enabled = os.getenv("QUERY_REWRITE", "0") == "1"  # LLM 으로 검색용 질문 생성 (요청 1회 추가)
+streaming_enabled = os.getenv("STREAMING", "1") != "0"
+answer_cache_enabled = os.getenv("ANSWER_CACHE", "1") != "0"
+answer_cache_max_distance = 0.05  # 이 코사인 거리 이내의 질문은 같은 질문으로 간주
+answer_cache_ttl_seconds = 60 * 60 * 24
+context_packing_enabled = os.getenv("CONTEXT_PACKING", "1") != "0"
+context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # 프롬프트 컨텍스트 추정 토큰 상한
+context_mmr_lambda = 0.7  # 1에 가까울수록 다양성보다 관련성을 우선
+metrics_sinks = os.getenv("METRICS_SINKS", "ring")  # ring, json, prometheus (쉼표로 구분)
+metrics_log_path = os.getenv("METRICS_LOG_PATH")  # json 싱크 파일 경로, 없으면 표준 출력
+metrics_port = int(os.getenv("METRICS_PORT", "9464"))  # prometheus 싱크의 /metrics 포트
+admin_key = os.getenv("ADMIN_KEY")  # ?admin=<키> 로 접속하면 사이드바에 관리자 패널 표시
+chat_service_enabled = os.getenv("CHAT_SERVICE", "1") != "0"  # 제공자별 동시 실행/요청 속도 제한과 중복 질문 합치기
+llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+llm_requests_per_minute = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+embedding_max_concurrency = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "8"))
+embedding_requests_per_minute = float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "1000"))
+llm_max_retries = 2  # 429(요청 한도 초과) 응답을 받았을 때 다시 시도할 횟수
+gemini_api_endpoint = os.getenv("GEMINI_API_ENDPOINT")  # 예: http://127.0.0.1:8799 (로컬 스텁 서버)
+follow_up_enabled = os.getenv("FOLLOW_UP", "1") != "0"  # 후속 질문을 직전 질문과 이어서 검색/답변
+follow_up_weight = 0.6  # 후속 질문 검색 벡터에서 현재 질문의 비중 (나머지는 직전 질문)
+history_max_messages = 200  # 세션에 보관할 메시지 수 (넘으면 오래된 것부터 버림)
+history_max_turns = 6  # 임베딩과 함께 보관할 최근 질문 수 (더 오래된 질문은 핵심어 요약만)
+history_page_size = 20  # 한 번에 화면에 표시할 최근 메시지 수
+greeting_message = "무엇을 도와드릴까요?"
 
 
 class ContextDocument(TypedDict):
     source: str
     content: str
+    page: Optional[int]  # 시작 페이지 (예전 벡터DB는 None)
+    page_end: Optional[int]  # 여러 페이지에 걸친 청크의 끝 페이지
+    section: str  # 제목 경로, 예: "Ⅱ. 운영 > 1. 대상"
 
 
 class ResponseDict(TypedDict):
@@ -39,8 +111,176 @@ class ResponseDict(TypedDict):
     source_documents: List[ContextDocument]
 
 
-def get_conversational_chain():
-    """개선된 프롬프트 템플릿을 사용하는 체인 생성"""
+class StreamingAnswer(TypedDict):
+    response: Optional[ResponseDict]  # 스트리밍 없이 바로 표시할 응답 (캐시 적중, 검색 실패 등)
+    source_documents: List[ContextDocument]
+    stream: Optional[Iterator[str]]
+
+
+def resolve_index(path: Optional[str] = None) -> Tuple[str, str]:
+    """(실제 인덱스 폴더, 버전 문자열)을 반환하는 함수
+
+    인덱스 경로는 빌드 도구가 바꾸는 심볼릭 링크일 수 있으므로 실제 폴더를 한 번만
+    확인하고, 로더는 모두 이 폴더를 직접 열어 벡터 인덱스와 키워드 역색인이 서로 다른
+    버전에서 읽히지 않게 한다. 버전은 폴더 파일들의 크기와 수정 시각으로 만들며,
+    폴더가 없거나 읽는 중에 사라지면 빈 문자열이다.
+    """
+    index_dir = os.path.realpath(path or index_path)
+    parts = [index_dir]
+    try:
+        for name in sorted(os.listdir(index_dir)):
+            stat = os.stat(os.path.join(index_dir, name))
+            parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+    except FileNotFoundError:
+        return index_dir, ""
+    return index_dir, hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def get_index_version(path: Optional[str] = None) -> str:
+    """인덱스 버전 문자열 (폴더가 없으면 빈 문자열)"""
+    return resolve_index(path)[1]
+
+
+@st.cache_resource(show_spinner=False)
+def get_chat_service() -> ChatService:
+    """프로세스 전체에서 공유하는 제공자별 한도/대기열 (모든 세션이 같은 한도를 나눠 씀)"""
+    return ChatService(
+        {
+            "embeddings": (embedding_max_concurrency, embedding_requests_per_minute),
+            "llm": (llm_max_concurrency, llm_requests_per_minute),
+        }
+    )
+
+
+@contextmanager
+def provider_slot(
+    provider: str,
+    trace: Optional[RequestTrace] = None,
+    on_wait: Optional[Callable[[int], None]] = None,
+) -> Iterator[None]:
+    """제공자 한도 안에서 실행할 구간, 서비스 계층을 끄면 제한 없이 실행
+
+    trace 가 주어지면 자리를 기다린 시간을 queue_<제공자> 단계로 기록한다.
+    """
+    if not chat_service_enabled:
+        yield
+        return
+    start = time.perf_counter()
+    with get_chat_service().slot(provider, on_wait):
+        if trace is not None:
+            trace.add_span(f"queue_{provider}", (time.perf_counter() - start) * 1000)
+        yield
+
+
+@st.cache_resource(show_spinner=False)
+def get_embeddings() -> CachedEmbeddings:
+    """프로세스 전체에서 공유하는 (캐시된) 임베딩 클라이언트"""
+    # embeddings = GoogleGenerativeAIEmbeddings(model=embedding_model)
+    embeddings = OpenAIEmbeddings(model=embedding_model)
+    if chat_service_enabled:
+        # 캐시에 없어 실제로 API 를 부를 때만 임베딩 한도 자리를 차지
+        embeddings = LimitedEmbeddings(embeddings, get_chat_service())
+    return CachedEmbeddings(embeddings, model_name=embedding_model)
+
+
+@st.cache_resource(show_spinner="벡터DB를 불러오는 중...", max_entries=1)
+def _load_vector_store(index_dir: str, index_version: str) -> FAISS:
+    """인덱스 버전별로 한 번만 벡터DB를 로드 (모든 세션이 공유)"""
+    print(f"벡터DB 로드 (버전: {index_version})")
+    # 문서 본문은 mmap docstore 에서 검색된 문서만 읽어옴 (pickle 로드 없음)
+    return load_faiss_index(index_dir, get_embeddings())
+
+
+def load_vector_store(index: Optional[Tuple[str, str]] = None) -> FAISS:
+    """캐시된 벡터DB를 반환하고, 디스크의 인덱스가 바뀌었으면 다시 로드하는 함수
+
+    index 는 resolve_index() 의 결과이며, 한 요청에서 다른 로더와 같은 값을 넘긴다.
+    """
+    return _load_vector_store(*(index or resolve_index()))
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_sparse_index(index_dir: str, index_version: str) -> SparseIndex:
+    """인덱스 버전별 BM25 역색인 (없으면 docstore 본문으로 한 번 만들어 둠)"""
+    if has_sparse_index(index_dir):
+        return SparseIndex.load(index_dir)
+    print("sparse_index.npz 가 없어 키워드 역색인을 메모리에서 생성합니다.")
+    return build_sparse_index_from_store(_load_vector_store(index_dir, index_version))
+
+
+def load_sparse_index(index: Optional[Tuple[str, str]] = None) -> Optional[SparseIndex]:
+    """하이브리드 검색용 키워드 역색인, 사용하지 않으면 None"""
+    if not hybrid_search_enabled:
+        return None
+    return _load_sparse_index(*(index or resolve_index()))
+
+
+@st.cache_resource(show_spinner="재정렬 모델을 불러오는 중...")
+def get_rerank_stage() -> RerankStage:
+    """프로세스 전체에서 공유하는 재정렬 모델과 지연 예산"""
+    reranker = load_reranker(reranker_kind, reranker_model)
+    print(f"재정렬: {reranker.name if reranker else '사용 안 함'}")
+    return RerankStage(reranker, rerank_budget_ms)
+
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def _load_index_catalog(index_dir: str, index_version: str) -> Optional[Catalog]:
+    """인덱스 버전별 문서 목록/통계 (catalog.json 이 없으면 docstore 메타데이터로 만듦)"""
+    catalog = load_catalog(index_dir)
+    if catalog is not None:
+        return catalog
+    print("catalog.json 이 없어 docstore 메타데이터로 문서 목록을 만듭니다.")
+    try:
+        return catalog_from_index_dir(index_dir)
+    except Exception as e:
+        print(f"문서 목록을 만들 수 없습니다: {e}")
+        return None
+
+
+def load_index_catalog() -> Optional[Catalog]:
+    """벡터DB의 문서 목록과 통계, 벡터DB가 없으면 None (벡터나 임베딩 API 는 쓰지 않음)"""
+    index_dir, index_version = resolve_index()
+    if not index_version:
+        return None
+    return _load_index_catalog(index_dir, index_version)
+
+
+def document_title(source: str) -> str:
+    """문서 목록에 표시할 이름 (파일 확장자 제외)"""
+    return os.path.splitext(source)[0]
+
+
+@st.cache_resource(show_spinner=False)
+def get_answer_cache() -> SemanticAnswerCache:
+    """프로세스 전체에서 공유하는 의미 기반 답변 캐시"""
+    return SemanticAnswerCache(
+        max_distance=answer_cache_max_distance,
+        ttl_seconds=answer_cache_ttl_seconds,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_metrics_recorder() -> MetricsRecorder:
+    """METRICS_SINKS 설정에 따라 요청 기록을 내보낼 싱크를 구성"""
+    sinks = []
+    names = {name.strip() for name in metrics_sinks.split(",") if name.strip()}
+    if "ring" in names:
+        sinks.append(RingBufferSink())
+    if "json" in names:
+        sinks.append(JsonLogSink(metrics_log_path))
+    if "prometheus" in names:
+        prometheus_sink = PrometheusSink()
+        try:
+            serve_prometheus(prometheus_sink, metrics_port)
+            print(f"메트릭 엔드포인트: http://0.0.0.0:{metrics_port}/metrics")
+        except OSError as e:
+            print(f"메트릭 엔드포인트를 열 수 없습니다: {e}")
+        sinks.append(prometheus_sink)
+    return MetricsRecorder(sinks)
+
+
+def get_rag_prompt() -> PromptTemplate:
+    """컨텍스트와 질문으로 답변을 요청하는 프롬프트"""
     prompt_template = """당신은 초등학교 돌봄교실, 방과후교실, 늘봄교실 운영에 관한 전문가입니다.
 
 **중요한 지침:**
@@ -62,20 +302,69 @@ def get_conversational_chain():
 
 답변:"""
 
-    model = ChatGoogleGenerativeAI(
-        model=llm_model,
-        temperature=0.3,  # 더 일관된 답변을 위해 낮춤
-    )
-
-    prompt = PromptTemplate(
+    return PromptTemplate(
         template=prompt_template,
         input_variables=["context", "input"],
     )
 
-    stuff_documents_chain = create_stuff_documents_chain(model, prompt)
+
+def make_chat_model(model_name: str, temperature: float) -> ChatGoogleGenerativeAI:
+    """Gemini 채팅 모델, GEMINI_API_ENDPOINT 가 있으면 그 주소로 REST 요청을 보냄"""
+    if gemini_api_endpoint:
+        return ChatGoogleGenerativeAI(
+            model=model_name,
+            temperature=temperature,
+            transport="rest",
+            client_options={"api_endpoint": gemini_api_endpoint},
+        )
+    return ChatGoogleGenerativeAI(model=model_name, temperature=temperature)
+
+
+@st.cache_resource(show_spinner=False)
+def get_conversational_chain(
+    model_name: str = llm_model, temperature: float = llm_temperature
+):
+    """개선된 프롬프트 템플릿을 사용하는 체인 생성
+
+    모델/온도 조합별로 프로세스에서 한 번만 만들어 모든 세션이 재사용한다.
+    같은 클라이언트를 계속 쓰므로 Gemini 엔드포인트와의 연결(gRPC 채널)도
+    질문 사이에 유지되어 매번 TLS 핸드셰이크를 하지 않는다.
+    """
+    print(f"RAG 체인 생성 (모델: {model_name}, 온도: {temperature})")
+    model = make_chat_model(model_name, temperature)
+
+    stuff_documents_chain = create_stuff_documents_chain(model, get_rag_prompt())
     return stuff_documents_chain
 
 
+@st.cache_resource(show_spinner=False)
+def get_rewrite_chain():
+    """질문을 문서 검색에 맞는 한 줄짜리 검색 문장으로 바꾸는 체인"""
+    prompt = PromptTemplate(
+        template="""다음은 초등학교 늘봄학교/돌봄교실/방과후학교 담당 교사의 질문입니다.
+관련 공문서와 지침에서 답을 찾기 좋도록, 핵심 용어를 살린 검색 문장 한 줄로 바꿔 쓰세요.
+설명 없이 검색 문장만 답하세요.
+
+질문: {question}
+
+검색 문장:""",
+        input_variables=["question"],
+    )
+    model = make_chat_model(llm_model, 0)
+    return prompt | model | StrOutputParser()
+
+
+@st.cache_data(show_spinner=False, max_entries=512, ttl=60 * 60)
+def rewrite_question(question: str) -> str:
+    """LLM 이 다시 쓴 검색용 질문 (실패하면 빈 문자열)"""
+    try:
+        with provider_slot("llm"):
+            return get_rewrite_chain().invoke({"question": question}).strip()
+    except Exception as e:
+        print(f"질문 재작성 실패: {e}")
+        return ""
+
+
 def preprocess_question(question: str) -> str:
     """질문을 전처리하여 검색 정확도를 높이는 함수"""
 
@@ -94,6 +383,58 @@ def preprocess_question(question: str) -> str:
     return question.strip()
 
 
+_question_stopwords = {
+    "어떻게", "어떤", "무엇", "무엇인가요", "뭐", "뭔가요", "언제", "어디", "어디서", "왜",
+    "누구", "누가", "얼마", "얼마나", "몇", "알려", "주세요", "궁금합니다", "궁금해요",
+    "하는", "방법", "있나요", "있습니까", "되나요", "됩니까", "인가요", "입니까", "하나요",
+    "합니까", "해야", "하나", "좀", "관련", "대해", "대해서", "그리고", "또는", "가르쳐",
+    "그럼", "그러면", "그렇다면",
+}  # fmt: skip
+# 순서대로 어미 → 조사 → 동사화 접미사를 뗀다. '휴가', '제도', '문의' 처럼 명사 끝 글자와
+# 겹치기 쉬운 조사(이/가/도/의/로/과/만)는 떼지 않는다.
+_word_suffix_res = [
+    re.compile(r"(?:인가요|나요|까요|습니까|입니까|주세요|세요|해요|가요|요)$"),
+    re.compile(r"(?:에서는|에서|에게|으로|까지|부터|이나|이란|은|는|을|를|에|와)$"),
+    re.compile(r"(?:되|하|해)$"),
+]
+
+
+def extract_keywords(question: str) -> str:
+    """질문에서 의문사, 어미, 조사를 빼고 핵심 단어만 남긴 검색어를 만드는 함수"""
+    keywords = []
+    for word in re.findall(r"[0-9A-Za-z가-힣]+", question):
+        if word in _question_stopwords:
+            continue
+        for suffix_re in _word_suffix_res:
+            # 두 글자 이하 단어는 '이하', '위해' 처럼 끝 글자까지 단어인 경우가 많아 그대로 둠
+            if len(word) > 2:
+                word = suffix_re.sub("", word)
+        if word and word not in _question_stopwords and word not in keywords:
+            keywords.append(word)
+    return " ".join(keywords)
+
+
+def get_query_variants(user_question: str) -> List[str]:
+    """함께 검색할 질문 변형 목록 (첫 번째는 항상 원래 질문, 중복 제거)
+
+    원래 질문, 존댓말을 정리한 질문, 핵심 단어만 남긴 검색어, (설정 시) LLM 재작성 질문
+    """
+    variants = [user_question]
+    if multi_query_enabled:
+        variants += [preprocess_question(user_question), extract_keywords(user_question)]
+        if query_rewrite_enabled:
+            variants.append(rewrite_question(user_question))
+
+    unique_variants: List[str] = []
+    seen = set()
+    for variant in variants:
+        key = re.sub(r"\s+", " ", variant).strip()
+        if key and key not in seen:
+            seen.add(key)
+            unique_variants.append(variant)
+    return unique_variants
+
+
 def analyze_search_results(
     user_question: str, similar_docs: List[Tuple], threshold: float = 0.7
 ):
@@ -107,7 +448,10 @@ def analyze_search_results(
         relevant_docs = []
         for i, (doc, score) in enumerate(similar_docs):
             with st.expander(f"문서 {i+1} (점수: {score:.3f})"):
-                st.write(f"**출처:** {doc.metadata.get('source', 'Unknown')}")
+                st.write(
+                    f"**출처:** {doc.metadata.get('source', 'Unknown')}"
+                    f"{format_citation(doc.metadata)}"
+                )
                 st.write(f"**내용 길이:** {len(doc.page_content)}")
                 st.write(
                     f"**관련성:** {'높음 ✅' if score >= threshold else '낮음 ❌'}"
@@ -133,7 +477,7 @@ def analyze_search_results(
     for i, (doc, score) in enumerate(similar_docs):
         print(f"\n문서 {i+1}:")
         print(f"  점수: {score:.3f}")
-        print(f"  출처: {doc.metadata.get('source', 'Unknown')}")
+        print(f"  출처: {doc.metadata.get('source', 'Unknown')}{format_citation(doc.metadata)}")
         print(f"  내용 길이: {len(doc.page_content)}")
         print(f"  내용 미리보기: {doc.page_content[:150]}...")
 
@@ -148,184 +492,769 @@ def analyze_search_results(
 
 
 def check_vector_db_quality():
-    """벡터 DB의 품질을 체크하는 함수"""
+    """벡터 DB의 품질을 체크하는 함수 (빌드할 때 저장한 카탈로그만 읽음)"""
 
-    if not os.path.exists("faiss_index"):
+    if not os.path.exists(index_path):
         st.error("벡터DB가 존재하지 않습니다.")
         return
 
     try:
-        # embeddings = GoogleGenerativeAIEmbeddings(model=embedding_model)
-        embeddings = OpenAIEmbeddings(model=embedding_model)
-        db = FAISS.load_local(
-            "faiss_index", embeddings, allow_dangerous_deserialization=True
-        )
+        catalog = load_index_catalog()
+        if catalog is None:
+            st.error("벡터DB의 문서 목록을 읽을 수 없습니다.")
+            return
 
         # 벡터 DB 통계
-        total_docs = db.index.ntotal
-        st.success(f"벡터DB 로드 성공!")
-        st.write(f"**총 문서 수:** {total_docs}")
+        index_info = catalog["index"]
+        st.success(f"벡터DB 확인 완료!")
+        st.write(
+            f"**총 문서 수:** {len(catalog['sources'])}개 "
+            f"(청크 {index_info['vectors']}개)\n\n"
+            f"**인덱스:** {index_info['kind']}, {index_info['dimension']}차원, "
+            f"{index_info['total_bytes'] / 1024 / 1024:.1f}MB\n\n"
+            f"**임베딩 모델:** {catalog['embedding_model'] or '알 수 없음'}\n\n"
+            f"**빌드 시각:** "
+            f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(catalog['built_at']))}"
+        )
+        st.dataframe(
+            [
+                {
+                    "문서": entry["source"],
+                    "청크": entry["chunks"],
+                    "페이지": entry["pages"],
+                    "섹션": entry["sections"],
+                    "글자 수": entry["chars"],
+                }
+                for entry in catalog["sources"]
+            ],
+            hide_index=True,
+        )
 
-        # 샘플 문서들 확인
-        if total_docs > 0:
-            sample_docs = db.similarity_search("", k=min(5, total_docs))
+        # 샘플 문서들 확인 (문서마다 첫 청크의 미리보기)
+        if catalog["samples"]:
             st.write("**샘플 문서들:**")
-            for i, doc in enumerate(sample_docs):
+            for i, sample in enumerate(catalog["samples"]):
                 with st.expander(f"샘플 문서 {i+1}"):
-                    st.write(f"**출처:** {doc.metadata.get('source', 'Unknown')}")
-                    st.write(f"**길이:** {len(doc.page_content)}")
+                    st.write(f"**출처:** {sample['source']}{format_citation(sample)}")
+                    st.write(f"**길이:** {sample['chars']}")
                     st.write(f"**내용:**")
                     st.text(
-                        doc.page_content[:200] + "..."
-                        if len(doc.page_content) > 200
-                        else doc.page_content
+                        sample["preview"] + "..."
+                        if sample["chars"] > len(sample["preview"])
+                        else sample["preview"]
                     )
 
     except Exception as e:
         st.error(f"벡터DB 체크 중 오류 발생: {e}")
 
 
+def get_chat_history() -> ChatHistory:
+    """현재 세션의 대화 기록 (없으면 새로 만듦)"""
+    if "chat_history" not in st.session_state:
+        st.session_state.chat_history = ChatHistory(
+            greeting_message,
+            max_messages=history_max_messages,
+            max_turns=history_max_turns,
+        )
+    return st.session_state.chat_history
+
+
 def clear_chat_history():
     """채팅 기록을 지우는 함수"""
-    st.session_state.messages = [
-        {"role": "assistant", "content": "무엇을 도와드릴까요?"}
-    ]
+    get_chat_history().clear()
+    st.session_state.history_pages = 1
+
+
+def dedupe_search_results(
+    search_results: List[Tuple[Document, float]], k: int
+) -> List[Tuple[Document, float]]:
+    """출처+내용이 같은 검색 결과를 하나로 합치고 점수순으로 k개를 고르는 함수"""
+    unique_results = {}
+    for doc, score in search_results:
+        doc_id = f"{doc.metadata.get('source', '')}_{hash(doc.page_content)}"
+        if doc_id not in unique_results or unique_results[doc_id][1] > score:
+            unique_results[doc_id] = (doc, score)
+
+    # 점수순 정렬
+    return sorted(unique_results.values(), key=lambda x: x[1])[:k]
+
+
+def candidate_k() -> int:
+    """질문 변형 하나당 검색할 후보 수"""
+    return rerank_candidates if rerank_enabled else search_k
+
+
+def rank_search_results(
+    user_question: str,
+    search_results: List[Tuple[Document, float]],
+    trace: Optional[RequestTrace] = None,
+) -> List[Tuple[Document, float]]:
+    """검색 결과의 중복을 합치고 재정렬해 (문서, 보정된 관련도 점수 0~1) 상위 목록을 반환
+
+    재정렬을 끄면 FAISS 거리만 유사도로 바꿔 search_k 개를 돌려준다.
+    trace 가 주어지면 재정렬 시간과 후보 수를 기록한다.
+    """
+    if not rerank_enabled:
+        return [
+            (doc, calibrated_similarity(distance))
+            for doc, distance in dedupe_search_results(search_results, search_k)
+        ]
+    candidates = dedupe_search_results(search_results, rerank_candidates)
+    ranked, info = get_rerank_stage().rerank(user_question, candidates, rerank_top_n)
+    if trace is not None:
+        trace.add_span("rerank", info["elapsed_ms"])
+        trace.tokens["rerank_candidates"] = int(info["candidates"])
+    return ranked
+
+
+def embed_query_variants(
+    user_question: str, trace: RequestTrace, follow_up: Optional[FollowUp] = None
+) -> Tuple[List[str], List[List[float]]]:
+    """질문 변형들을 한 번의 배치 요청으로 임베딩하고 소요 시간과 캐시 적중 여부를 기록
+
+    변형 목록과 임베딩은 캐시되므로 같은 요청에서 다시 부르면 API 호출이 없다.
+    후속 질문이면 직전 질문의 핵심어를 붙인 검색어를 변형에 더하고, 그 벡터는 저장된
+    직전 질문의 임베딩과 섞어 만든다 (직전 임베딩이 없을 때만 같은 배치로 임베딩).
+    """
+    variants = get_query_variants(user_question)
+    blend_previous = follow_up is not None and follow_up["previous_vector"] is not None
+    if follow_up is not None and not blend_previous:
+        variants.append(follow_up["search_text"])
+    embeddings = get_embeddings()
+    misses_before = (
+        embeddings.stats()["misses"] if isinstance(embeddings, CachedEmbeddings) else None
+    )
+    with trace.span("embed"):
+        if isinstance(embeddings, CachedEmbeddings):
+            query_vectors = embeddings.embed_queries(variants)
+        else:
+            query_vectors = [embeddings.embed_query(variant) for variant in variants]
+    if misses_before is not None:
+        # 한 요청에서 여러 번 임베딩하면 처음 계산할 때의 적중 여부를 남김
+        trace.flags.setdefault(
+            "embedding_cache", embeddings.stats()["misses"] == misses_before
+        )
+    if blend_previous:
+        variants = variants + [follow_up["search_text"]]
+        query_vectors = query_vectors + [
+            blend_vectors(query_vectors[0], follow_up["previous_vector"], follow_up_weight)
+        ]
+    return variants, query_vectors
 
 
-def user_input(user_question: str) -> ResponseDict:
-    """개선된 사용자 입력 처리 함수"""
-    # embeddings = GoogleGenerativeAIEmbeddings(model=embedding_model)
-    embeddings = OpenAIEmbeddings(model=embedding_model)
+def embed_question(user_question: str, trace: RequestTrace) -> List[float]:
+    """원래 질문의 임베딩 (다른 질문 변형도 같은 배치로 미리 임베딩해 둠)"""
+    return embed_query_variants(user_question, trace)[1][0]
+
 
-    if not os.path.exists("faiss_index"):
+def select_context_docs(
+    similar_docs: List[Tuple[Document, float]], trace: Optional[RequestTrace] = None
+) -> List[Document]:
+    """검색 결과에서 겹치는 부분을 합치고 토큰 예산 안에서 LLM에 보낼 문서를 고르는 함수"""
+    if not context_packing_enabled:
+        return [doc for doc, _ in similar_docs]
+
+    packed = pack_context(similar_docs, context_token_budget, context_mmr_lambda)
+    if trace is not None:
+        trace.tokens["context_tokens_unpacked"] = sum(
+            estimate_tokens(doc.page_content) for doc, _ in similar_docs
+        )
+        trace.tokens["context_tokens"] = sum(
+            estimate_tokens(doc.page_content) for doc, _ in packed
+        )
+    return [doc for doc, _ in packed]
+
+
+def no_context_response(user_question: str) -> ResponseDict:
+    """관련 문서를 찾지 못했을 때 보여줄 응답"""
+    return {
+        "output_text": f"죄송합니다. 제공된 문서에서 '{user_question}'에 대한 관련 정보를 찾을 수 없습니다.\n\n다음을 시도해보세요:\n- 더 구체적인 키워드 사용\n- 다른 표현으로 질문\n- 디버그 모드에서 검색 과정 확인",
+        "source_documents": [],
+    }
+
+
+def retrieve_context(
+    user_question: str,
+    trace: Optional[RequestTrace] = None,
+    follow_up: Optional[FollowUp] = None,
+) -> Tuple[List[Document], Optional[ResponseDict]]:
+    """질문에 대한 컨텍스트 문서를 검색하는 함수
+
+    관련 문서가 없거나 오류가 나면 문서 대신 바로 보여줄 응답을 함께 반환한다.
+    trace 가 주어지면 임베딩/검색/필터 단계의 소요 시간을 기록한다.
+    follow_up 이 주어지면 직전 질문과 이은 검색어도 같은 배치 검색에 넣는다.
+    """
+    trace = trace or RequestTrace(user_question)
+    if not os.path.exists(index_path):
         st.error("벡터DB가 존재하지 않습니다.")
-        return {"output_text": "벡터DB가 존재하지 않습니다.", "source_documents": []}
+        return [], {
+            "output_text": "벡터DB가 존재하지 않습니다.",
+            "source_documents": [],
+        }
 
     try:
-        new_db = FAISS.load_local(
-            "faiss_index", embeddings, allow_dangerous_deserialization=True
-        )
+        # 벡터 인덱스와 키워드 역색인을 같은 버전의 폴더에서 읽도록 한 번만 확인
+        index = resolve_index()
+        new_db = load_vector_store(index)
 
-        # 유사도 임계값 가져오기 (사이드바에서 설정)
+        # 관련도 임계값 가져오기 (사이드바에서 설정, 재정렬 단계에서 보정한 0~1 점수 기준)
         similarity_threshold = st.session_state.get(
-            "similarity_threshold", 0.5
-        )  # 기본값을 0.5로 낮춤
+            "similarity_threshold", relevance_threshold
+        )
 
-        # 질문 전처리
-        # user_question = preprocess_question(user_question)
+        # 다중 검색 전략: 원본/전처리/핵심어(/LLM 재작성) 질문을 한 번의 배치로 임베딩
+        # (같은 질문은 캐시에서 가져옴)
+        embeddings = get_embeddings()
+        variants, query_vectors = embed_query_variants(user_question, trace, follow_up)
+        if isinstance(embeddings, CachedEmbeddings):
+            print(f"임베딩 캐시: {embeddings.stats()}")
+        print(f"검색 질문 변형: {variants}")
 
-        # 다중 검색 전략 적용
+        # 모든 변형을 한 번의 FAISS 배치 검색으로 찾음 (벡터 + 키워드 순위를 RRF로 결합)
+        sparse_index = load_sparse_index(index)
         search_results = []
+        with trace.span("search"):
+            for variant_results in hybrid_search_many(
+                new_db, sparse_index, variants, query_vectors, k=candidate_k()
+            ):
+                search_results.extend(variant_results)
 
-        # 1. 원본 질문으로 검색
-        original_results = new_db.similarity_search_with_score(user_question, k=5)
-        search_results.extend(original_results)
+        # 중복 제거 후 후보를 재정렬해 상위 몇 개만 남김 (점수는 높을수록 관련 있음)
+        similar_docs = rank_search_results(user_question, search_results, trace)
 
-        # 2. 전처리된 질문으로 검색
-        if user_question != user_question:
-            processed_results = new_db.similarity_search_with_score(user_question, k=5)
-            search_results.extend(processed_results)
+        with trace.span("filter"):
+            # 검색 결과 분석
+            relevant_docs = analyze_search_results(
+                user_question, similar_docs, similarity_threshold
+            )
 
-        # 중복 제거 및 점수로 정렬
-        unique_results = {}
-        for doc, score in search_results:
-            doc_id = f"{doc.metadata.get('source', '')}_{hash(doc.page_content)}"
-            if doc_id not in unique_results or unique_results[doc_id][1] > score:
-                unique_results[doc_id] = (doc, score)
+        # 여전히 관련 문서가 없으면 조기 반환
+        if not relevant_docs:
+            trace.status = "no_context"
+            return [], no_context_response(user_question)
 
-        # 점수순 정렬
-        similar_docs = sorted(unique_results.values(), key=lambda x: x[1])[:8]
+        # 검색된 문서를 재검색 없이 정리해서 체인에 전달
+        with trace.span("pack"):
+            context_docs = select_context_docs(relevant_docs, trace)
+        return context_docs, None
 
-        # 검색 결과 분석
-        relevant_docs = analyze_search_results(
-            user_question, similar_docs, similarity_threshold
-        )
+    except Exception as e:
+        trace.status = "error"
+        st.error(f"문서 검색 중 오류 발생: {e}")
+        return [], {"output_text": f"오류가 발생했습니다: {e}", "source_documents": []}
+
+
+def build_source_info(context_docs: List[Document]) -> List[ContextDocument]:
+    """LLM에 전달된 문서들로 참고 문서 정보를 만드는 함수"""
+    source_info: List[ContextDocument] = []
+    for doc in context_docs:
+        if "source" in doc.metadata:
+            source_info.append(
+                {
+                    "source": doc.metadata["source"],
+                    "content": doc.page_content,
+                    "page": doc.metadata.get("page"),
+                    "page_end": doc.metadata.get("page_end"),
+                    "section": doc.metadata.get("section", ""),
+                }
+            )
+    return source_info
+
+
+def format_pages(page: Optional[int], page_end: Optional[int] = None) -> str:
+    """페이지 인용 문자열, 예: "p.3", "p.3-5" (페이지 정보가 없으면 빈 문자열)"""
+    if page is None:
+        return ""
+    if page_end is not None and page_end != page:
+        return f"p.{page}-{page_end}"
+    return f"p.{page}"
 
-        # 여전히 관련 문서가 없으면 조기 반환
-        if not relevant_docs:
-            return {
-                "output_text": f"죄송합니다. 제공된 문서에서 '{user_question}'에 대한 관련 정보를 찾을 수 없습니다.\n\n다음을 시도해보세요:\n- 더 구체적인 키워드 사용\n- 다른 표현으로 질문\n- 디버그 모드에서 검색 과정 확인",
-                "source_documents": [],
-            }
-
-        # retriever 설정 개선
-        retriever = new_db.as_retriever(
-            search_type="similarity",
-            search_kwargs={
-                "k": 8,
-            },
-        )
 
-        # RAG 체인 실행
-        document_chain = get_conversational_chain()
-        retrieval_chain = create_retrieval_chain(retriever, document_chain)
-
-        response = retrieval_chain.invoke({"input": user_question})
-
-        # 참고 문서 정보 수집
-        source_info: List[ContextDocument] = []
-        for doc in response["context"]:
-            if "source" in doc.metadata:
-                source_info.append(
-                    {
-                        "source": doc.metadata["source"],
-                        "content": doc.page_content,
-                    }
-                )
+def format_citation(metadata) -> str:
+    """출처 뒤에 붙일 " (p.3 · Ⅱ. 운영)" 형태의 페이지/섹션 표시 (정보가 없으면 빈 문자열)"""
+    parts = [
+        format_pages(metadata.get("page"), metadata.get("page_end")),
+        metadata.get("section") or "",
+    ]
+    parts = [part for part in parts if part]
+    return f" ({' · '.join(parts)})" if parts else ""
+
+
+def user_input(
+    user_question: str,
+    trace: Optional[RequestTrace] = None,
+    follow_up: Optional[FollowUp] = None,
+) -> ResponseDict:
+    """개선된 사용자 입력 처리 함수
+
+    trace 를 넘기지 않으면 이 호출만의 기록을 만들어 끝날 때 내보낸다.
+    """
+    recorder = get_metrics_recorder()
+    owns_trace = trace is None
+    trace = trace or recorder.start(user_question)
+    try:
+        return _user_input(user_question, trace, follow_up)
+    finally:
+        if owns_trace:
+            recorder.finish(trace)
+
+
+def llm_question(user_question: str, follow_up: Optional[FollowUp] = None) -> str:
+    """LLM 에 보낼 질문 (후속 질문이면 직전 질문과 앞선 대화 주제를 붙임)"""
+    return follow_up["question"] if follow_up is not None else user_question
+
+
+def _user_input(
+    user_question: str, trace: RequestTrace, follow_up: Optional[FollowUp] = None
+) -> ResponseDict:
+    context_docs, early_response = retrieve_context(user_question, trace, follow_up)
+    if early_response is not None:
+        return early_response
+    return generate_answer(llm_question(user_question, follow_up), context_docs, trace)
 
-        response_text: str = response["answer"]
 
-        return {"output_text": response_text, "source_documents": source_info}
+def generate_answer(
+    user_question: str, context_docs: List[Document], trace: RequestTrace
+) -> ResponseDict:
+    """검색된 컨텍스트 문서로 LLM 답변을 생성하는 함수"""
+    try:
+        # RAG 체인 실행 (LLM 한도 안에서, 429 응답이면 잠시 뒤 다시 시도)
+        document_chain = get_conversational_chain()
+        for attempt in range(llm_max_retries + 1):
+            try:
+                with provider_slot("llm", trace):
+                    response_text: str = document_chain.invoke(
+                        {"input": user_question, "context": context_docs},
+                        config={"callbacks": [LLMTimingCallback(trace)]},
+                    )
+                break
+            except Exception as e:
+                if attempt == llm_max_retries or not is_rate_limit_error(e):
+                    raise
+                trace.tokens["llm_retries"] = attempt + 1
+                time.sleep(2**attempt)
+
+        return {
+            "output_text": response_text,
+            "source_documents": build_source_info(context_docs),
+        }
 
     except Exception as e:
+        trace.status = "error"
         st.error(f"답변 생성 중 오류 발생: {e}")
         return {"output_text": f"오류가 발생했습니다: {e}", "source_documents": []}
 
 
+def get_answer_cache_key(
+    user_question: str, trace: RequestTrace
+) -> Optional[Tuple[List[float], str]]:
+    """답변 캐시 조회에 쓸 (질문 임베딩, 캐시 버전)을 반환, 캐시를 쓰지 않으면 None"""
+    if (
+        not answer_cache_enabled
+        or st.session_state.get("bypass_answer_cache", False)
+        or not os.path.exists(index_path)
+    ):
+        return None
+
+    try:
+        # 답변이 인덱스와 모델에 따라 달라지므로 둘 다 캐시 버전에 포함
+        cache_version = f"{get_index_version()}:{llm_model}:{llm_temperature}"
+        query_vector = embed_question(user_question, trace)
+    except Exception as e:
+        print(f"답변 캐시 확인 실패: {e}")
+        return None
+    return query_vector, cache_version
+
+
+def lookup_cached_answer(
+    cache_key: Optional[Tuple[List[float], str]], trace: RequestTrace
+) -> Optional[ResponseDict]:
+    """캐시에 저장된 비슷한 질문의 답변을 찾는 함수"""
+    if cache_key is None:
+        return None
+    answer_cache = get_answer_cache()
+    with trace.span("answer_cache"):
+        cached_response = answer_cache.lookup(*cache_key)
+    trace.flags["answer_cache"] = cached_response is not None
+    if cached_response is not None:
+        print(f"답변 캐시 적중: {answer_cache.stats()}")
+    return cached_response
+
+
+def store_cached_answer(
+    cache_key: Optional[Tuple[List[float], str]], response: ResponseDict
+):
+    """답변을 캐시에 저장하는 함수"""
+    # 관련 문서를 찾은 정상 답변만 저장 (오류/검색 실패 응답은 제외)
+    if cache_key is not None and response["source_documents"]:
+        get_answer_cache().store(cache_key[0], cache_key[1], response)
+
+
+def answer_question(
+    user_question: str, follow_up: Optional[FollowUp] = None
+) -> ResponseDict:
+    """답변 캐시를 먼저 확인하고, 없을 때만 user_input으로 답변을 생성하는 함수
+
+    후속 질문은 앞 대화에 따라 뜻이 달라지므로 답변 캐시를 쓰지 않는다.
+    """
+    recorder = get_metrics_recorder()
+    trace = recorder.start(user_question)
+    try:
+        cache_key = (
+            get_answer_cache_key(user_question, trace) if follow_up is None else None
+        )
+        cached_response = lookup_cached_answer(cache_key, trace)
+        if cached_response is not None:
+            return cached_response
+
+        # user_input 안의 질문 임베딩은 임베딩 캐시에서 바로 가져옴
+        response = user_input(user_question, trace, follow_up)
+        store_cached_answer(cache_key, response)
+        return response
+    finally:
+        recorder.finish(trace)
+
+
+def stream_question(
+    user_question: str, follow_up: Optional[FollowUp] = None
+) -> StreamingAnswer:
+    """검색까지 마친 뒤, 답변은 토큰 스트림으로 생성하도록 준비하는 함수
+
+    요청 기록은 스트림이 끝날 때(스트림이 없으면 바로) 내보낸다.
+    """
+    recorder = get_metrics_recorder()
+    trace = recorder.start(user_question, mode="stream")
+    cache_key = (
+        get_answer_cache_key(user_question, trace) if follow_up is None else None
+    )
+    cached_response = lookup_cached_answer(cache_key, trace)
+    if cached_response is not None:
+        recorder.finish(trace)
+        return {
+            "response": cached_response,
+            "source_documents": cached_response["source_documents"],
+            "stream": None,
+        }
+
+    context_docs, early_response = retrieve_context(user_question, trace, follow_up)
+    if early_response is not None:
+        recorder.finish(trace)
+        return {"response": early_response, "source_documents": [], "stream": None}
+
+    source_info = build_source_info(context_docs)
+
+    def token_stream() -> Iterator[str]:
+        chunks: List[str] = []
+        try:
+            document_chain = get_conversational_chain()
+            for attempt in range(llm_max_retries + 1):
+                try:
+                    with provider_slot("llm", trace):
+                        for chunk in document_chain.stream(
+                            {
+                                "input": llm_question(user_question, follow_up),
+                                "context": context_docs,
+                            },
+                            config={"callbacks": [LLMTimingCallback(trace)]},
+                        ):
+                            chunks.append(chunk)
+                            yield chunk
+                    break
+                except Exception as e:
+                    # 첫 토큰을 받기 전에 429 로 거절된 경우에만 다시 시도
+                    if chunks or attempt == llm_max_retries or not is_rate_limit_error(e):
+                        raise
+                    trace.tokens["llm_retries"] = attempt + 1
+                    time.sleep(2**attempt)
+        except Exception as e:
+            trace.status = "error"
+            st.error(f"답변 생성 중 오류 발생: {e}")
+            yield f"오류가 발생했습니다: {e}"
+            return
+        finally:
+            recorder.finish(trace)
+
+        # 스트리밍이 끝난 뒤 완성된 답변을 캐시에 저장
+        store_cached_answer(
+            cache_key, {"output_text": "".join(chunks), "source_documents": source_info}
+        )
+
+    return {"response": None, "source_documents": source_info, "stream": token_stream()}
+
+
+def get_coalesce_key(user_question: str, follow_up: Optional[FollowUp] = None) -> str:
+    """동시에 들어온 같은 질문을 하나로 합칠 때 쓰는 키 (인덱스가 바뀌면 다른 질문으로 취급)
+
+    후속 질문은 직전 질문까지 같아야 같은 질문으로 본다.
+    """
+    index_version = get_index_version()
+    return f"{index_version}:{normalize_text(llm_question(user_question, follow_up))}"
+
+
+def _with_script_run_ctx(fn: Callable[[], ResponseDict]) -> Callable[[], ResponseDict]:
+    """작업 스레드에서도 현재 세션의 st.session_state, st.error 등을 쓸 수 있게 감싸는 함수"""
+    ctx = get_script_run_ctx()
+
+    def run() -> ResponseDict:
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn()
+
+    return run
+
+
+def show_queue_position(placeholder) -> Callable[[int], None]:
+    """대기 순번을 placeholder 에 표시하는 콜백"""
+
+    def on_wait(position: int):
+        placeholder.info(f"⏳ 요청이 많아 잠시 대기 중입니다. (대기 순번: {position}번)")
+
+    return on_wait
+
+
+def wait_for_ticket(ticket: ChatTicket, placeholder) -> ResponseDict:
+    """티켓의 답변을 기다리며 대기 순번을 표시하는 함수"""
+    service = get_chat_service()
+    on_wait = show_queue_position(placeholder)
+    while True:
+        try:
+            return ticket.result(timeout=0.25)
+        except concurrent.futures.TimeoutError:
+            queued = service.queue_position(ticket)
+            if queued is not None:
+                on_wait(queued[1])
+        except Exception as e:
+            return {"output_text": f"오류가 발생했습니다: {e}", "source_documents": []}
+
+
+def answer_with_service(
+    user_question: str, placeholder, follow_up: Optional[FollowUp] = None
+) -> ResponseDict:
+    """answer_question 을 서비스 계층의 작업 스레드에서 실행 (같은 질문은 한 번만 처리)"""
+    if not chat_service_enabled:
+        return answer_question(user_question, follow_up)
+    ticket = get_chat_service().submit(
+        user_question,
+        answer_question,
+        user_question,
+        follow_up,
+        key=get_coalesce_key(user_question, follow_up),
+        wrap=_with_script_run_ctx,
+    )
+    return wait_for_ticket(ticket, placeholder)
+
+
+def render_streaming_answer(
+    user_question: str, placeholder, follow_up: Optional[FollowUp] = None
+) -> Tuple[Optional[ResponseDict], bool]:
+    """검색 후 답변을 스트리밍으로 표시, (응답, 이미 화면에 표시했는지)를 반환"""
+    with st.spinner("관련 문서를 찾고 있습니다..."):
+        streaming_answer = stream_question(user_question, follow_up)
+    if streaming_answer["stream"] is None:
+        return streaming_answer["response"], False
+
+    # 답변 영역을 먼저 잡아두고, 참고 문서는 검색이 끝나는 즉시 표시
+    answer_container = st.container()
+    render_source_documents(streaming_answer["source_documents"])
+    with answer_container:
+        full_response = st.write_stream(streaming_answer["stream"])
+    placeholder.empty()
+    response: ResponseDict = {
+        "output_text": full_response,
+        "source_documents": streaming_answer["source_documents"],
+    }
+    return response, True
+
+
+def stream_with_service(
+    user_question: str, placeholder, follow_up: Optional[FollowUp] = None
+) -> Tuple[Optional[ResponseDict], bool]:
+    """같은 질문이 처리 중이면 그 답변을 기다리고, 아니면 직접 스트리밍하는 함수
+
+    스트리밍은 이 스크립트 스레드에서 하되, 한도 대기는 티켓에 기록해 같은 질문을
+    보낸 다른 세션이 결과를 함께 받을 수 있게 한다.
+    """
+    if not chat_service_enabled:
+        return render_streaming_answer(user_question, placeholder, follow_up)
+
+    service = get_chat_service()
+    ticket, created = service.join(get_coalesce_key(user_question, follow_up))
+    if not created:
+        with st.spinner("같은 질문의 답변을 생성하고 있습니다..."):
+            return wait_for_ticket(ticket, placeholder), False
+
+    try:
+        with service.bind(ticket, show_queue_position(placeholder)):
+            response, rendered = render_streaming_answer(
+                user_question, placeholder, follow_up
+            )
+    except BaseException as e:
+        service.resolve(ticket, error=e)
+        raise
+    service.resolve(ticket, response)
+    return response, rendered
+
+
+def remember_turn(
+    history: ChatHistory,
+    user_question: str,
+    follow_up: Optional[FollowUp] = None,
+):
+    """답변한 질문을 대화 기록에 남김 (임베딩은 검색할 때 캐시에 들어가 있어 API 호출이 없음)"""
+    vector = None
+    if os.path.exists(index_path):
+        try:
+            vector = get_embeddings().embed_query(user_question)
+        except Exception as e:
+            print(f"대화 기록 임베딩 실패: {e}")
+    history.add_turn(
+        user_question, extract_keywords(user_question), vector, follow_up, follow_up_weight
+    )
+
+
+def render_chat_messages(history: ChatHistory):
+    """최근 메시지만 표시하고, 더 오래된 메시지는 버튼을 눌렀을 때 쪽 단위로 더 보여줌"""
+    pages = st.session_state.get("history_pages", 1)
+    messages = history.page(pages * history_page_size)
+    hidden = len(history.messages) - len(messages)
+    if hidden > 0:
+        if st.button(f"이전 대화 더 보기 ({hidden}개)", key="more_history"):
+            st.session_state.history_pages = pages + 1
+            st.rerun()
+    elif history.dropped_messages:
+        st.caption(f"오래된 대화 {history.dropped_messages}개는 정리되었습니다.")
+
+    for message in messages:
+        with st.chat_message(message["role"]):
+            st.write(message["content"])
+
+
+def render_source_documents(source_documents: List[ContextDocument]):
+    """참고 문서를 파일별 expander로 표시하는 함수"""
+    if not source_documents:
+        return
+
+    st.markdown("---")
+    st.markdown("**📚 참고 문서:**")
+
+    # 소스 문서를 파일별로 그룹화 (파일 안에서는 페이지 순서로)
+    source_groups = {}
+    for doc in source_documents:
+        source = doc.get("source", "Unknown")
+        if source not in source_groups:
+            source_groups[source] = []
+        source_groups[source].append(doc)
+
+    # 각 파일별로 expander 생성, 제목에 인용한 페이지를 표시
+    for source, docs in source_groups.items():
+        docs = sorted(docs, key=lambda doc: doc.get("page") or 0)
+        pages = [
+            format_pages(doc.get("page"), doc.get("page_end"))
+            for doc in docs
+            if doc.get("page") is not None
+        ]
+        page_label = f"{', '.join(dict.fromkeys(pages))}, " if pages else ""
+        with st.expander(f"📄 {source} ({page_label}{len(docs)}개 섹션)"):
+            for i, doc in enumerate(docs, 1):
+                st.write(f"**섹션 {i}{format_citation(doc)}:**")
+                st.write(doc.get("content", ""))
+                if i < len(docs):
+                    st.write("---")
+
+
+def is_admin() -> bool:
+    """ADMIN_KEY 가 설정되어 있고 주소에 ?admin=<키> 가 붙어 있으면 관리자"""
+    return bool(admin_key) and st.query_params.get("admin") == admin_key
+
+
+def render_metrics_panel():
+    """최근 요청의 단계별 지연 시간을 보여주는 관리자 패널"""
+    ring_buffer = get_metrics_recorder().find_sink(RingBufferSink)
+    with st.expander("⏱️ 최근 요청 지연 시간 (관리자)"):
+        if rerank_enabled:
+            stage = get_rerank_stage()
+            stats = stage.stats()
+            st.write(
+                f"**재정렬:** {stage.reranker.name if stage.reranker else '사용 안 함'}, "
+                f"예산 {stats['budget_ms']:.0f}ms, 후보당 {stats['ms_per_candidate']}ms, "
+                f"예산 초과 {stats['over_budget']}/{stats['calls']}회, "
+                f"후보 축소 {stats['trimmed']}회"
+            )
+        if ring_buffer is None:
+            st.write("METRICS_SINKS 에 ring 이 없어 기록을 표시할 수 없습니다.")
+            return
+
+        records = ring_buffer.recent(limit=50)
+        if not records:
+            st.write("아직 기록된 요청이 없습니다.")
+            return
+
+        st.write("**단계별 백분위수 (ms)**")
+        st.dataframe(
+            [{"단계": stage, **values} for stage, values in ring_buffer.percentiles().items()],
+            hide_index=True,
+        )
+
+        st.write("**최근 요청**")
+        rows = []
+        for record in records:
+            rows.append(
+                {
+                    "시각": time.strftime("%H:%M:%S", time.localtime(record["started_at"])),
+                    "모드": record["mode"],
+                    "상태": record["status"],
+                    **{f"{stage}(ms)": value for stage, value in record["spans_ms"].items()},
+                    **record["tokens"],
+                    **{f"{flag} 적중": value for flag, value in record["flags"].items()},
+                }
+            )
+        st.dataframe(rows, hide_index=True)
+
+
+def render_service_panel():
+    """제공자별 실행/대기 요청 수와 합쳐진 질문 수를 보여주는 관리자 패널"""
+    if not chat_service_enabled:
+        return
+    stats = get_chat_service().stats()
+    with st.expander("🚦 요청 대기열 (관리자)"):
+        st.write(
+            f"- 처리 중인 질문: {stats['inflight']}개\n"
+            f"- 받은 질문: {stats['submitted']}개 (같은 질문 합침: {stats['coalesced']}개)"
+        )
+        st.dataframe(
+            [
+                {"제공자": name, "실행 중": stats[name]["active"], "대기": stats[name]["waiting"]}
+                for name in get_chat_service().limiters
+            ],
+            hide_index=True,
+        )
+
+
 def add_debug_sidebar():
     """디버그 모드 사이드바 추가"""
     with st.sidebar:
         st.header("📚 학습된 문서 목록")
-        st.markdown(
-            """
-            - 2024년 교육공무직원 노무관리 길라잡이 사례편
-            - 2024년 교육공무직원 노무관리 길라잡이 해설편
-            - 2025 경북형 늘봄학교 추진 계획(안내용)
-            - 2025 늘봄학교 운영길라잡이(개정판)-초등학교편
-            - 2025 늘봄학교 참여 학생 귀가 안전관리 강화 방안(안내용)
-            - 2025년 경상북도교육감 소속 교육공무직원(늘봄행정실무사) 채용 공고
-            - 2025년 교육공무직원 맞춤형복지제도 운영 계획
-            - 2025년 늘봄·방과후학교 자유수강권 지원 요령
-            - 2025년 늘봄학교 및 늘봄지원실장(임기제 교육연구사) 배치·운영 관련 Q&A
-            - 2025년 초중고 학생 교육비 지원 안내 지침
-            - 2025학년도 구미교육지원청 방과후학교(선택형 교육 프로그램) 운영 계획
-            - 경상북도교육비특별회계 목적사업비 관리 운용지침
-            - 늘봄지원실장(임기제 교육연구사) 급여 관련 처리 사항
-        """
-        )
+        # 변환기가 벡터DB와 함께 저장한 카탈로그에서 읽음 (벡터 로드/API 호출 없음)
+        catalog = load_index_catalog()
+        if catalog is None:
+            st.write("학습된 문서 목록을 불러올 수 없습니다.")
+        else:
+            st.markdown(
+                "\n".join(
+                    f"- {document_title(entry['source'])}" for entry in catalog["sources"]
+                )
+            )
+        if is_admin():
+            render_metrics_panel()
+            render_service_panel()
+            if answer_cache_enabled:
+                # 이 세션에서만 답변 캐시를 건너뜀 (프롬프트/검색 변경을 바로 확인할 때)
+                st.checkbox("답변 캐시 사용 안 함 (이 세션)", key="bypass_answer_cache")
+            if st.button("벡터DB 품질 체크", key="check_vector_db"):
+                check_vector_db_quality()
+
         # 디버그 모드 토글을 먼저 배치하여 문서 목록 표시 여부를 결정
         # debug_mode = st.checkbox("디버그 모드 활성화", key="debug_mode")
 
-        # if not debug_mode:
-        # st.header("📚 학습된 문서 목록")
-        # st.markdown(
-        #     """
-        #     - 2024년 교육공무직원 노무관리 길라잡이 사례편
-        #     - 2024년 교육공무직원 노무관리 길라잡이 해설편
-        #     - 2025 경북형 늘봄학교 추진 계획(안내용)
-        #     - 2025 늘봄학교 운영길라잡이(개정판)-초등학교편
-        #     - 2025 늘봄학교 참여 학생 귀가 안전관리 강화 방안(안내용)
-        #     - 2025년 경상북도교육감 소속 교육공무직원(늘봄행정실무사) 채용 공고
-        #     - 2025년 교육공무직원 맞춤형복지제도 운영 계획
-        #     - 2025년 늘봄·방과후학교 자유수강권 지원 요령
-        #     - 2025년 늘봄학교 및 늘봄지원실장(임기제 교육연구사) 배치·운영 관련 Q&A
-        #     - 2025년 초중고 학생 교육비 지원 안내 지침
-        #     - 2025학년도 구미교육지원청 방과후학교(선택형 교육 프로그램) 운영 계획
-        #     - 경상북도교육비특별회계 목적사업비 관리 운용지침
-        #     - 늘봄지원실장(임기제 교육연구사) 급여 관련 처리 사항
-        # """
-        # )
-
         # if debug_mode:
         #     st.write("---")
 
@@ -388,75 +1317,58 @@ def main():
         clear_chat_history()
         st.rerun()
 
-    # 채팅 메시지 초기화
-    if "messages" not in st.session_state.keys():
-        st.session_state.messages = [
-            {
-                "role": "assistant",
-                "content": "무엇을 도와드릴까요?",
-            }
-        ]
-
-    # 채팅 메시지 표시
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.write(message["content"])
+    # 채팅 메시지 표시 (최근 메시지만, 오래된 메시지는 쪽 단위로)
+    history = get_chat_history()
+    render_chat_messages(history)
 
     # 사용자 입력 처리
     if prompt := st.chat_input("여기에 질문을 입력하세요..."):
+        # 후속 질문이면 직전 질문과 이어서 검색/답변 (추가 API 호출 없음)
+        follow_up = history.resolve(prompt) if follow_up_enabled else None
+
         # 사용자 메시지 추가
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        history.add_message("user", prompt)
         with st.chat_message("user"):
             st.write(prompt)
 
         # 어시스턴트 응답 생성
         with st.chat_message("assistant"):
-            with st.spinner("답변을 생성하고 있습니다..."):
-                # 응답 생성
-                response_dict = user_input(prompt)
-
-                # 응답 표시
-                if response_dict and "output_text" in response_dict:
-                    full_response = response_dict["output_text"]
-                    st.markdown(full_response)
-
-                    # 참고 문서 표시
-                    if (
-                        response_dict.get("source_documents")
-                        and len(response_dict["source_documents"]) > 0
-                    ):
-
-                        st.markdown("---")
-                        st.markdown("**📚 참고 문서:**")
-
-                        # 소스 문서를 파일별로 그룹화
-                        source_groups = {}
-                        for doc in response_dict["source_documents"]:
-                            source = doc.get("source", "Unknown")
-                            if source not in source_groups:
-                                source_groups[source] = []
-                            source_groups[source].append(doc.get("content", ""))
-
-                        # 각 파일별로 expander 생성
-                        for source, contents in source_groups.items():
-                            with st.expander(f"📄 {source} ({len(contents)}개 섹션)"):
-                                for i, content in enumerate(contents, 1):
-                                    st.write(f"**섹션 {i}:**")
-                                    st.write(content)
-                                    if i < len(contents):
-                                        st.write("---")
-
-                    # 응답을 세션 상태에 저장
-                    st.session_state.messages.append(
-                        {"role": "assistant", "content": full_response}
+            # 요청이 몰려 제공자 한도를 기다리는 동안 대기 순번을 표시할 자리
+            queue_placeholder = st.empty()
+            if streaming_enabled:
+                response_dict, rendered = stream_with_service(
+                    prompt, queue_placeholder, follow_up
+                )
+                queue_placeholder.empty()
+                if rendered:
+                    # 완성된 답변을 세션 상태에 저장
+                    history.add_message("assistant", response_dict["output_text"])
+                    remember_turn(history, prompt, follow_up)
+                    return
+            else:
+                with st.spinner("답변을 생성하고 있습니다..."):
+                    # 응답 생성
+                    response_dict = answer_with_service(
+                        prompt, queue_placeholder, follow_up
                     )
+                queue_placeholder.empty()
 
-                else:
-                    error_message = "죄송합니다. 응답을 생성할 수 없습니다."
-                    st.error(error_message)
-                    st.session_state.messages.append(
-                        {"role": "assistant", "content": error_message}
-                    )
+            # 응답 표시
+            if response_dict and "output_text" in response_dict:
+                full_response = response_dict["output_text"]
+                st.markdown(full_response)
+
+                # 참고 문서 표시
+                render_source_documents(response_dict.get("source_documents", []))
+
+                # 응답을 세션 상태에 저장
+                history.add_message("assistant", full_response)
+                remember_turn(history, prompt, follow_up)
+
+            else:
+                error_message = "죄송합니다. 응답을 생성할 수 없습니다."
+                st.error(error_message)
+                history.add_message("assistant", error_message)
 
 
 if __name__ == "__main__":
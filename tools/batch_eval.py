@@ -0,0 +1,417 @@
+"""질문 목록(CSV/JSONL/TXT)을 챗봇과 같은 검색/생성 경로로 한꺼번에 처리하는 배치 평가 도구
+
+인덱스를 다시 만든 뒤 검색 품질 회귀와 처리량을 확인할 때 쓴다. 질문 변형은 모두
+모아 배치로 임베딩하고, FAISS 검색은 질문 묶음별로 여러 스레드에서 동시에 하며,
+LLM 답변은 동시 실행 수를 제한한 스레드 풀에서 만든다.
+
+    python tools/batch_eval.py questions.csv --output results.jsonl
+    python tools/batch_eval.py benchmarks/questions_ko.txt --offline --output results.csv
+
+입력 파일은 question 열(필수)과 id, expected_source 열(선택)을 갖는다. TXT 는 한 줄에
+질문 하나. expected_source 가 있으면 검색된 출처에 포함됐는지(적중)와 순위를 함께 기록한다.
+--offline 이면 API 없이 가짜 임베딩과 LLM 대역(rag.fakes)을 쓴다. 로컬 스텁 서버
+(tools/stub_servers.py)를 쓰려면 OPENAI_BASE_URL, GEMINI_API_ENDPOINT 를 지정하면 된다.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import csv
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import streamlit.logger  # noqa: E402
+
+from rag.metrics import RequestTrace  # noqa: E402
+from rag.retrieval import hybrid_search_many  # noqa: E402
+
+Question = Dict[str, str]
+
+
+def load_questions(path: str) -> List[Question]:
+    """CSV(question 열), JSONL({"question": ...}) 또는 한 줄에 하나씩 적은 TXT 를 읽음"""
+    with open(path, encoding="utf-8-sig") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        elif path.endswith((".jsonl", ".json")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = [{"question": line.strip()} for line in f if line.strip()]
+
+    questions: List[Question] = []
+    for i, row in enumerate(rows, 1):
+        question = (row.get("question") or "").strip()
+        if not question:
+            continue
+        questions.append(
+            {
+                "id": str(row.get("id") or i),
+                "question": question,
+                "expected_source": (row.get("expected_source") or "").strip(),
+            }
+        )
+    return questions
+
+
+def use_offline_models(app, llm_latency: float):
+    """챗봇 모듈이 가짜 임베딩(인덱스와 같은 차원)과 LLM 대역을 쓰게 함"""
+    import faiss
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+
+    from rag.embedding_cache import CachedEmbeddings
+    from rag.fakes import HashingEmbeddings, StubChatModel
+
+    dimensions = faiss.read_index(os.path.join(app.index_path, "index.faiss")).d
+    embeddings = CachedEmbeddings(
+        HashingEmbeddings(dimensions), model_name="offline", cache_path=None
+    )
+    chain = create_stuff_documents_chain(
+        StubChatModel(first_token_latency=llm_latency), app.get_rag_prompt()
+    )
+    app.get_embeddings = lambda: embeddings
+    app.get_conversational_chain = lambda *args, **kwargs: chain
+    app.query_rewrite_enabled = False
+    app.chat_service_enabled = False
+
+
+def embed_all(app, variants: List[List[str]], batch_size: int) -> List[List[List[float]]]:
+    """모든 질문의 변형을 batch_size 개씩 묶어 임베딩 (캐시에 있는 것은 건너뜀)"""
+    embeddings = app.get_embeddings()
+    flat = [variant for group in variants for variant in group]
+    vectors: List[List[float]] = []
+    for start in range(0, len(flat), batch_size):
+        batch = flat[start : start + batch_size]
+        if hasattr(embeddings, "embed_queries"):
+            vectors.extend(embeddings.embed_queries(batch))
+        else:
+            vectors.extend(embeddings.embed_documents(batch))
+
+    grouped, offset = [], 0
+    for group in variants:
+        grouped.append(vectors[offset : offset + len(group)])
+        offset += len(group)
+    return grouped
+
+
+def search_all(
+    app,
+    variants: List[List[str]],
+    vectors: List[List[List[float]]],
+    workers: int,
+) -> List[Tuple[list, float]]:
+    """질문을 workers 개 묶음으로 나눠 묶음마다 한 번의 배치 검색을 동시에 실행
+
+    질문별로 (변형들의 검색 결과를 모은 (문서, 점수) 목록, 묶음 검색 시간의 몫(ms))을 반환한다.
+    """
+    index = app.resolve_index()
+    db = app.load_vector_store(index)
+    sparse_index = app.load_sparse_index(index)
+    indices = list(range(len(variants)))
+    groups = [indices[i::workers] for i in range(workers) if indices[i::workers]]
+
+    def search_group(group: List[int]):
+        group_variants = [v for i in group for v in variants[i]]
+        group_vectors = [v for i in group for v in vectors[i]]
+        started = time.perf_counter()
+        results = hybrid_search_many(
+            db, sparse_index, group_variants, group_vectors, k=app.candidate_k()
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        per_question, offset = {}, 0
+        for i in group:
+            merged = []
+            for variant_results in results[offset : offset + len(variants[i])]:
+                merged.extend(variant_results)
+            offset += len(variants[i])
+            per_question[i] = (merged, elapsed_ms / len(group))
+        return per_question
+
+    collected: Dict[int, tuple] = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(groups)) as executor:
+        for per_question in executor.map(search_group, groups):
+            collected.update(per_question)
+    return [collected[i] for i in indices]
+
+
+def source_rank(sources: List[Dict[str, Any]], expected: str) -> Optional[int]:
+    """expected_source 가 검색된 출처 중 몇 번째인지 (파일 이름 일부만 적어도 됨), 없으면 None"""
+    for rank, source in enumerate(sources, 1):
+        if expected in source["source"]:
+            return rank
+    return None
+
+
+def run_batch(
+    app,
+    questions: List[Question],
+    embed_batch_size: int = 64,
+    search_workers: int = 4,
+    llm_workers: int = 4,
+    generate: bool = True,
+    threshold: Optional[float] = None,
+    verbose: bool = False,
+) -> List[Dict[str, Any]]:
+    """질문들을 임베딩 → 검색 → 재정렬/필터/정리 → 답변 생성 순으로 처리해 질문별 결과를 반환"""
+    if threshold is None:
+        threshold = app.relevance_threshold
+    recorder = app.get_metrics_recorder()
+    traces = [recorder.start(q["question"], mode="batch") for q in questions]
+
+    # 1. 모든 질문 변형을 배치로 임베딩 (시간은 변형 수에 비례해 질문별로 나눠 기록)
+    # QUERY_REWRITE=1 이면 변형을 만들 때 LLM 을 부르므로 변형 생성도 LLM 풀에서 동시에
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, llm_workers)) as executor:
+        variants = list(
+            executor.map(app.get_query_variants, [q["question"] for q in questions])
+        )
+    started = time.perf_counter()
+    vectors = embed_all(app, variants, embed_batch_size)
+    embed_ms = (time.perf_counter() - started) * 1000
+    total_variants = sum(len(group) for group in variants) or 1
+    for trace, group in zip(traces, variants):
+        trace.add_span("embed", embed_ms * len(group) / total_variants)
+
+    # 2. 질문 묶음별 배치 검색을 여러 스레드에서 동시에
+    searched = search_all(app, variants, vectors, max(1, search_workers))
+
+    # 3. 중복 제거와 재정렬, 관련성 판단(analyze_search_results), 컨텍스트 정리
+    records: List[Dict[str, Any]] = []
+    contexts: List[Optional[list]] = []
+    for i, (question, trace) in enumerate(zip(questions, traces)):
+        search_results, search_ms = searched[i]
+        trace.add_span("search", search_ms)
+        similar_docs = app.rank_search_results(question["question"], search_results, trace)
+        with trace.span("filter"):
+            # analyze_search_results 는 질문마다 문서별 분석을 출력하므로 평소에는 숨김
+            output = (
+                contextlib.nullcontext()
+                if verbose
+                else contextlib.redirect_stdout(io.StringIO())
+            )
+            with output:
+                relevant_docs = app.analyze_search_results(
+                    question["question"], similar_docs, threshold
+                )
+        context_docs = None
+        if relevant_docs:
+            with trace.span("pack"):
+                context_docs = app.select_context_docs(relevant_docs, trace)
+
+        sources = [
+            {
+                "source": doc.metadata.get("source", ""),
+                "page": doc.metadata.get("page"),
+                "page_end": doc.metadata.get("page_end"),
+                "section": doc.metadata.get("section", ""),
+                "score": round(float(score), 4),
+                "relevant": any(doc is relevant for relevant, _ in relevant_docs),
+            }
+            for doc, score in similar_docs
+        ]
+        record: Dict[str, Any] = {
+            "id": question["id"],
+            "question": question["question"],
+            "variants": variants[i],
+            "sources": sources,
+            "relevant_count": len(relevant_docs),
+        }
+        if question["expected_source"]:
+            rank = source_rank(sources, question["expected_source"])
+            record.update(
+                expected_source=question["expected_source"], hit=rank is not None, rank=rank
+            )
+        if context_docs is None:
+            trace.status = "no_context"
+            record["answer"] = app.no_context_response(question["question"])["output_text"]
+        records.append(record)
+        contexts.append(context_docs)
+
+    # 4. 답변 생성은 동시 실행 수를 제한한 스레드 풀에서
+    def answer(i: int):
+        response = app.generate_answer(questions[i]["question"], contexts[i], traces[i])
+        records[i]["answer"] = response["output_text"]
+        records[i]["cited"] = [
+            {"source": doc["source"], "page": doc["page"], "section": doc["section"]}
+            for doc in response["source_documents"]
+        ]
+
+    pending = [i for i, context in enumerate(contexts) if context is not None]
+    if generate and pending:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, llm_workers)
+        ) as executor:
+            list(executor.map(answer, pending))
+
+    for record, trace in zip(records, traces):
+        record["status"] = trace.status
+        record["tokens"] = dict(trace.tokens)
+        # 다른 질문의 단계를 기다린 시간은 빼고 이 질문의 단계별 시간만 합산
+        # (llm_ttft 는 llm_total 에 포함되므로 제외, 제공자 한도 대기 queue_* 는 포함)
+        record["latency_ms"] = {
+            name: round(value, 3) for name, value in trace.spans.items()
+        }
+        record["latency_ms"]["total"] = round(
+            sum(v for k, v in trace.spans.items() if k != "llm_ttft"), 3
+        )
+        recorder.finish(trace)
+    return records
+
+
+def summarize(records: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    """처리량, 단계별 지연 백분위수, 검색 적중률 요약"""
+    stages: Dict[str, List[float]] = {}
+    for record in records:
+        for stage, value in record["latency_ms"].items():
+            stages.setdefault(stage, []).append(value)
+    summary: Dict[str, Any] = {
+        "questions": len(records),
+        "wall_seconds": round(wall_seconds, 3),
+        "questions_per_second": (
+            round(len(records) / wall_seconds, 2) if wall_seconds else 0
+        ),
+        "status": {},
+        "latency_ms": {
+            stage: {
+                "p50": round(float(np.percentile(values, 50)), 1),
+                "p95": round(float(np.percentile(values, 95)), 1),
+            }
+            for stage, values in stages.items()
+        },
+        "mean_relevant_docs": round(
+            sum(r["relevant_count"] for r in records) / max(len(records), 1), 2
+        ),
+    }
+    for record in records:
+        status = record["status"]
+        summary["status"][status] = summary["status"].get(status, 0) + 1
+    judged = [r for r in records if "hit" in r]
+    if judged:
+        summary["hit_rate"] = round(sum(r["hit"] for r in judged) / len(judged), 3)
+        summary["mrr"] = round(
+            sum(1 / r["rank"] for r in judged if r["rank"]) / len(judged), 3
+        )
+    return summary
+
+
+def write_records(path: str, records: List[Dict[str, Any]]):
+    """.csv 면 한 줄 요약 표, 그 밖에는 질문마다 JSON 한 줄"""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if not path.endswith(".csv"):
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            return
+
+        writer = csv.writer(f)
+        writer.writerow(
+            [
+                "id",
+                "question",
+                "status",
+                "answer",
+                "sources",
+                "scores",
+                "relevant_count",
+                "hit",
+                "rank",
+                "latency_ms",
+            ]
+        )
+        for record in records:
+            writer.writerow(
+                [
+                    record["id"],
+                    record["question"],
+                    record["status"],
+                    record.get("answer", ""),
+                    "; ".join(
+                        f"{s['source']}" + (f" p.{s['page']}" if s["page"] else "")
+                        for s in record["sources"]
+                    ),
+                    " ".join(f"{s['score']:.3f}" for s in record["sources"]),
+                    record["relevant_count"],
+                    record.get("hit", ""),
+                    record.get("rank") or "",
+                    record["latency_ms"]["total"],
+                ]
+            )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="질문 목록 배치 평가")
+    parser.add_argument("questions", help="질문 파일 (.csv, .jsonl, .txt)")
+    parser.add_argument(
+        "--output", default="batch_eval_results.jsonl", help=".jsonl 또는 .csv"
+    )
+    parser.add_argument("--summary", help="요약을 저장할 JSON 경로")
+    parser.add_argument("--index-path", default="faiss_index")
+    parser.add_argument(
+        "--offline", action="store_true", help="가짜 임베딩과 LLM 대역 사용"
+    )
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.2, help="--offline LLM 지연 (초)"
+    )
+    parser.add_argument("--embed-batch-size", type=int, default=64)
+    parser.add_argument("--search-workers", type=int, default=4)
+    parser.add_argument("--llm-workers", type=int, default=4)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help="analyze_search_results 관련도 기준 (기본: 챗봇의 relevance_threshold)",
+    )
+    parser.add_argument(
+        "--no-generate", action="store_true", help="검색만 평가하고 답변은 생성하지 않음"
+    )
+    parser.add_argument("--verbose", action="store_true", help="질문별 검색 분석 출력")
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.questions)
+    if not questions:
+        print("질문이 없습니다.", file=sys.stderr)
+        return 2
+    if not os.path.exists(os.path.join(args.index_path, "index.faiss")):
+        print(f"벡터DB가 없습니다: {args.index_path}", file=sys.stderr)
+        return 2
+
+    import streamlit_app as app
+
+    # 화면 없이 실행하므로 세션 상태/컨텍스트 경고는 숨김
+    streamlit.logger.set_log_level("error")
+    app.index_path = args.index_path
+    app.answer_cache_enabled = False
+    if args.offline:
+        use_offline_models(app, args.llm_latency)
+
+    print(f"질문 {len(questions)}개 평가 (인덱스 버전: {app.get_index_version()})")
+    started = time.perf_counter()
+    records = run_batch(
+        app,
+        questions,
+        embed_batch_size=args.embed_batch_size,
+        search_workers=args.search_workers,
+        llm_workers=args.llm_workers,
+        generate=not args.no_generate,
+        threshold=args.threshold,
+        verbose=args.verbose,
+    )
+    summary = summarize(records, time.perf_counter() - started)
+    summary["index_version"] = app.get_index_version()
+
+    write_records(args.output, records)
+    print(json.dumps(summary, ensure_ascii=False, indent=1))
+    print(f"결과 저장: {args.output}")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=1)
+    return 1 if summary["status"].get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
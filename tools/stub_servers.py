@@ -0,0 +1,240 @@
+"""로컬 테스트용 OpenAI 호환 임베딩 + Gemini REST 스텁 서버
+
+변환기의 동시 임베딩/재시도 동작과 챗봇의 동시 실행 제한을 실제 API 없이 확인할 때 사용한다.
+
+    python tools/stub_servers.py --port 8765 --rate-limit-every 5 --llm-latency 1.0
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub \\
+        streamlit run converter/pdf_converter_app.py
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub \\
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8765 GOOGLE_API_KEY=stub \\
+        streamlit run streamlit_app.py
+
+GET /stats 로 요청 수와 최대 동시 요청 수를 확인할 수 있다.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag.fakes import hash_embedding
+
+
+STUB_ANSWER = "제공된 문서를 바탕으로 답변드립니다. 자세한 내용은 참고 문서를 확인하세요."
+
+
+class StubState:
+    def __init__(
+        self,
+        dimensions: int,
+        rate_limit_every: int,
+        latency: float,
+        llm_latency: float = 0.5,
+        llm_rate_limit_every: int = 0,
+    ):
+        self.dimensions = dimensions
+        self.rate_limit_every = rate_limit_every
+        self.latency = latency
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.llm_latency = llm_latency
+        self.llm_rate_limit_every = llm_rate_limit_every
+        self.llm_requests = 0
+        self.llm_in_flight = 0
+        self.llm_max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                with state.lock:
+                    self._send_json(
+                        200,
+                        {
+                            "requests": state.requests,
+                            "max_in_flight": state.max_in_flight,
+                            "llm_requests": state.llm_requests,
+                            "llm_max_in_flight": state.llm_max_in_flight,
+                        },
+                    )
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            path = self.path.split("?")[0].rstrip("/")
+            if path.endswith(":generateContent") or path.endswith(":streamGenerateContent"):
+                self._handle_gemini(payload, stream=path.endswith(":streamGenerateContent"))
+                return
+            if not path.endswith("/embeddings"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+
+            with state.lock:
+                state.requests += 1
+                number = state.requests
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            try:
+                if state.rate_limit_every and number % state.rate_limit_every == 0:
+                    self._send_json(
+                        429,
+                        {"error": {"message": "Rate limit reached", "type": "requests"}},
+                        {"Retry-After": "0.2"},
+                    )
+                    return
+
+                time.sleep(state.latency)
+                inputs = payload.get("input", [])
+                if isinstance(inputs, str):
+                    inputs = [inputs]
+                dimensions = payload.get("dimensions") or state.dimensions
+                data = [
+                    {
+                        "object": "embedding",
+                        "index": i,
+                        "embedding": hash_embedding(str(text), dimensions).tolist(),
+                    }
+                    for i, text in enumerate(inputs)
+                ]
+                self._send_json(
+                    200,
+                    {
+                        "object": "list",
+                        "data": data,
+                        "model": payload.get("model", "stub"),
+                        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                    },
+                )
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+        def _handle_gemini(self, payload, stream: bool):
+            """Gemini REST generateContent / streamGenerateContent 흉내"""
+            with state.lock:
+                state.llm_requests += 1
+                number = state.llm_requests
+                state.llm_in_flight += 1
+                state.llm_max_in_flight = max(state.llm_max_in_flight, state.llm_in_flight)
+            try:
+                if state.llm_rate_limit_every and number % state.llm_rate_limit_every == 0:
+                    self._send_json(
+                        429,
+                        {
+                            "error": {
+                                "code": 429,
+                                "message": "Resource has been exhausted (e.g. check quota).",
+                                "status": "RESOURCE_EXHAUSTED",
+                            }
+                        },
+                    )
+                    return
+
+                prompt_chars = sum(
+                    len(part.get("text", ""))
+                    for content in payload.get("contents", [])
+                    for part in content.get("parts", [])
+                )
+                usage = {
+                    "promptTokenCount": prompt_chars,
+                    "candidatesTokenCount": len(STUB_ANSWER),
+                    "totalTokenCount": prompt_chars + len(STUB_ANSWER),
+                }
+                words = STUB_ANSWER.split(" ")
+                pieces = [word + " " for word in words[:-1]] + [words[-1]] if stream else [STUB_ANSWER]
+                responses = [
+                    {
+                        "candidates": [
+                            {
+                                "content": {"parts": [{"text": piece}], "role": "model"},
+                                "finishReason": "STOP" if i == len(pieces) - 1 else None,
+                                "index": 0,
+                            }
+                        ],
+                        **({"usageMetadata": usage} if i == len(pieces) - 1 else {}),
+                    }
+                    for i, piece in enumerate(pieces)
+                ]
+
+                if not stream:
+                    time.sleep(state.llm_latency)
+                    self._send_json(200, responses[0])
+                    return
+
+                # 스트리밍 응답은 JSON 배열을 조각조각 보냄 (HTTP/1.0 이라 연결 종료가 끝)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+
+                def send_piece(text: str):
+                    self.wfile.write(text.encode("utf-8"))
+                    self.wfile.flush()
+
+                time.sleep(state.llm_latency / 2)
+                for i, response in enumerate(responses):
+                    send_piece(("[" if i == 0 else ",") + json.dumps(response, ensure_ascii=False))
+                    time.sleep(state.llm_latency / 2 / len(responses))
+                send_piece("]")
+            finally:
+                with state.lock:
+                    state.llm_in_flight -= 1
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="로컬 임베딩 스텁 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument(
+        "--rate-limit-every", type=int, default=0, help="N번째 요청마다 429 응답"
+    )
+    parser.add_argument("--latency", type=float, default=0.05, help="요청당 지연(초)")
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.5, help="Gemini 응답 하나의 지연(초)"
+    )
+    parser.add_argument(
+        "--llm-rate-limit-every", type=int, default=0, help="Gemini N번째 요청마다 429 응답"
+    )
+    args = parser.parse_args()
+
+    state = StubState(
+        args.dimensions,
+        args.rate_limit_every,
+        args.latency,
+        args.llm_latency,
+        args.llm_rate_limit_every,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"스텁 서버 실행 중: http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()